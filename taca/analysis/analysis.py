@@ -1,25 +1,39 @@
 """Analysis methods for TACA."""
 
+import contextlib
 import glob
+import hashlib
+import json
 import logging
 import os
+import shlex
 import subprocess
 import sys
+import tempfile
 import time
-from shutil import copyfile, copytree
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, as_completed
 
 from flowcell_parser.classes import RunParametersParser
 
+from taca.illumina import demux_plan
 from taca.illumina.MiSeq_Runs import MiSeq_Run
 from taca.illumina.NextSeq_Runs import NextSeq_Run
 from taca.illumina.NovaSeq_Runs import NovaSeq_Run
 from taca.illumina.NovaSeqXPlus_Runs import NovaSeqXPlus_Run
-from taca.utils import misc, statusdb
+from taca.log import init_logger_file
+from taca.utils import filesystem, misc, statusdb
 from taca.utils.config import CONFIG
+from taca.utils.metadata_cache import file_fingerprint, get_run_metadata_cache
 from taca.utils.transfer import RsyncAgent
 
 logger = logging.getLogger(__name__)
 
+# Folder of the locks of the runs being processed, unless set with run_lock_dir
+RUN_LOCK_DIR = os.path.join(tempfile.gettempdir(), "taca_run_locks")
+# Name of the fingerprint of the sources and the hash of the last document
+# uploaded to statusdb in the metadata cache
+STATUSDB_UPLOAD_CACHE = "statusdb_upload"
+
 
 def get_runObj(
     run: os.PathLike, software: str
@@ -40,7 +54,12 @@ def get_runObj(
 
     run_parameters_path = os.path.join(run, run_parameters_file)
     try:
-        run_parameters = RunParametersParser(run_parameters_path)
+        run_parameters = get_run_metadata_cache().get(
+            os.path.basename(os.path.normpath(run)),
+            "RunParametersParser",
+            [run_parameters_path],
+            lambda: RunParametersParser(run_parameters_path),
+        )
     except OSError:
         logger.warning(
             f"Problems parsing the runParameters.xml file at {run_parameters_path}. "
@@ -90,28 +109,40 @@ def get_runObj(
     return None
 
 
-def upload_to_statusdb(run_dir, software):
+def upload_to_statusdb(run_dir, software, force=False):
     """Function to upload run_dir informations to statusDB directly from click interface.
 
     :param run_dir: run name identifier
     :type run: string
+    :param bool force: Upload the run even if it is unchanged since the last upload
     :rtype: None
     """
     runObj = get_runObj(run_dir, software)
     if runObj:
         # runObj can be None
         # Make the actual upload
-        _upload_to_statusdb(runObj)
+        _upload_to_statusdb(runObj, force=force)
 
 
-def _upload_to_statusdb(run):
+def _upload_to_statusdb(run, force=False):
     """Triggers the upload to statusdb.
 
+    A fingerprint of the files the document is built from and a hash of the
+    uploaded document are kept in the run metadata cache. The upload is skipped
+    without parsing the run if the files are unchanged since the last upload of
+    the run, and without connecting to statusdb if the document is unchanged.
+
     :param Run run: the object run
+    :param bool force: Upload the run even if it is unchanged since the last upload
     """
     couch_conf = CONFIG["statusdb"]
-    couch_connection = statusdb.StatusdbSession(couch_conf)
     dbname = couch_conf["xten_db"]
+    metadata_cache = get_run_metadata_cache()
+    sources = file_fingerprint(run.get_statusdb_sources())
+    last_upload = metadata_cache.read(run.id, STATUSDB_UPLOAD_CACHE)
+    if not force and last_upload and last_upload[0] == sources:
+        logger.info(f"Run {run.id} is unchanged since its last upload to statusdb")
+        return
     parser = run.runParserObj
     # Check if I have NoIndex lanes
     for element in parser.obj["samplesheet_csv"]:
@@ -156,6 +187,20 @@ def _upload_to_statusdb(run):
         parser.obj["DemultiplexConfig"] = {
             "Setup": {"Software": run.CONFIG.get("bcl2fastq", {})}
         }
+    # Attach the per lane InterOp metrics, to follow runs while they are sequencing
+    try:
+        parser.obj["interop_summary"] = run.get_interop_summary()
+    except Exception as e:
+        logger.warning(f"Could not summarize the InterOp metrics of run {run.id}: {e}")
+    # Skip the upload if the document is unchanged since the last upload
+    doc_hash = hashlib.sha1(
+        json.dumps(parser.obj, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    if not force and last_upload and last_upload[1] == doc_hash:
+        logger.info(f"Run {run.id} is unchanged since its last upload to statusdb")
+        metadata_cache.write(run.id, STATUSDB_UPLOAD_CACHE, sources, doc_hash)
+        return
+    couch_connection = statusdb.StatusdbSession(couch_conf)
     # Keep PDC archive date if there is one already
     run_vals = parser.obj["name"].split("_")
     if len(run_vals[0]) == 8:
@@ -177,6 +222,7 @@ def _upload_to_statusdb(run):
             parser.obj["pdc_archived"] = doc.get("pdc_archived")
 
     couch_connection.update_doc(dbname, parser.obj, over_write_db_entry=True)
+    metadata_cache.write(run.id, STATUSDB_UPLOAD_CACHE, sources, doc_hash)
 
 
 def transfer_run(run_dir, software):
@@ -254,68 +300,76 @@ def transfer_runfolder(run_dir, pid, exclude_lane):
                     ["--exclude", f"Data/Intensities/BaseCalls/L00{lane}"]
                 )
 
+    exclude_options_for_tar = [
+        "--exclude",
+        "Demultiplexing*",
+        "--exclude",
+        "demux_*",
+        "--exclude",
+        "rsync*",
+        "--exclude",
+        "*.csv",
+    ]
+    if exclude_lane != "":
+        exclude_options_for_tar += dir_for_excluding_lane
+    tar_command = (
+        ["tar"] + exclude_options_for_tar + ["-cf", "-", "-C", run_dir_path, dir_name]
+    )
+
+    destination = CONFIG["analysis"]["deliver_runfolder"].get("destination")
+    connection_details = CONFIG["analysis"]["deliver_runfolder"].get("analysis_server")
+    # Stream the archive straight to the analysis cluster instead of writing it locally
+    stream_archive = CONFIG["analysis"]["deliver_runfolder"].get(
+        "stream_archive", False
+    )
+
+    # The archive is checksummed while it is created, so that it is never re-read
     try:
-        exclude_options_for_tar = [
-            "--exclude",
-            "Demultiplexing*",
-            "--exclude",
-            "demux_*",
-            "--exclude",
-            "rsync*",
-            "--exclude",
-            "*.csv",
-        ]
-        if exclude_lane != "":
-            exclude_options_for_tar += dir_for_excluding_lane
-
-        subprocess.call(
-            ["tar"]
-            + exclude_options_for_tar
-            + ["-cvf", archive, "-C", run_dir_path, dir_name]
-        )
-    except subprocess.CalledProcessError as e:
+        if stream_archive:
+            remote_archive = os.path.join(destination, os.path.basename(archive))
+            ssh_command = [
+                "ssh",
+                f"{connection_details['user']}@{connection_details['host']}",
+                f"umask 002 && cat > {shlex.quote(remote_archive)}",
+            ]
+            with subprocess.Popen(ssh_command, stdin=subprocess.PIPE) as ssh:
+                md5sum = misc.hash_command_output(tar_command, ssh.stdin)
+                ssh.stdin.close()
+            if ssh.returncode:
+                raise subprocess.CalledProcessError(ssh.returncode, ssh_command)
+        else:
+            with open(archive, "wb") as fh:
+                md5sum = misc.hash_command_output(tar_command, fh)
+    except (subprocess.CalledProcessError, OSError) as e:
+        # e.g. tar failing, the connection to the analysis server lost or a full disk
         logger.error("Error creating tar archive")
+        if not stream_archive and os.path.exists(archive):
+            os.remove(archive)
         raise e
 
-    # Generate the md5sum under the same folder as run_dir
+    # Write the md5sum under the same folder as run_dir, in the format of md5sum
     md5file = archive + ".md5"
-    try:
-        f = open(md5file, "w")
-        os.chdir(run_dir_path)
-        subprocess.call(["md5sum", os.path.basename(archive)], stdout=f)
-        f.close()
-    except subprocess.CalledProcessError as e:
-        logger.error("Error creating md5 file")
-        raise e
+    with open(md5file, "w") as f:
+        f.write(f"{md5sum}  {os.path.basename(archive)}\n")
 
     # Rsync the files to the analysis cluster
-    destination = CONFIG["analysis"]["deliver_runfolder"].get("destination")
     rsync_opts = {"-LtDrv": None, "--chmod": "g+rw"}
-    connection_details = CONFIG["analysis"]["deliver_runfolder"].get("analysis_server")
-    archive_transfer = RsyncAgent(
-        archive,
-        dest_path=destination,
-        remote_host=connection_details["host"],
-        remote_user=connection_details["user"],
-        validate=False,
-        opts=rsync_opts,
-    )
-    md5_transfer = RsyncAgent(
-        md5file,
-        dest_path=destination,
-        remote_host=connection_details["host"],
-        remote_user=connection_details["user"],
-        validate=False,
-        opts=rsync_opts,
-    )
-
-    archive_transfer.transfer()
-    md5_transfer.transfer()
+    transfers = [] if stream_archive else [archive]
+    for file_to_transfer in transfers + [md5file]:
+        RsyncAgent(
+            file_to_transfer,
+            dest_path=destination,
+            remote_host=connection_details["host"],
+            remote_user=connection_details["user"],
+            validate=False,
+            opts=rsync_opts,
+        ).transfer()
 
     # clean up the generated files
     try:
         os.remove(new_sample_sheet)
-        os.remove(archive)
+        if not stream_archive:
+            os.remove(archive)
         os.remove(md5file)
     except OSError as e:
         logger.error("Was not able to delete all temporary files")
@@ -338,124 +392,112 @@ def extract_project_samplesheet(sample_sheet, pid_list):
     return new_samplesheet_content
 
 
-def run_preprocessing(run, software):
-    """Run demultiplexing in all data directories.
+def _process(run):
+    """Process a run/flowcell and transfer to analysis server.
 
-    :param str run: Process a particular run instead of looking for runs
+    :param taca.illumina.Run run: Run to be processed and transferred
     """
-
-    def _process(run):
-        """Process a run/flowcell and transfer to analysis server.
-
-        :param taca.illumina.Run run: Run to be processed and transferred
-        """
-        logger.info(f"Checking run {run.id}")
-        transfer_file = os.path.join(CONFIG["analysis"]["status_dir"], "transfer.tsv")
-        if run.is_transferred(
-            transfer_file
-        ):  # Transfer is ongoing or finished. Do nothing. Sometimes caused by runs that are copied back from NAS after a reboot
-            logger.info(
-                f"Run {run.id} already transferred to analysis server, skipping it"
+    logger.info(f"Checking run {run.id}")
+    transfer_file = os.path.join(CONFIG["analysis"]["status_dir"], "transfer.tsv")
+    if run.is_transferred(
+        transfer_file
+    ):  # Transfer is ongoing or finished. Do nothing. Sometimes caused by runs that are copied back from NAS after a reboot
+        logger.info(f"Run {run.id} already transferred to analysis server, skipping it")
+        return
+
+    if run.get_run_status() == "SEQUENCING":
+        logger.info(f"Run {run.id} is not finished yet")
+        if "statusdb" in CONFIG:
+            _upload_to_statusdb(run)
+    elif run.get_run_status() == "TO_START":
+        if run.get_run_type() == "NON-NGI-RUN":
+            # For now MiSeq specific case. Process only NGI-run, skip all the others (PhD student runs)
+            logger.warning(
+                f"Run {run.id} marked as {run.get_run_type()}, "
+                "TACA will skip this and move the run to "
+                "no-sync directory"
             )
+            if "storage" in CONFIG:
+                run.archive_run(CONFIG["storage"]["archive_dirs"][run.sequencer_type])
             return
-
-        if run.get_run_status() == "SEQUENCING":
-            logger.info(f"Run {run.id} is not finished yet")
-            if "statusdb" in CONFIG:
-                _upload_to_statusdb(run)
-        elif run.get_run_status() == "TO_START":
-            if run.get_run_type() == "NON-NGI-RUN":
-                # For now MiSeq specific case. Process only NGI-run, skip all the others (PhD student runs)
-                logger.warning(
-                    f"Run {run.id} marked as {run.get_run_type()}, "
-                    "TACA will skip this and move the run to "
-                    "no-sync directory"
-                )
-                if "storage" in CONFIG:
-                    run.archive_run(
-                        CONFIG["storage"]["archive_dirs"][run.sequencer_type]
-                    )
-                return
-            logger.info(
-                f"Starting BCL to FASTQ conversion and demultiplexing for run {run.id}"
-            )
-            if "statusdb" in CONFIG:
-                _upload_to_statusdb(run)
-            run.demultiplex_run()
-        elif run.get_run_status() == "IN_PROGRESS":
-            logger.info(
-                "BCL conversion and demultiplexing process in "
-                f"progress for run {run.id}, skipping it"
-            )
-            # Upload to statusDB if applies
-            if "statusdb" in CONFIG:
-                _upload_to_statusdb(run)
-            # This function checks if demux is done
-            run.check_run_status()
-
-        # Previous elif might change the status to COMPLETED, therefore to avoid skipping
-        # a cycle take the last if out of the elif
-        if run.get_run_status() == "COMPLETED":
-            run.check_run_status()
-            logger.info(f"Preprocessing of run {run.id} is finished, transferring it")
-            # Upload to statusDB if applies
-            if "statusdb" in CONFIG:
-                _upload_to_statusdb(run)
-                demux_summary_message = []
-                for demux_id, demux_log in run.demux_summary.items():
-                    if demux_log["errors"] or demux_log["warnings"]:
-                        demux_summary_message.append(
-                            "Sub-Demultiplexing in Demultiplexing_{} completed with {} errors and {} warnings:".format(
-                                demux_id, demux_log["errors"], demux_log["warnings"]
-                            )
+        logger.info(
+            f"Starting BCL to FASTQ conversion and demultiplexing for run {run.id}"
+        )
+        if "statusdb" in CONFIG:
+            _upload_to_statusdb(run)
+        run.demultiplex_run()
+    elif run.get_run_status() == "IN_PROGRESS":
+        logger.info(
+            "BCL conversion and demultiplexing process in "
+            f"progress for run {run.id}, skipping it"
+        )
+        # Upload to statusDB if applies
+        if "statusdb" in CONFIG:
+            _upload_to_statusdb(run)
+        # This function checks if demux is done
+        run.check_run_status()
+
+    # Previous elif might change the status to COMPLETED, therefore to avoid skipping
+    # a cycle take the last if out of the elif
+    if run.get_run_status() == "COMPLETED":
+        run.check_run_status()
+        logger.info(f"Preprocessing of run {run.id} is finished, transferring it")
+        # Upload to statusDB if applies
+        if "statusdb" in CONFIG:
+            _upload_to_statusdb(run)
+            demux_summary_message = []
+            for demux_id, demux_log in run.demux_summary.items():
+                if demux_log["errors"] or demux_log["warnings"]:
+                    demux_summary_message.append(
+                        "Sub-Demultiplexing in Demultiplexing_{} completed with {} errors and {} warnings:".format(
+                            demux_id, demux_log["errors"], demux_log["warnings"]
                         )
+                    )
+                    demux_summary_message.append(
+                        "\n".join(demux_log["error_and_warning_messages"][:5])
+                    )
+                    if len(demux_log["error_and_warning_messages"]) > 5:
                         demux_summary_message.append(
-                            "\n".join(demux_log["error_and_warning_messages"][:5])
+                            f"...... Only the first 5 errors or warnings are displayed for Demultiplexing_{demux_id}."
                         )
-                        if len(demux_log["error_and_warning_messages"]) > 5:
-                            demux_summary_message.append(
-                                f"...... Only the first 5 errors or warnings are displayed for Demultiplexing_{demux_id}."
-                            )
-                # Notify with a mail run completion and stats uploaded
-                if demux_summary_message:
-                    sbt = f"{run.id} Demultiplexing Completed with ERRORs or WARNINGS!"
-                    msg = """The run {run} has been demultiplexed with errors or warnings!
+            # Notify with a mail run completion and stats uploaded
+            if demux_summary_message:
+                sbt = f"{run.id} Demultiplexing Completed with ERRORs or WARNINGS!"
+                msg = """The run {run} has been demultiplexed with errors or warnings!
 
-                    {errors_warnings}
+                {errors_warnings}
 
-                    The Run will be transferred to the analysis cluster for further analysis.
+                The Run will be transferred to the analysis cluster for further analysis.
 
-                    The run is available at : https://genomics-status.scilifelab.se/flowcells/{run}
+                The run is available at : https://genomics-status.scilifelab.se/flowcells/{run}
 
-                    """.format(
-                        errors_warnings="\n".join(demux_summary_message), run=run.id
-                    )
-                else:
-                    sbt = f"{run.id} Demultiplexing Completed!"
-                    msg = f"""The run {run.id} has been demultiplexed without any error or warning.
+                """.format(errors_warnings="\n".join(demux_summary_message), run=run.id)
+            else:
+                sbt = f"{run.id} Demultiplexing Completed!"
+                msg = f"""The run {run.id} has been demultiplexed without any error or warning.
 
-                    The Run will be transferred to the analysis cluster for further analysis.
+                The Run will be transferred to the analysis cluster for further analysis.
 
-                    The run is available at : https://genomics-status.scilifelab.se/flowcells/{run.id}
+                The run is available at : https://genomics-status.scilifelab.se/flowcells/{run.id}
 
-                    """
-                run.send_mail(sbt, msg, rcp=CONFIG["mail"]["recipients"])
+                """
+            run.send_mail(sbt, msg, rcp=CONFIG["mail"]["recipients"])
 
-            # Copy demultiplex stats file, InterOp meta data and run xml files to shared file system for LIMS purpose
-            if "shared_filesystem_path" in CONFIG["analysis"]:
-                try:
-                    shared_filesystem_dest = os.path.join(
-                        CONFIG["analysis"]["shared_filesystem_path"][
-                            run.sequencer_type.lower()
-                        ],
-                        run.id,
-                    )
-                    logger.info(
-                        f"Copying demultiplex stats, InterOp metadata and XML files for run {run.id} to {shared_filesystem_dest}"
-                    )
-                    if not os.path.exists(shared_filesystem_dest):
-                        os.mkdir(shared_filesystem_dest)
-                    demulti_stat_src = os.path.join(
+        # Copy demultiplex stats file, InterOp meta data and run xml files to shared file system for LIMS purpose
+        if "shared_filesystem_path" in CONFIG["analysis"]:
+            try:
+                shared_filesystem_dest = os.path.join(
+                    CONFIG["analysis"]["shared_filesystem_path"][
+                        run.sequencer_type.lower()
+                    ],
+                    run.id,
+                )
+                logger.info(
+                    f"Copying demultiplex stats, InterOp metadata and XML files for run {run.id} to {shared_filesystem_dest}"
+                )
+                # Only the files changed since the previous copy are copied
+                to_sync = {
+                    "laneBarcode.html": os.path.join(
                         run.run_dir,
                         run.demux_dir,
                         "Reports",
@@ -466,114 +508,200 @@ def run_preprocessing(run, software):
                         "all",
                         "laneBarcode.html",
                     )
-                    copyfile(
-                        demulti_stat_src,
-                        os.path.join(shared_filesystem_dest, "laneBarcode.html"),
-                    )
-                    # Copy RunInfo.xml
-                    run_info_xml_src = os.path.join(run.run_dir, "RunInfo.xml")
-                    if os.path.isfile(run_info_xml_src):
-                        copyfile(
-                            run_info_xml_src,
-                            os.path.join(shared_filesystem_dest, "RunInfo.xml"),
-                        )
-                    # Copy RunParameters.xml
-                    run_parameters_xml_src = os.path.join(
-                        run.run_dir, "RunParameters.xml"
-                    )
-                    if os.path.isfile(run_info_xml_src):
-                        copyfile(
-                            run_parameters_xml_src,
-                            os.path.join(shared_filesystem_dest, "RunParameters.xml"),
-                        )
-                    # Copy InterOp
-                    interop_src = os.path.join(run.run_dir, "InterOp")
-                    if os.path.exists(interop_src):
-                        copytree(
-                            interop_src,
-                            os.path.join(shared_filesystem_dest, "InterOp"),
-                            dirs_exist_ok=True,
-                        )
-                except:
-                    logger.warning(
-                        f"Could not copy demultiplex stats, InterOp metadata or XML files for run {run.id}"
-                    )
-
-            # Transfer to analysis server if flag is True
-            if run.transfer_to_analysis_server:
-                mail_recipients = CONFIG.get("mail", {}).get("recipients")
+                }
+                for optional_src in ["RunInfo.xml", "RunParameters.xml", "InterOp"]:
+                    if os.path.exists(os.path.join(run.run_dir, optional_src)):
+                        to_sync[optional_src] = os.path.join(run.run_dir, optional_src)
+                copied = filesystem.sync_files(to_sync, shared_filesystem_dest)
                 logger.info(
-                    "Transferring run {} to {} into {}".format(
-                        run.id,
-                        run.CONFIG["analysis_server"]["host"],
-                        run.CONFIG["analysis_server"]["sync"]["data_archive"],
-                    )
+                    f"Copied {len(copied)} changed files to {shared_filesystem_dest}"
+                )
+            except:
+                logger.warning(
+                    f"Could not copy demultiplex stats, InterOp metadata or XML files for run {run.id}"
                 )
-                run.transfer_run(transfer_file, mail_recipients)
 
-            # Archive the run if indicated in the config file
-            if "storage" in CONFIG:  # TODO: make sure archiving to PDC is not ongoing
-                run.archive_run(CONFIG["storage"]["archive_dirs"][run.sequencer_type])
+        # Transfer to analysis server if flag is True
+        if run.transfer_to_analysis_server:
+            mail_recipients = CONFIG.get("mail", {}).get("recipients")
+            logger.info(
+                "Transferring run {} to {} into {}".format(
+                    run.id,
+                    run.CONFIG["analysis_server"]["host"],
+                    run.CONFIG["analysis_server"]["sync"]["data_archive"],
+                )
+            )
+            run.transfer_run(transfer_file, mail_recipients)
 
-    if run:
-        logger.info(f"Starting processing of run {run}")
-        # Determine the run type
-        runObj = get_runObj(run, software)
-        if not runObj:
-            raise RuntimeError(
-                f"Unrecognized instrument type or incorrect run folder {run}"
+        # Archive the run if indicated in the config file
+        if "storage" in CONFIG:  # TODO: make sure archiving to PDC is not ongoing
+            run.archive_run(CONFIG["storage"]["archive_dirs"][run.sequencer_type])
+
+
+def _init_worker(config):
+    """Set up a worker process of run_preprocessing as the CLI sets up TACA.
+
+    Workers started with spawn or forkserver, the default on Linux from
+    Python 3.14, do not inherit the loaded configuration and log file.
+
+    :param dict config: The configuration loaded by the parent process
+    """
+    # With fork, config may be CONFIG itself
+    if config is not CONFIG:
+        CONFIG.clear()
+        CONFIG.update(config)
+    log_file = config.get("log", {}).get("file", None)
+    if log_file:
+        level = config.get("log").get("log_level", "INFO")
+        init_logger_file(log_file, level)
+
+
+def _run_lock_path(run):
+    """Return the path of the lock file of a run.
+
+    The lock files are kept in analysis/run_lock_dir, outside of the run
+    folders, so that locking a run does not change its folder.
+    """
+    lock_dir = CONFIG.get("analysis", {}).get("run_lock_dir", RUN_LOCK_DIR)
+    os.makedirs(lock_dir, exist_ok=True)
+    return os.path.join(lock_dir, f"{os.path.basename(os.path.normpath(run))}.lock")
+
+
+def _process_run_dir(_run, software):
+    """Set up and process a single run folder found in the data directories.
+
+    The run is locked while being processed, so that overlapping TACA
+    invocations never work on the same run. Errors are logged and mailed but
+    never raised, so that a faulty run does not affect the processing of others.
+
+    :param str _run: Path to the run folder
+    :param str software: Demultiplexing software to use
+    """
+    if not os.path.isdir(_run):
+        logger.debug(f"Skipping {_run}, it is not a run folder")
+        return
+    mail_recipients = CONFIG.get("mail", {}).get("recipients")
+    with contextlib.ExitStack() as stack:
+        try:
+            locked = stack.enter_context(filesystem.lock_file(_run_lock_path(_run)))
+        except OSError as e:
+            logger.warning(f"Could not lock the run {_run}, skipping it: {e}")
+            return
+        if not locked:
+            logger.info(
+                f"Run {_run} is being processed by another TACA instance, skipping it"
             )
+            return
+        try:
+            runObj = get_runObj(_run, software)
+        except:
+            # This might throw an exception e.g. if the samplesheet is missing.
+            # It is better to continue processing other runs
+            logger.warning(f"There was an error setting up a run object for {_run}")
+            warning_email_time_limit = CONFIG.get("analysis").get(
+                "warning_email_time_limit"
+            )
+            run_start_indicator = os.path.join(_run, "RunParameters.xml")
+            seconds_since_start = time.time() - os.path.getctime(run_start_indicator)
+            if (
+                mail_recipients
+                and seconds_since_start
+                > warning_email_time_limit * 60 * 60  # hours -> sec
+            ):
+                subject = f"Error setting up a run object for {_run}"
+                message = (
+                    f"There was an error setting up a run object for {_run}. "
+                    "It is possible that the sample sheet is missing."
+                )
+                misc.send_mail(subject, message, mail_recipients)
+            pass
         else:
-            _process(runObj)
+            try:
+                _process(runObj)
+            except:
+                # This function might throw and exception,
+                # it is better to continue processing other runs
+                logger.warning(f"There was an error processing the run {_run}")
+                if mail_recipients:
+                    subject = f"Error processing {_run}"
+                    message = (
+                        f"There was an error processing {_run}. "
+                        "Please check the TACA log file on preproc for more information."
+                    )
+                    misc.send_mail(subject, message, mail_recipients)
+                pass
+
+
+def plan_demultiplexing(run, software):
+    """Plan the demultiplexing of a run without running it.
+
+    :param str run: Path to the run folder
+    :param str software: Demultiplexing software to use
+    :returns: The planned sub-demultiplexings, as text
+    """
+    runObj = get_runObj(run, software)
+    if not runObj:
+        raise RuntimeError(
+            f"Unrecognized instrument type or incorrect run folder {run}"
+        )
+    return demux_plan.format_demux_plan(runObj.plan_demultiplexing())
+
+
+def run_preprocessing(run, software, workers=1):
+    """Run demultiplexing in all data directories.
+
+    :param str run: Process a particular run instead of looking for runs
+    :param str software: Demultiplexing software to use
+    :param int workers: Number of runs to process concurrently
+    """
+    if run:
+        logger.info(f"Starting processing of run {run}")
+        with filesystem.lock_file(_run_lock_path(run)) as locked:
+            if not locked:
+                raise RuntimeError(
+                    f"Run {run} is being processed by another TACA instance"
+                )
+            # Determine the run type
+            runObj = get_runObj(run, software)
+            if not runObj:
+                raise RuntimeError(
+                    f"Unrecognized instrument type or incorrect run folder {run}"
+                )
+            else:
+                _process(runObj)
         logger.info(f"Finished processing run {run}")
     else:
         logger.info("Starting processing of all runs in data directories")
         data_dirs = CONFIG.get("analysis").get("data_dirs")
-        mail_recipients = CONFIG.get("mail", {}).get("recipients")
+        runs = []
         for data_dir in data_dirs:
             # Run folder looks like DATE_*_*_*, the last section is the FC name.
-            runs = glob.glob(os.path.join(data_dir, "[1-9]*_*_*_*"))
-            for _run in runs:
-                try:
-                    runObj = get_runObj(_run, software)
-                except:
-                    # This might throw an exception e.g. if the samplesheet is missing.
-                    # It is better to continue processing other runs
-                    logger.warning(
-                        f"There was an error setting up a run object for {_run}"
-                    )
-                    warning_email_time_limit = CONFIG.get("analysis").get(
-                        "warning_email_time_limit"
-                    )
-                    run_start_indicator = os.path.join(_run, "RunParameters.xml")
-                    seconds_since_start = time.time() - os.path.getctime(
-                        run_start_indicator
-                    )
-                    if (
-                        mail_recipients
-                        and seconds_since_start
-                        > warning_email_time_limit * 60 * 60  # hours -> sec
-                    ):
-                        subject = f"Error setting up a run object for {_run}"
-                        message = (
-                            f"There was an error setting up a run object for {_run}. "
-                            "It is possible that the sample sheet is missing."
-                        )
-                        misc.send_mail(subject, message, mail_recipients)
-                    pass
-                else:
+            runs.extend(glob.glob(os.path.join(data_dir, "[1-9]*_*_*_*")))
+        if workers > 1:
+            # Runs are processed in separate processes, as parts of the
+            # processing change the working directory of the process
+            logger.info(f"Processing {len(runs)} runs using {workers} workers")
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(CONFIG,)
+            ) as executor:
+                futures = {
+                    executor.submit(_process_run_dir, _run, software): _run
+                    for _run in runs
+                }
+                for future in as_completed(futures):
                     try:
-                        _process(runObj)
-                    except:
-                        # This function might throw and exception,
-                        # it is better to continue processing other runs
-                        logger.warning(f"There was an error processing the run {_run}")
-                        if mail_recipients:
-                            subject = f"Error processing {_run}"
-                            message = (
-                                f"There was an error processing {_run}. "
-                                "Please check the TACA log file on preproc for more information."
-                            )
-                            misc.send_mail(subject, message, mail_recipients)
-                        pass
+                        future.result()
+                    except BrokenExecutor as e:
+                        # e.g. BrokenProcessPool, all the remaining runs fail the same way
+                        logger.error(
+                            f"The pool of workers broke, runs left unprocessed: {e}"
+                        )
+                        break
+                    except Exception as e:
+                        logger.warning(
+                            f"Worker processing the run {futures[future]} failed: {e}"
+                        )
+        else:
+            for _run in runs:
+                _process_run_dir(_run, software)
         logger.info("Finished processing all runs in data directories")
@@ -6,7 +6,9 @@ import os
 
 from taca.element.Aviti_Runs import Aviti_Run
 from taca.utils.config import CONFIG
+from taca.utils.job_scheduler import get_job_scheduler
 from taca.utils.misc import send_mail
+from taca.utils.statusdb import ElementRunsConnection
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +19,15 @@ def run_preprocessing(given_run):
     :param str given_run: Process a particular run instead of looking for runs
     """
 
-    def _process(run_to_process):
+    def _process(run_to_process, db=None):
         """Process a run/flowcell and transfer to analysis server.
 
         :param taca.element.Run run: Run to be processed and transferred
+        :param ElementRunsConnection db: Statusdb connection shared by the runs
         """
         logger.info(f"Working on {run_to_process}")
         try:
-            run = Aviti_Run(run_to_process, CONFIG)
+            run = Aviti_Run(run_to_process, CONFIG, db=db)
             run.parse_run_parameters()
         except FileNotFoundError:
             logger.warning(
@@ -69,13 +72,24 @@ def run_preprocessing(given_run):
                     demux_manifests = run.make_demux_manifests(
                         manifest_to_split=run.lims_manifest
                     )
+                    # Queue the sub-demultiplexings within the host budget, if any
+                    scheduler = get_job_scheduler()
+                    if scheduler:
+                        threads = run.get_demux_threads(
+                            len(demux_manifests), scheduler.cores
+                        )
                     sub_demux_count = 0
                     for demux_manifest in sorted(demux_manifests):
                         sub_demux_dir = os.path.join(
                             run.run_dir, f"Demultiplexing_{sub_demux_count}"
                         )
                         os.mkdir(sub_demux_dir)
-                        run.start_demux(demux_manifest, sub_demux_dir)
+                        if scheduler:
+                            run.submit_demux(
+                                scheduler, demux_manifest, sub_demux_dir, threads
+                            )
+                        else:
+                            run.start_demux(demux_manifest, sub_demux_dir)
                         sub_demux_count += 1
                     run.status = "demultiplexing"
                     if run.status_changed():
@@ -94,6 +108,10 @@ def run_preprocessing(given_run):
                     )
                     return
             elif demultiplexing_status == "ongoing":
+                # Start the queued sub-demultiplexings as running ones finish
+                scheduler = get_job_scheduler()
+                if scheduler:
+                    scheduler.dispatch()
                 run.status = "demultiplexing"
                 if run.status_changed():
                     run.update_statusdb()
@@ -184,28 +202,40 @@ def run_preprocessing(given_run):
     else:
         logger.info("Starting processing of all runs in data directories")
         data_dirs = CONFIG.get("element_analysis").get("data_dirs")
+        runs = []
         for data_dir in data_dirs:
             # Run folder looks like DATE_*_*, the last section is the FC side (A/B) and ID (PID for teton runs)
-            runs = glob.glob(os.path.join(data_dir, "[1-9]*_*_*"))
-            for run in runs:
+            for run in glob.glob(os.path.join(data_dir, "[1-9]*_*_*")):
                 if "FlowcellPressureCheck" in run:
                     # Skip the pressure check runs (Teton runs)
                     logger.info(f"Skipping {run}")
                     continue
-                try:
-                    _process(run)
-                except Exception as e:
-                    # This function might throw an exception,
-                    # it is better to continue processing other runs
-                    email_subject = f"Issues processing {run}"
-                    email_message = (
-                        f"An error occurred while processing {run}. Error: {e}"
-                    )
-                    send_mail(
-                        email_subject, email_message, CONFIG["mail"]["recipients"]
-                    )
-                    logger.warning(
-                        f"There was an error processing the run {run}. Error: {e}"
-                    )
-                    pass
+                runs.append(run)
+        # Share one statusdb connection between the runs, and fetch the statuses
+        # of all of them at once. The run folders are named after the NGI run ids,
+        # the status of any other run is looked up when it is checked.
+        # Each run connects on its own if this fails
+        db = None
+        try:
+            db = ElementRunsConnection(
+                CONFIG.get("statusdb", {}), dbname="element_runs"
+            )
+            db.prefetch_run_statuses(os.path.basename(run) for run in runs)
+        except Exception as e:
+            logger.warning(
+                f"Could not fetch the statuses of the runs from statusdb. Error: {e}"
+            )
+        for run in runs:
+            try:
+                _process(run, db=db)
+            except Exception as e:
+                # This function might throw an exception,
+                # it is better to continue processing other runs
+                email_subject = f"Issues processing {run}"
+                email_message = f"An error occurred while processing {run}. Error: {e}"
+                send_mail(email_subject, email_message, CONFIG["mail"]["recipients"])
+                logger.warning(
+                    f"There was an error processing the run {run}. Error: {e}"
+                )
+                pass
         logger.info("Finished processing all runs in data directories")
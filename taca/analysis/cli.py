@@ -30,9 +30,27 @@ def analysis():
     default="bcl2fastq",
     help="Available software for demultiplexing: bcl2fastq (default), bclconvert",
 )
-def demultiplex(run, software):
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of runs to process concurrently (default 1)",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    default=False,
+    help="Only show the sub-demultiplexings planned for the run given with --run",
+)
+def demultiplex(run, software, workers, plan):
     """Demultiplex and transfer all runs present in the data directories."""
-    an.run_preprocessing(run, software)
+    if plan:
+        if not run:
+            raise click.UsageError("--plan requires a run given with --run")
+        click.echo(an.plan_demultiplexing(run, software))
+    else:
+        an.run_preprocessing(run, software, workers=workers)
 
 
 @analysis.command()
@@ -66,10 +84,17 @@ def transfer(rundir, runfolder_project, exclude_lane, software):
     default="bcl2fastq",
     help="Available software for demultiplexing: bcl2fastq (default), bclconvert",
 )
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Upload the run even if it is unchanged since its last upload",
+)
 @click.argument("rundir")
-def updatedb(rundir, software):
+def updatedb(rundir, software, force):
     """Save the run to statusdb."""
-    an.upload_to_statusdb(rundir, software)
+    an.upload_to_statusdb(rundir, software, force=force)
 
 
 # Element analysis subcommands
@@ -6,7 +6,7 @@ logger = logging.getLogger(__name__)
 
 
 class Aviti_Run(Run):
-    def __init__(self, run_dir, configuration):
+    def __init__(self, run_dir, configuration, db=None):
         self.sequencer_type = "Aviti"
         self.demux_dir = "Demultiplexing"
-        super().__init__(run_dir, configuration)
+        super().__init__(run_dir, configuration, db=db)
@@ -4,21 +4,29 @@ import json
 import logging
 import os
 import re
+import shlex
 import shutil
 import subprocess
 import zipfile
 from datetime import datetime
+from functools import cache, partial
 from pathlib import Path
 
 import pandas as pd
-from Levenshtein import distance
 
+from taca.element.fastq_index import create_symlinks, index_fastq
+from taca.element.index_distances import min_distance_at_most
 from taca.utils.filesystem import chdir
 from taca.utils.statusdb import ElementRunsConnection
+from taca.utils.transfer_ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
+# Groups of bases or Ns of an index sequence, for making masks
+MASK_GROUP_PAT = re.compile(r"N+|[ACGT]+")
 
+
+@cache
 def get_mask(
     seq: str,
     keep: str,
@@ -67,78 +75,85 @@ def get_mask(
         mask = f"{prefix}N{cycles_used}"
         return mask
 
-    # Define dict to convert base to mask classifier
-    base2mask = (
-        {
-            "N": "N",
-            "A": "Y",
-            "C": "Y",
-            "G": "Y",
-            "T": "Y",
-        }
-        if keep == "bases"
-        else {
-            "N": "Y",
-            "A": "N",
-            "C": "N",
-            "G": "N",
-            "T": "N",
-        }
-    )
-
-    # Instantiate the mask string
-    mask = ""
-    # Add the prefix
-    mask += prefix
-    # Loop through the input sequence and dynamically add mask groups
-    current_group = ""
-    current_group_len = 0
-    mask_len = 0
-    for base in seq:
-        mask_len += 1
-        if base2mask[base] == current_group:
-            current_group_len += 1
+    # Run-length encode the sequence into alternating groups of bases and Ns
+    groups: list[tuple[str, int]] = []
+    for match in MASK_GROUP_PAT.finditer(seq):
+        is_n = match.group()[0] == "N"
+        if keep == "bases":
+            groups.append(("N" if is_n else "Y", len(match.group())))
         else:
-            mask += (
-                f"{current_group}{current_group_len}" if current_group_len > 0 else ""
-            )
-            current_group = base2mask[base]
-            current_group_len = 1
+            groups.append(("Y" if is_n else "N", len(match.group())))
     # For the last mask group, check if we need to pad with Ns to match the number of cycles used
-    if cycles_used > mask_len:
-        diff = cycles_used - mask_len
-        if current_group == "N":
-            current_group_len += diff
-            mask += f"{current_group}{current_group_len}"
+    if cycles_used > len(seq):
+        diff = cycles_used - len(seq)
+        last_group, last_len = groups[-1]
+        if last_group == "N":
+            groups[-1] = (last_group, last_len + diff)
         else:
-            mask += f"{current_group}{current_group_len}"
-            mask += f"N{diff}"
-    else:
-        mask += f"{current_group}{current_group_len}"
-
-    # Parse mask string to check that it matches the number of cycles used
-    assert (
-        sum(
-            [
-                int(n)
-                for n in mask[3:]
-                .replace("N", "-")
-                .replace("Y", "-")
-                .strip("-")
-                .split("-")
-            ]
-        )
-        == cycles_used
-    ), f"Length of mask '{mask}' does not match number of cycles used '{cycles_used}'."
+            groups.append(("N", diff))
+    mask = prefix + "".join(f"{group}{group_len}" for group, group_len in groups)
+
+    # Check that the mask matches the number of cycles used
+    assert sum(group_len for _, group_len in groups) == cycles_used, (
+        f"Length of mask '{mask}' does not match number of cycles used '{cycles_used}'."
+    )
 
     return mask
 
 
+def _get_read_mask(recipe: str, read: str, cycles_used: int) -> str:
+    """Return the mask of read R1 or R2 for a recipe like 151-151.
+    A recipe of 0-0 is interpreted to simply use all cycles.
+    """
+    recipe_cycles = int(recipe.split("-")[0 if read == "R1" else -1])
+    return get_mask(
+        seq="N" * recipe_cycles if recipe_cycles > 0 else "N" * cycles_used,
+        keep="Ns",
+        prefix=f"{read}:",
+        cycles_used=cycles_used,
+    )
+
+
+def _map_unique(column: pd.Series, func) -> pd.Series:
+    """Apply a function once per distinct value of a column."""
+    return column.map({value: func(value) for value in column.unique()})
+
+
+def get_manifest_masks(df: pd.DataFrame, cycles: dict) -> pd.DataFrame:
+    """For an AVITI manifest dataframe containing the columns 'Index1',
+    'Index2' and 'Recipe', return the columns I1Mask, I2Mask, I1UmiMask,
+    I2UmiMask, R1Mask and R2Mask of each sample.
+
+    Masks are computed once per distinct index or recipe, so this is fast for
+    large manifests and can also be used to preview a demultiplexing.
+    """
+    masks = pd.DataFrame(index=df.index)
+    for column, index_column, keep in [
+        ("I1Mask", "Index1", "bases"),
+        ("I2Mask", "Index2", "bases"),
+        ("I1UmiMask", "Index1", "Ns"),
+        ("I2UmiMask", "Index2", "Ns"),
+    ]:
+        read = index_column.replace("Index", "I")
+        masks[column] = _map_unique(
+            df[index_column],
+            partial(get_mask, keep=keep, prefix=f"{read}:", cycles_used=cycles[read]),
+        )
+    for column, read in [("R1Mask", "R1"), ("R2Mask", "R2")]:
+        masks[column] = _map_unique(
+            df["Recipe"], partial(_get_read_mask, read=read, cycles_used=cycles[read])
+        )
+    return masks
+
+
 def get_custom_mistmatch_thresholds(df: pd.DataFrame) -> tuple[int, int]:
     """For an AVITI manifest dataframe containing the columns
     'Lane', 'Index1', and 'Index2', determine whether the minimum allowed
     mismatch threshold for index sequences should be reduced from 1 to 0,
     based on the minimum distance between indexes.
+
+    The distances are computed with :func:`min_distance_at_most`, which only
+    needs to compare few pairs of samples.
     """
     df = df.copy()
 
@@ -146,34 +161,34 @@ def get_custom_mistmatch_thresholds(df: pd.DataFrame) -> tuple[int, int]:
     i1MismatchThreshold = 1
     i2MismatchThreshold = 1
 
-    # Collect distances
-    idx1_dists = []
-    idx2_dists = []
-    total_dists = []
-    # Iterate across all sample pairings per lane
+    # Compare all sample pairings per lane
+    pairs_compared = False
+    duplicate_index_pair = False
+    idx1_close = False
+    idx2_close = False
     for lane in df["Lane"].unique():
         df_lane = df[df["Lane"] == lane]
-        df_lane.reset_index(drop=True, inplace=True)
-        for i in range(0, len(df_lane)):
-            for j in range(i + 1, len(df_lane)):
-                idx1_dist = distance(df_lane["Index1"][i], df_lane["Index1"][j])
-                idx2_dist = distance(df_lane["Index2"][i], df_lane["Index2"][j])
-
-                # Collect distances between all sample pairings on index and index-pair level
-                idx1_dists.append(idx1_dist)
-                idx2_dists.append(idx2_dist)
-                total_dists.append(idx1_dist + idx2_dist)
-
-    if len(total_dists) == 0:
+        if len(df_lane) < 2:
+            continue
+        pairs_compared = True
+        index1 = df_lane["Index1"].tolist()
+        index2 = df_lane["Index2"].tolist()
+        # A total distance of 0 means two samples have the same index pair
+        if len(set(zip(index1, index2))) < len(df_lane):
+            duplicate_index_pair = True
+        idx1_close = idx1_close or min_distance_at_most(index1, 2)
+        idx2_close = idx2_close or min_distance_at_most(index2, 2)
+
+    if not pairs_compared:
         return (i1MismatchThreshold, i2MismatchThreshold)
-    if min(total_dists) == 0:
+    if duplicate_index_pair:
         raise AssertionError("Total index distance of 0 detected.")
-    if min(idx1_dists) <= 2:
+    if idx1_close:
         logging.warning(
             "Minimum distance between Index1 sequences is at or below 2. Reducing allowed mismatches from 1 to 0."
         )
         i1MismatchThreshold = 0
-    if min(idx2_dists) <= 2:
+    if idx2_close:
         logging.warning(
             "Minimum distance between Index2 sequences is at or below 2. Reducing allowed mismatches from 1 to 0."
         )
@@ -185,7 +200,7 @@ def get_custom_mistmatch_thresholds(df: pd.DataFrame) -> tuple[int, int]:
 class Run:
     """Defines an Element run"""
 
-    def __init__(self, run_dir, configuration):
+    def __init__(self, run_dir, configuration, db=None):
         if not hasattr(self, "sequencer_type"):
             # Mostly for testing, since this class is not meant to be instantiated
             self.sequencer_type = "GenericElement"
@@ -218,9 +233,12 @@ class Run:
         )
         self.run_uploaded_file = os.path.join(self.run_dir, "RunUploaded.json")
 
-        self.db = ElementRunsConnection(
-            self.CONFIG.get("statusdb", {}), dbname="element_runs"
-        )
+        # The connection may be shared by all runs processed together
+        if db is None:
+            db = ElementRunsConnection(
+                self.CONFIG.get("statusdb", {}), dbname="element_runs"
+            )
+        self.db = db
 
         # Fields to be set by TACA
         self.status = None
@@ -542,59 +560,7 @@ class Run:
         df_controls = df[df["Project"] == "Control"].copy()
 
         # Add masks
-        df_samples["I1Mask"] = df_samples["Index1"].apply(
-            lambda seq: get_mask(
-                seq=seq,
-                keep="bases",
-                prefix="I1:",
-                cycles_used=self.cycles["I1"],
-            )
-        )
-        df_samples["I2Mask"] = df_samples["Index2"].apply(
-            lambda seq: get_mask(
-                seq=seq,
-                keep="bases",
-                prefix="I2:",
-                cycles_used=self.cycles["I2"],
-            )
-        )
-        df_samples["I1UmiMask"] = df_samples["Index1"].apply(
-            lambda seq: get_mask(
-                seq=seq,
-                keep="Ns",
-                prefix="I1:",
-                cycles_used=self.cycles["I1"],
-            )
-        )
-        df_samples["I2UmiMask"] = df_samples["Index2"].apply(
-            lambda seq: get_mask(
-                seq=seq,
-                keep="Ns",
-                prefix="I2:",
-                cycles_used=self.cycles["I2"],
-            )
-        )
-        # For the read masks, interpret a recipe of 0-0 to simply use all cycles
-        df_samples["R1Mask"] = df_samples["Recipe"].apply(
-            lambda recipe: get_mask(
-                seq="N" * int(recipe.split("-")[0])
-                if int(recipe.split("-")[0]) > 0
-                else "N" * self.cycles["R1"],
-                keep="Ns",
-                prefix="R1:",
-                cycles_used=self.cycles["R1"],
-            )
-        )
-        df_samples["R2Mask"] = df_samples["Recipe"].apply(
-            lambda recipe: get_mask(
-                seq="N" * int(recipe.split("-")[-1])
-                if int(recipe.split("-")[-1]) > 0
-                else "N" * self.cycles["R2"],
-                keep="Ns",
-                prefix="R2:",
-                cycles_used=self.cycles["R2"],
-            )
-        )
+        df_samples = df_samples.join(get_manifest_masks(df_samples, self.cycles))
 
         # Re-make Index2 column without any Ns
         df_samples["Index2_with_Ns"] = df_samples["Index2"]
@@ -747,12 +713,33 @@ class Run:
         manifest_paths = [t[0] for t in manifests]
         return manifest_paths
 
-    def generate_demux_command(self, run_manifest, demux_dir):
+    def get_demux_threads(self, n_sub_demux, budget=None):
+        """Return the number of threads (-p) of bases2fastq for each sub-demultiplexing.
+
+        Without a budget, bases2fastq_threads (8 by default) is used. Otherwise the
+        cores of the budget are shared by the sub-demultiplexings, within
+        bases2fastq_min_threads (4 by default) and bases2fastq_threads, and the
+        sub-demultiplexings not fitting in the budget are queued.
+
+        :param int n_sub_demux: Number of sub-demultiplexings of the run
+        :param int budget: Number of cores available on the host, if limited
+        """
+        element_config = self.CONFIG.get("element_analysis")
+        max_threads = element_config.get("bases2fastq_threads", 8)
+        if not budget:
+            return max_threads
+        min_threads = element_config.get("bases2fastq_min_threads", 4)
+        threads = max(min_threads, min(max_threads, budget // max(n_sub_demux, 1)))
+        return min(threads, budget)
+
+    def generate_demux_command(self, run_manifest, demux_dir, threads=None):
+        if threads is None:
+            threads = self.get_demux_threads(1)
         command = (
             f"{self.CONFIG.get('element_analysis').get('bases2fastq')}"
             + f" {self.run_dir}"
             + f" {demux_dir}"
-            + " -p 8"
+            + f" -p {threads}"
             + " --num-unassigned 500"
             + f" -r {run_manifest}"
             + " --legacy-fastq"
@@ -790,6 +777,36 @@ class Run:
                 raise e
         return
 
+    def submit_demux(self, scheduler, run_manifest, demux_dir, threads):
+        """Queue bases2fastq for a sub-demultiplexing on the host job scheduler.
+
+        The scheduler starts it once the cores it uses fit in the host budget,
+        and records its exit status and wall time in the run folder, in
+        bases2fastq_<N>_<binary>.stats.
+
+        :param taca.utils.job_scheduler.JobScheduler scheduler: The host scheduler
+        :param str run_manifest: The run manifest of the sub-demultiplexing
+        :param str demux_dir: The output folder of the sub-demultiplexing
+        :param int threads: The number of threads of bases2fastq, see
+            :meth:`get_demux_threads`
+        """
+        cmd = self.generate_demux_command(run_manifest, demux_dir, threads)
+        subdemux = os.path.basename(demux_dir).split("_")[1]
+        scheduler.submit(
+            f"{self.NGI_run_id}_demux_{subdemux}",
+            shlex.split(cmd),
+            self.run_dir,
+            f"bases2fastq_{subdemux}",
+            cores=threads,
+            memory_gb=self.CONFIG.get("element_analysis").get(
+                "bases2fastq_memory_gb", 0
+            ),
+        )
+        logger.info(
+            "Bases2Fastq conversion and demultiplexing "
+            f"queued for run {self} on {datetime.now()} with {threads} threads"
+        )
+
     def get_transfer_status(self):
         if (
             not self.in_transfer_log()
@@ -810,11 +827,7 @@ class Run:
             return "unknown"
 
     def in_transfer_log(self):
-        with open(self.transfer_file) as transfer_file:
-            for row in transfer_file.readlines():
-                if row.startswith(self.NGI_run_id):
-                    return True
-        return False
+        return self.NGI_run_id in get_ledger(self.transfer_file)
 
     def transfer_ongoing(self):
         return os.path.isfile(os.path.join(self.run_dir, ".rsync_ongoing"))
@@ -905,8 +918,22 @@ class Run:
         )
         return sorted_demux_runmanifest
 
+    # Index the output FastQ files of each sub-demux, with one scan per sub-demux
+    def index_sub_demux_fastq(self, demux_runmanifest):
+        return {
+            sub_demux: index_fastq(
+                os.path.join(self.run_dir, f"Demultiplexing_{sub_demux}", "Samples")
+            )
+            for sub_demux in sorted(
+                set(sample["sub_demux_count"] for sample in demux_runmanifest)
+            )
+        }
+
     # Aggregate the output FastQ files of samples from multiple demux
-    def aggregate_sample_fastq(self, demux_runmanifest):
+    def aggregate_sample_fastq(self, demux_runmanifest, fastq_index=None):
+        if fastq_index is None:
+            fastq_index = self.index_sub_demux_fastq(demux_runmanifest)
+        links = []
         lanes = sorted(list(set(sample["Lane"] for sample in demux_runmanifest)))
         for lane in lanes:
             unique_sample_demux = set()
@@ -923,34 +950,17 @@ class Run:
                         sub_demux_count,
                     )
                     if sample_tuple not in unique_sample_demux:
-                        project_dest = os.path.join(
-                            self.run_dir, self.demux_dir, project
-                        )
                         sample_dest = os.path.join(
                             self.run_dir,
                             self.demux_dir,
                             project,
                             f"Sample_{sample_name}",
                         )
-                        if not os.path.exists(project_dest):
-                            os.makedirs(project_dest)
-                        if not os.path.exists(sample_dest):
-                            os.makedirs(sample_dest)
-                        fastqfiles = glob.glob(
-                            os.path.join(
-                                self.run_dir,
-                                f"Demultiplexing_{sub_demux_count}",
-                                "Samples",
-                                project,
-                                sample_name,
-                                f"*L00{lane}*.fastq.gz",
-                            )
+                        os.makedirs(sample_dest, exist_ok=True)
+                        fastqfiles = fastq_index[sub_demux_count].get(
+                            (project, sample_name, lane), {}
                         )
-                        for fastqfile in fastqfiles:
-                            old_name = os.path.basename(fastqfile)
-                            read_label = re.search(
-                                rf"L00{lane}_(.*?)_001", old_name
-                            ).group(1)
+                        for read_label, fastqfile in fastqfiles.items():
                             new_name = "_".join(
                                 [
                                     sample_name,
@@ -960,12 +970,18 @@ class Run:
                                     "001.fastq.gz",
                                 ]
                             )
-                            os.symlink(fastqfile, os.path.join(sample_dest, new_name))
+                            links.append(
+                                (fastqfile, os.path.join(sample_dest, new_name))
+                            )
                         unique_sample_demux.add(sample_tuple)
                         sample_count += 1
+        create_symlinks(links)
 
     # Symlink the output FastQ files of undet only if a lane does not have multiple demux
-    def aggregate_undet_fastq(self, demux_runmanifest):
+    def aggregate_undet_fastq(self, demux_runmanifest, fastq_index=None):
+        if fastq_index is None:
+            fastq_index = self.index_sub_demux_fastq(demux_runmanifest)
+        links = []
         lanes = sorted(list(set(sample["Lane"] for sample in demux_runmanifest)))
         for lane in lanes:
             sub_demux = list(
@@ -979,20 +995,14 @@ class Run:
                 project_dest = os.path.join(
                     self.run_dir, self.demux_dir, "Undetermined"
                 )
-                if not os.path.exists(project_dest):
-                    os.makedirs(project_dest)
-                fastqfiles = glob.glob(
-                    os.path.join(
-                        self.run_dir,
-                        f"Demultiplexing_{sub_demux[0]}",
-                        "Samples",
-                        "Undetermined",
-                        f"*L00{lane}*.fastq.gz",
-                    )
+                os.makedirs(project_dest, exist_ok=True)
+                fastqfiles = fastq_index[sub_demux[0]].get(
+                    ("Undetermined", None, lane), {}
                 )
-                for fastqfile in fastqfiles:
+                for fastqfile in fastqfiles.values():
                     base_name = os.path.basename(fastqfile)
-                    os.symlink(fastqfile, os.path.join(project_dest, base_name))
+                    links.append((fastqfile, os.path.join(project_dest, base_name)))
+        create_symlinks(links)
 
     # Read in each Project_RunStats.json to fetch PercentMismatch, PercentQ30, PercentQ40 and QualityScoreMean
     # Note that Element promised that they would include these stats into IndexAssignment.csv
@@ -1049,12 +1059,16 @@ class Run:
         sub_demux_list = sorted(
             list(set(sample["sub_demux_count"] for sample in demux_runmanifest))
         )
-        lanes = sorted(list(set(sample["Lane"] for sample in demux_runmanifest)))
+        lanes = set(sample["Lane"] for sample in demux_runmanifest)
         for sub_demux in sub_demux_list:
             # Read in each Project_RunStats.json to fetch PercentMismatch, PercentQ30, PercentQ40 and QualityScoreMean
             # Note that Element promised that they would include these stats into IndexAssignment.csv
             # But for now we have to do this by ourselves in this hard way
-            project_runstats = self.get_project_runstats(sub_demux, demux_runmanifest)
+            project_runstats = {}
+            for d in self.get_project_runstats(sub_demux, demux_runmanifest):
+                project_runstats.setdefault(
+                    (d["SampleName"], d["Lane"], d["ExpectedSequence"]), d
+                )
             # Read in IndexAssignment.csv
             assigned_csv = os.path.join(
                 self.run_dir, f"Demultiplexing_{sub_demux}", "IndexAssignment.csv"
@@ -1068,20 +1082,20 @@ class Run:
 
                 for sample in index_assignment:
                     if sample["Lane"] in lanes:
-                        project_runstats_sample = [
-                            d
-                            for d in project_runstats
-                            if d["SampleName"] == sample["SampleName"]
-                            and d["Lane"] == sample["Lane"]
-                            and d["ExpectedSequence"] == sample["I1"] + sample["I2"]
+                        project_runstats_sample = project_runstats[
+                            (
+                                sample["SampleName"],
+                                sample["Lane"],
+                                sample["I1"] + sample["I2"],
+                            )
                         ]
                         sample["sub_demux_count"] = sub_demux
-                        sample["PercentMismatch"] = project_runstats_sample[0][
+                        sample["PercentMismatch"] = project_runstats_sample[
                             "PercentMismatch"
                         ]
-                        sample["PercentQ30"] = project_runstats_sample[0]["PercentQ30"]
-                        sample["PercentQ40"] = project_runstats_sample[0]["PercentQ40"]
-                        sample["QualityScoreMean"] = project_runstats_sample[0][
+                        sample["PercentQ30"] = project_runstats_sample["PercentQ30"]
+                        sample["PercentQ40"] = project_runstats_sample["PercentQ40"]
+                        sample["QualityScoreMean"] = project_runstats_sample[
                             "QualityScoreMean"
                         ]
                         aggregated_assigned_indexes.append(sample)
@@ -1089,49 +1103,57 @@ class Run:
                 logger.warning(
                     f"No {os.path.basename(assigned_csv)} file found for sub-demultiplexing {sub_demux}."
                 )
+        # Project of each sample
+        sample_projects = {}
+        for d in demux_runmanifest:
+            sample_projects.setdefault(d["SampleName"], d["Project"])
         # Remove redundant rows for PhiX
         aggregated_assigned_indexes_filtered = []
         phix_filtered = []
         for sample in aggregated_assigned_indexes:
             # Add project name
-            sample["Project"] = [
-                d for d in demux_runmanifest if d["SampleName"] == sample["SampleName"]
-            ][0]["Project"]
+            sample["Project"] = sample_projects[sample["SampleName"]]
             # Get the PhiX with the longest index combination.
             if sample["SampleName"] == "PhiX":
-                lane = sample["Lane"]
                 idx1 = sample["I1"]
                 idx2 = sample["I2"]
-                num_polonies_assigned = sample["NumPoloniesAssigned"]
-                if not phix_filtered:
+                # PhiX records of the same lane with overlapping indexes
+                overlapping = []
+                for phix_record in phix_filtered:
+                    if sample["Lane"] == phix_record["Lane"]:
+                        idx1_shorter_len = min(len(idx1), len(phix_record["I1"]))
+                        idx2_shorter_len = min(len(idx2), len(phix_record["I2"]))
+                        if (
+                            idx1[:idx1_shorter_len]
+                            == phix_record["I1"][:idx1_shorter_len]
+                            and idx2[:idx2_shorter_len]
+                            == phix_record["I2"][:idx2_shorter_len]
+                        ):
+                            overlapping.append(phix_record)
+                if not overlapping:
+                    phix_filtered.append(sample)
+                    continue
+                # When the new record has a longer index combination length, take the new record and remove the old one
+                # When the index combination length happen to be the same, keep the one with the higher polonies assigned
+                replaced = [
+                    phix_record
+                    for phix_record in overlapping
+                    if len(idx1) + len(idx2)
+                    > len(phix_record["I1"]) + len(phix_record["I2"])
+                    or (
+                        len(idx1) + len(idx2)
+                        == len(phix_record["I1"]) + len(phix_record["I2"])
+                        and sample["NumPoloniesAssigned"]
+                        >= phix_record["NumPoloniesAssigned"]
+                    )
+                ]
+                if replaced:
+                    phix_filtered = [
+                        phix_record
+                        for phix_record in phix_filtered
+                        if not any(phix_record is r for r in replaced)
+                    ]
                     phix_filtered.append(sample)
-                else:
-                    found_flag = False
-                    for phix_record in phix_filtered:
-                        if lane == phix_record["Lane"]:
-                            idx1_shorter_len = min(len(idx1), len(phix_record["I1"]))
-                            idx2_shorter_len = min(len(idx2), len(phix_record["I2"]))
-                            if (
-                                idx1[:idx1_shorter_len]
-                                == phix_record["I1"][:idx1_shorter_len]
-                                and idx2[:idx2_shorter_len]
-                                == phix_record["I2"][:idx2_shorter_len]
-                            ):
-                                found_flag = True
-                                # When the new record has a longer index combination length, take the new record and remove the old one
-                                # When the index combination length happen to be the same, keep the one with the higher polonies assigned
-                                if len(idx1) + len(idx2) > len(phix_record["I1"]) + len(
-                                    phix_record["I2"]
-                                ) or (
-                                    len(idx1) + len(idx2)
-                                    == len(phix_record["I1"]) + len(phix_record["I2"])
-                                    and num_polonies_assigned
-                                    >= phix_record["NumPoloniesAssigned"]
-                                ):
-                                    phix_filtered.remove(phix_record)
-                                    phix_filtered.append(sample)
-                    if not found_flag:
-                        phix_filtered.append(sample)
             else:
                 aggregated_assigned_indexes_filtered.append(sample)
         # Combine the list of samples and PhiX
@@ -1217,42 +1239,51 @@ class Run:
     ):
         aggregated_unassigned_indexes = []
         lanes = sorted(list(set(sample["Lane"] for sample in demux_runmanifest)))
+        # Assigned indexes of each sub-demux and lane
+        assigned_indexes = {}
+        for sample in aggregated_assigned_indexes_filtered_sorted:
+            assigned_indexes.setdefault(
+                (sample["sub_demux_count"], sample["Lane"]), []
+            ).append(sample)
+        # UnassignedSequences.csv of each sub-demux, read once for all lanes
+        unassigned_indexes = {}
         for lane in lanes:
-            sub_demux_index_lens = set()
+            sub_demux_index_lens = {}
             for sample in demux_runmanifest:
                 if sample["Lane"] == lane:
-                    sub_demux_index_lens.add(
+                    sub_demux_index_lens.setdefault(
+                        sample["sub_demux_count"],
                         (
-                            sample["sub_demux_count"],
-                            (
-                                len(sample.get("Index1", "")),
-                                len(sample.get("Index2", "")),
-                            ),
-                        )
+                            len(sample.get("Index1", "")),
+                            len(sample.get("Index2", "")),
+                        ),
                     )
             # List of sub-demux with a decreasing order of index lengths
-            sub_demux_list = [
-                x[0]
-                for x in sorted(
-                    sub_demux_index_lens, key=lambda x: sum(x[1]), reverse=True
-                )
-            ]
+            sub_demux_list = sorted(
+                sub_demux_index_lens,
+                key=lambda x: sum(sub_demux_index_lens[x]),
+                reverse=True,
+            )
             sub_demux_with_max_index_lens = sub_demux_list[0]
             # Start with the unassigned list with the longest index
-            max_unassigned_csv = os.path.join(
-                self.run_dir,
-                f"Demultiplexing_{sub_demux_with_max_index_lens}",
-                "UnassignedSequences.csv",
-            )
-            if os.path.exists(max_unassigned_csv):
-                with open(max_unassigned_csv) as max_unassigned_file:
-                    reader = csv.DictReader(max_unassigned_file)
-                    max_unassigned_indexes = [row for row in reader]
-            else:
-                logger.warning(
-                    f"No {os.path.basename(max_unassigned_csv)} file found for sub-demultiplexing {sub_demux_with_max_index_lens}."
+            if sub_demux_with_max_index_lens not in unassigned_indexes:
+                max_unassigned_csv = os.path.join(
+                    self.run_dir,
+                    f"Demultiplexing_{sub_demux_with_max_index_lens}",
+                    "UnassignedSequences.csv",
                 )
-                break
+                if os.path.exists(max_unassigned_csv):
+                    with open(max_unassigned_csv) as max_unassigned_file:
+                        reader = csv.DictReader(max_unassigned_file)
+                        unassigned_indexes[sub_demux_with_max_index_lens] = [
+                            row for row in reader
+                        ]
+                else:
+                    logger.warning(
+                        f"No {os.path.basename(max_unassigned_csv)} file found for sub-demultiplexing {sub_demux_with_max_index_lens}."
+                    )
+                    break
+            max_unassigned_indexes = unassigned_indexes[sub_demux_with_max_index_lens]
             if max_unassigned_indexes == []:
                 continue
             # Filter by lane
@@ -1260,59 +1291,38 @@ class Run:
                 idx for idx in max_unassigned_indexes if idx["Lane"] == lane
             ]
             # Complicated case with multiple demuxes. Take the full list if there is only one sub-demux otherwise
-            if len(sub_demux_list) > 1:
-                # Order: from longer to shorter indexes
-                sub_demux_with_shorter_index_lens = sub_demux_list[1:]
-                for sub_demux in sub_demux_with_shorter_index_lens:
-                    sub_demux_assigned_indexes = [
-                        sub_demux_assigned_index
-                        for sub_demux_assigned_index in aggregated_assigned_indexes_filtered_sorted
-                        if sub_demux_assigned_index["sub_demux_count"] == sub_demux
-                        and sub_demux_assigned_index["Lane"] == lane
-                    ]
-                    # Remove overlapped indexes from the list of max_unassigned_indexes
-                    idx1_overlapped_len = min(
-                        [
-                            demux_lens_pair[1]
-                            for demux_lens_pair in sub_demux_index_lens
-                            if demux_lens_pair[0] == sub_demux
-                        ][0][0],
-                        [
-                            demux_lens_pair[1]
-                            for demux_lens_pair in sub_demux_index_lens
-                            if demux_lens_pair[0] == sub_demux_with_max_index_lens
-                        ][0][0],
+            # Order of the other sub-demuxes: from longer to shorter indexes
+            max_idx1_len, max_idx2_len = sub_demux_index_lens[
+                sub_demux_with_max_index_lens
+            ]
+            for sub_demux in sub_demux_list[1:]:
+                # Remove unassigned indexes overlapping with the indexes assigned in the sub-demux,
+                # i.e. sharing their prefix over the length of the shorter indexes
+                idx1_overlapped_len = min(
+                    sub_demux_index_lens[sub_demux][0], max_idx1_len
+                )
+                idx2_overlapped_len = min(
+                    sub_demux_index_lens[sub_demux][1], max_idx2_len
+                )
+                overlapped_seqs = {
+                    (
+                        sub_demux_assigned_index["I1"][:idx1_overlapped_len],
+                        sub_demux_assigned_index["I2"][:idx2_overlapped_len],
                     )
-                    idx2_overlapped_len = min(
-                        [
-                            demux_lens_pair[1]
-                            for demux_lens_pair in sub_demux_index_lens
-                            if demux_lens_pair[0] == sub_demux
-                        ][0][1],
-                        [
-                            demux_lens_pair[1]
-                            for demux_lens_pair in sub_demux_index_lens
-                            if demux_lens_pair[0] == sub_demux_with_max_index_lens
-                        ][0][1],
+                    for sub_demux_assigned_index in assigned_indexes.get(
+                        (sub_demux, lane), []
                     )
-                    for sub_demux_assigned_index in sub_demux_assigned_indexes:
-                        idx1_overlapped_seq = sub_demux_assigned_index["I1"][
-                            :idx1_overlapped_len
-                        ]
-                        idx2_overlapped_seq = sub_demux_assigned_index["I2"][
-                            :idx2_overlapped_len
-                        ]
-                        # Remove the overlapped record from the max_unassigned_indexes list
-                        max_unassigned_indexes = [
-                            max_unassigned_index
-                            for max_unassigned_index in max_unassigned_indexes
-                            if not (
-                                max_unassigned_index["I1"][:idx1_overlapped_len]
-                                == idx1_overlapped_seq
-                                and max_unassigned_index["I2"][:idx2_overlapped_len]
-                                == idx2_overlapped_seq
-                            )
-                        ]
+                }
+                if overlapped_seqs:
+                    max_unassigned_indexes = [
+                        max_unassigned_index
+                        for max_unassigned_index in max_unassigned_indexes
+                        if (
+                            max_unassigned_index["I1"][:idx1_overlapped_len],
+                            max_unassigned_index["I2"][:idx2_overlapped_len],
+                        )
+                        not in overlapped_seqs
+                    ]
             # Append to the aggregated_unassigned_indexes list
             aggregated_unassigned_indexes += max_unassigned_indexes
         # Sort aggregated_unassigned_indexes list first by lane and then by Count in the decreasing order
@@ -1398,10 +1408,11 @@ class Run:
         # Clear all content under dest_dir
         self.clear_dir(os.path.join(self.run_dir, self.demux_dir))
         demux_runmanifest = self.collect_demux_runmanifest(demux_results_dirs)
+        fastq_index = self.index_sub_demux_fastq(demux_runmanifest)
         # Aggregate the output FastQ files of samples from multiple demux
-        self.aggregate_sample_fastq(demux_runmanifest)
+        self.aggregate_sample_fastq(demux_runmanifest, fastq_index)
         # Symlink the output FastQ files of undet only if a lane does not have multiple demux
-        self.aggregate_undet_fastq(demux_runmanifest)
+        self.aggregate_undet_fastq(demux_runmanifest, fastq_index)
         # Aggregate stats in IndexAssignment.csv
         aggregated_assigned_indexes_filtered_sorted = self.aggregate_stats_assigned(
             demux_runmanifest
@@ -1477,9 +1488,7 @@ class Run:
     def update_transfer_log(self):
         """Update transfer log with run id and date."""
         try:
-            with open(self.transfer_file, "a") as f:
-                tsv_writer = csv.writer(f, delimiter="\t")
-                tsv_writer.writerow([self.NGI_run_id, str(datetime.now())])
+            get_ledger(self.transfer_file).add(self.NGI_run_id, str(datetime.now()))
         except OSError:
             msg = f"{self}: Could not update the transfer logfile {self.transfer_file}"
             logger.error(msg)
@@ -0,0 +1,56 @@
+"""In-memory index of the FastQ files written by bases2fastq."""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Lane and read label of FastQ files named with --legacy-fastq,
+# e.g. P12345_1001_S1_L001_R1_001.fastq.gz
+FASTQ_NAME_PAT = re.compile(r"L00(\d+)_(.*?)_001\.fastq\.gz$")
+
+
+def _scan_fastq(dir, project, sample, index):
+    with os.scandir(dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if sample is None:
+                    _scan_fastq(entry.path, project, entry.name, index)
+                continue
+            match = FASTQ_NAME_PAT.search(entry.name)
+            if match:
+                lane, read_label = match.groups()
+                index.setdefault((project, sample, lane), {})[read_label] = entry.path
+
+
+def index_fastq(samples_dir):
+    """Index the FastQ files of a sub-demultiplexing with a single scan.
+
+    The files are found under <samples_dir>/<project>/<sample>/, or directly
+    under <samples_dir>/<project>/ for the undetermined reads, in which case
+    the sample is None.
+
+    :param str samples_dir: The Samples folder of a sub-demultiplexing
+    :returns: A dict {(project, sample, lane): {read_label: path}}, e.g.
+        {("P12345", "P12345_1001", "1"): {"R1": ".../P12345_1001_S1_L001_R1_001.fastq.gz"}}
+    """
+    index = {}
+    if not os.path.isdir(samples_dir):
+        return index
+    with os.scandir(samples_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                _scan_fastq(entry.path, entry.name, None, index)
+    return index
+
+
+def create_symlinks(links, workers=8):
+    """Create symlinks using a pool of threads.
+
+    :param list links: (source, link path) tuples
+    :param int workers: the number of symlinks created concurrently
+    :raises OSError: if a symlink cannot be created
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results to raise the first error, if any
+        for _ in executor.map(lambda link: os.symlink(*link), links):
+            pass
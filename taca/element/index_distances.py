@@ -0,0 +1,89 @@
+"""Minimum pairwise distances between the index sequences of a lane."""
+
+import numpy as np
+from Levenshtein import distance
+
+
+def encode_indexes(indexes: list[str]) -> np.ndarray:
+    """Encode index sequences of equal length as a 2D array of uint8 bytes."""
+    if not indexes:
+        return np.zeros((0, 0), dtype=np.uint8)
+    return np.frombuffer("".join(indexes).encode("ascii"), dtype=np.uint8).reshape(
+        len(indexes), -1
+    )
+
+
+def min_hamming_distance(encoded: np.ndarray, block_size: int = 256) -> int | None:
+    """Return the minimum Hamming distance between the rows of an encoded array.
+
+    Rows are compared a block at a time against all following rows, so that
+    memory use stays bounded by block_size * rows * index length.
+
+    :returns: The minimum distance, or None if there are fewer than two rows
+    """
+    n = len(encoded)
+    if n < 2:
+        return None
+    min_dist = encoded.shape[1]
+    for start in range(0, n - 1, block_size):
+        block = encoded[start : start + block_size]
+        dists = (block[:, None, :] != encoded[None, start:, :]).sum(axis=2)
+        # Only count each pair once, and not rows against themselves
+        dists[np.tril_indices(len(block), 0, dists.shape[1])] = encoded.shape[1] + 1
+        min_dist = min(min_dist, int(dists.min()))
+        if min_dist == 0:
+            break
+    return min_dist
+
+
+def _deletion_variants(seq: str, max_deletions: int) -> set[str]:
+    """Return all strings obtained by deleting up to max_deletions bases."""
+    variants = {seq}
+    current = {seq}
+    for _ in range(max_deletions):
+        current = {
+            variant[:i] + variant[i + 1 :]
+            for variant in current
+            for i in range(len(variant))
+        }
+        variants |= current
+    return variants
+
+
+def min_distance_at_most(indexes: list[str], max_distance: int) -> bool:
+    """Whether the edit distance between any two indexes is at most max_distance.
+
+    This gives the same answer as comparing the Levenshtein distance of all
+    pairs of indexes, without doing so:
+
+    - Identical indexes are found with a set.
+    - Indexes of equal length are compared on their Hamming distance, which
+      is an upper bound of their edit distance, with vectorized NumPy.
+    - The remaining candidates are indexes sharing a sequence obtained by
+      deleting up to max_distance bases from each. Two indexes within
+      max_distance edits always share one, as every substitution, insertion
+      or deletion can be undone by deleting a base on one or both sides.
+      The edit distance is only computed for these candidates.
+    """
+    distinct = set(indexes)
+    if len(distinct) < len(indexes):
+        return True
+
+    by_length: dict[int, list[str]] = {}
+    for index in distinct:
+        by_length.setdefault(len(index), []).append(index)
+    for same_length in by_length.values():
+        min_dist = min_hamming_distance(encode_indexes(same_length))
+        if min_dist is not None and min_dist <= max_distance:
+            return True
+
+    seen_variants: dict[str, list[str]] = {}
+    for index in distinct:
+        candidates: set[str] = set()
+        for variant in _deletion_variants(index, max_distance):
+            candidates.update(seen_variants.get(variant, ()))
+            seen_variants.setdefault(variant, []).append(index)
+        for candidate in candidates:
+            if distance(index, candidate) <= max_distance:
+                return True
+    return False
@@ -3,8 +3,7 @@ import os
 import re
 import shutil
 
-from flowcell_parser.classes import SampleSheetParser
-
+from taca.illumina.samplesheet import SampleSheet
 from taca.illumina.Standard_Runs import Standard_Run
 
 logger = logging.getLogger(__name__)
@@ -59,7 +58,7 @@ class MiSeq_Run(Standard_Run):
             raise RuntimeError
         if ssname is None:
             return None
-        ssparser = SampleSheetParser(ssname)
+        ssparser = SampleSheet.from_parser(self._parse_samplesheet(ssname))
         self.sample_table = self._classify_samples(indexfile, ssparser, runSetup)
         # Copy the original samplesheet locally.
         # Copy again if already done as there might have been changes to the samplesheet
@@ -98,13 +97,7 @@ class MiSeq_Run(Standard_Run):
         )
         # SampleSheet.csv generated
         # When demultiplexing SampleSheet.csv is the one I need to use
-        self.runParserObj.samplesheet = SampleSheetParser(
-            os.path.join(self.run_dir, "SampleSheet_copy.csv")
-        )
-        if not self.runParserObj.obj.get("samplesheet_csv"):
-            self.runParserObj.obj["samplesheet_csv"] = (
-                self.runParserObj.samplesheet.data
-            )
+        self.runParserObj.samplesheet = self._read_samplesheet(samplesheet_dest)
 
     def _generate_clean_samplesheet(
         self,
@@ -126,6 +119,7 @@ class MiSeq_Run(Standard_Run):
         index_dict_tenX = self._parse_10X_indexes(indexfile["tenX"])
         index_dict_smartseq = self._parse_smartseq_indexes(indexfile["smartseq"])
         # Replace 10X or Smart-seq indices
+        new_samples = []
         for sample in ssparser.data:
             if sample["index"] in index_dict_tenX.keys():
                 tenX_index = sample["index"]
@@ -147,9 +141,9 @@ class MiSeq_Run(Standard_Run):
                     x = 0
                     indices_number = len(index_dict_tenX[tenX_index])
                     while x < indices_number - 1:
-                        new_sample = dict(sample)
+                        new_sample = sample.copy()
                         new_sample["index"] = index_dict_tenX[tenX_index][x]
-                        ssparser.data.append(new_sample)
+                        new_samples.append(new_sample)
                         x += 1
                     # Set the original 10X index to the 4th correct index
                     sample["index"] = index_dict_tenX[tenX_index][x]
@@ -158,7 +152,7 @@ class MiSeq_Run(Standard_Run):
                 smartseq_index = sample["index"].split("-")[1]
                 indices_number = len(index_dict_smartseq[smartseq_index])
                 while x < indices_number - 1:
-                    new_sample = dict(sample)
+                    new_sample = sample.copy()
                     new_sample["index"] = index_dict_smartseq[smartseq_index][x][0]
                     new_sample["index2"] = "".join(
                         reversed(
@@ -170,7 +164,7 @@ class MiSeq_Run(Standard_Run):
                             ]
                         )
                     )
-                    ssparser.data.append(new_sample)
+                    new_samples.append(new_sample)
                     x += 1
                 sample["index"] = index_dict_smartseq[smartseq_index][x][0]
                 sample["index2"] = "".join(
@@ -186,7 +180,10 @@ class MiSeq_Run(Standard_Run):
 
         # Sort to get the added indicies from 10x in the right place
         # Python 3 doesn't support sorting a list of dicts implicitly. Sort by lane and then Sample_ID
-        ssparser.data.sort(key=lambda item: (item.get("Lane"), item.get("Sample_ID")))
+        ssparser.data = sorted(
+            ssparser.data + new_samples,
+            key=lambda item: (item.get("Lane"), item.get("Sample_ID")),
+        )
 
         if not fields_to_remove:
             fields_to_remove = []
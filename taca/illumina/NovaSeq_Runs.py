@@ -88,43 +88,33 @@ class NovaSeq_Run(Standard_Run):
             datafields.append(field)
         output += ",".join(datafields)
         output += os.linesep
-        for line in ssparser.data:
-            sample_name = line.get("Sample_Name") or line.get("SampleName")
-            lane = line["Lane"]
+        for line in ssparser.subset(samples_to_include).data:
             noindex_flag = False
-            if lane in samples_to_include.keys():
-                if sample_name in samples_to_include.get(lane):
-                    line_ar = []
-                    for field in datafields:
-                        # Case with NoIndex
-                        if field == "index" and "NOINDEX" in line["index"].upper():
-                            line[field] = (
-                                "T" * index_cycles[0] if index_cycles[0] != 0 else ""
-                            )
-                            noindex_flag = True
-                        if field == "index2" and noindex_flag:
-                            if software == "bclconvert":
-                                line[field] = (
-                                    "T" * index_cycles[1]
-                                    if index_cycles[1] != 0
-                                    else ""
-                                )
-                            else:
-                                line[field] = (
-                                    "A" * index_cycles[1]
-                                    if index_cycles[1] != 0
-                                    else ""
-                                )
-                            noindex_flag = False
-                        # Case of IDT UMI
-                        if (
-                            field == "index" or field == "index2"
-                        ) and IDT_UMI_PAT.findall(line[field]):
-                            line[field] = line[field].replace("N", "")
-                        # Convert Index 2 into RC for NextSeq, NovaSeq and NovaSeqXPlus for BCL Convert
-                        if field == "index2" and software == "bclconvert":
-                            line[field] = self._revcomp(line[field])
-                        line_ar.append(line[field])
-                    output += ",".join(line_ar)
-                    output += os.linesep
+            line_ar = []
+            for field in datafields:
+                # Case with NoIndex
+                if field == "index" and "NOINDEX" in line["index"].upper():
+                    line[field] = "T" * index_cycles[0] if index_cycles[0] != 0 else ""
+                    noindex_flag = True
+                if field == "index2" and noindex_flag:
+                    if software == "bclconvert":
+                        line[field] = (
+                            "T" * index_cycles[1] if index_cycles[1] != 0 else ""
+                        )
+                    else:
+                        line[field] = (
+                            "A" * index_cycles[1] if index_cycles[1] != 0 else ""
+                        )
+                    noindex_flag = False
+                # Case of IDT UMI
+                if (field == "index" or field == "index2") and IDT_UMI_PAT.findall(
+                    line[field]
+                ):
+                    line[field] = line[field].replace("N", "")
+                # Convert Index 2 into RC for NextSeq, NovaSeq and NovaSeqXPlus for BCL Convert
+                if field == "index2" and software == "bclconvert":
+                    line[field] = self._revcomp(line[field])
+                line_ar.append(line[field])
+            output += ",".join(line_ar)
+            output += os.linesep
         return output
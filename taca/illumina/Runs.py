@@ -1,4 +1,3 @@
-import csv
 import glob
 import json
 import logging
@@ -6,15 +5,192 @@ import os
 import re
 import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from flowcell_parser.classes import LaneBarcodeParser, RunParser, SampleSheetParser
-
+from flowcell_parser.classes import (
+    LaneBarcodeParser,
+    RunInfoParser,
+    RunParser,
+    SampleSheetParser,
+)
+
+from taca.illumina import interop, lane_reports, transfer_chunks
+from taca.illumina.barcodes import KnownIndexPrefixes
+from taca.illumina.demux_logs import DemuxLogScanner
+from taca.illumina.samplesheet import SampleSheet
 from taca.utils import misc
+from taca.utils.job_scheduler import get_job_scheduler
+from taca.utils.metadata_cache import (
+    RunMetadataCache,
+    file_fingerprint,
+    get_run_metadata_cache,
+)
 from taca.utils.misc import send_mail
+from taca.utils.transfer_ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
+# Keeps track of the sub-demultiplexings already aggregated into Demultiplexing
+AGGREGATION_STATE_FILE = ".demux_aggregation_state"
+# Stats.json of the finished sub-demultiplexings merged so far
+AGGREGATION_STATS_FILE = ".demux_aggregation_stats.json"
+# Scan state of the demultiplexing log, kept in each Demultiplexing_<N> folder.
+# Its name matches the Demultiplexing_*/*_* exclude of the transfers
+DEMUX_LOG_SCAN_STATE_FILE = ".demux_log_scan_state"
+
+
+class LazyRunParser:
+    """Lazily parsed run folder, exposing the parts of RunParser used by TACA.
+
+    RunInfo.xml, SampleSheet.csv, Stats.json and the laneBarcode.html report
+    are each parsed on first access and memoized. The statusdb document ``obj``
+    requires a full RunParser and is only built when it is accessed. Parsed
+    parts are also stored in the run metadata cache, if one is given.
+    """
+
+    def __init__(
+        self,
+        run_dir,
+        run_id,
+        flowcell_id,
+        demux_dir="Demultiplexing",
+        metadata_cache=None,
+    ):
+        self.path = run_dir
+        self.run_id = run_id
+        self.flowcell_id = flowcell_id
+        self.demux_dir = demux_dir
+        self.metadata_cache = metadata_cache or RunMetadataCache()
+        self._parsed = {}
+
+    def _get(self, name, sources, parse):
+        if name not in self._parsed:
+            self._parsed[name] = self.metadata_cache.get(
+                self.run_id, name, sources, parse
+            )
+        return self._parsed[name]
+
+    def _report_path(self, report):
+        return os.path.join(
+            self.path,
+            self.demux_dir,
+            "Reports",
+            "html",
+            self.flowcell_id,
+            "all",
+            "all",
+            "all",
+            report,
+        )
+
+    @property
+    def runinfo(self):
+        runinfo_path = os.path.join(self.path, "RunInfo.xml")
+        return self._get(
+            "RunInfoParser", [runinfo_path], lambda: RunInfoParser(runinfo_path)
+        )
+
+    @property
+    def samplesheet(self):
+        samplesheet_path = os.path.join(self.path, "SampleSheet.csv")
+        # Not under the SampleSheet_<name> keys of Run._read_samplesheet, which
+        # reads samplesheets with SampleSheet.read instead of SampleSheetParser
+        return self._get(
+            "SampleSheetParser_model",
+            [samplesheet_path],
+            lambda: (
+                SampleSheet.from_parser(SampleSheetParser(samplesheet_path))
+                if os.path.exists(samplesheet_path)
+                else None
+            ),
+        )
+
+    @samplesheet.setter
+    def samplesheet(self, samplesheet):
+        self._parsed["SampleSheetParser_model"] = samplesheet
+
+    @property
+    def stats_json(self):
+        """Content of Stats.json in the demultiplexing folder, or None."""
+        stats_path = os.path.join(self.path, self.demux_dir, "Stats", "Stats.json")
+
+        def _load():
+            if not os.path.exists(stats_path):
+                return None
+            with open(stats_path) as stats_json:
+                return json.load(stats_json)
+
+        return self._get("Stats.json", [stats_path], _load)
+
+    @property
+    def lanebarcodes(self):
+        lanebarcode_path = self._report_path("laneBarcode.html")
+        return self._get(
+            "LaneBarcodeParser",
+            [lanebarcode_path],
+            lambda: (
+                LaneBarcodeParser(lanebarcode_path)
+                if os.path.exists(lanebarcode_path)
+                else None
+            ),
+        )
+
+    @property
+    def obj_sources(self):
+        """Paths the statusdb document ``obj`` is built from."""
+        demux_path = os.path.join(self.path, self.demux_dir)
+        return [
+            self.path,
+            os.path.join(self.path, "RunInfo.xml"),
+            # Named RunParameters.xml by e.g. NovaSeq X and NextSeq 2000
+            os.path.join(self.path, "runParameters.xml"),
+            os.path.join(self.path, "RunParameters.xml"),
+            os.path.join(self.path, "SampleSheet.csv"),
+            os.path.join(self.path, "Logs", "CycleTimes.txt"),
+            demux_path,
+            os.path.join(demux_path, "Stats"),
+            os.path.join(demux_path, "Stats", "Stats.json"),
+            self._report_path("laneBarcode.html"),
+            self._report_path("lane.html"),
+        ]
+
+    @property
+    def obj(self):
+        """The statusdb document of the run, built by a full RunParser."""
+        if "obj" not in self._parsed:
+            obj = self._get(
+                "RunParser", self.obj_sources, lambda: RunParser(self.path)
+            ).obj
+            # Fall back to the samplesheet set by the run if RunParser found none
+            if not obj.get("samplesheet_csv") and self.samplesheet:
+                obj["samplesheet_csv"] = self.samplesheet.to_dicts()
+            self._parsed["obj"] = obj
+        return self._parsed["obj"]
+
+
+class RunStateSnapshot:
+    """Indicator files of a run folder, collected with a single scan.
+
+    The run folder is listed once with os.scandir and the demultiplexing stats
+    are only looked for if the demultiplexing folder is present.
+    """
+
+    def __init__(self, run_dir, demux_dir):
+        with os.scandir(run_dir) as entries:
+            run_entries = {entry.name: entry for entry in entries}
+        self.sequencing_done = (
+            "RTAComplete.txt" in run_entries and "CopyComplete.txt" in run_entries
+        )
+        self.transferring = "transferring" in run_entries
+        self.demultiplexing_started = (
+            demux_dir in run_entries and run_entries[demux_dir].is_dir()
+        )
+        self.demultiplexing_done = self.demultiplexing_started and os.path.exists(
+            os.path.join(run_dir, demux_dir, "Stats", "Stats.json")
+        )
+
 
 class Run:
     """Defines an Illumina run"""
@@ -57,11 +233,67 @@ class Run:
         self.demux_dir = "Demultiplexing"
         self.legacy_dir = "legacy"
         self.demux_summary = dict()
-        self.runParserObj = RunParser(self.run_dir)
+        self.metadata_cache = get_run_metadata_cache()
+        self.runParserObj = self._parse_run()
+        self._state = None
         # This flag tells TACA to move demultiplexed files to the analysis server
         self.transfer_to_analysis_server = True
         # Probably worth to add the samplesheet name as a variable too
 
+    def _parse_run(self):
+        """Return a lazily parsed view of the run folder."""
+        return LazyRunParser(
+            self.run_dir,
+            self.id,
+            self.flowcell_id,
+            demux_dir=self.demux_dir,
+            metadata_cache=self.metadata_cache,
+        )
+
+    def get_state(self):
+        """Return a snapshot of the run folder indicator files.
+
+        The snapshot is taken on first use and kept until invalidate_state is
+        called by a step that changes the run folder.
+        """
+        if self._state is None:
+            self._state = RunStateSnapshot(self.run_dir, self._get_demux_folder())
+        return self._state
+
+    def invalidate_state(self):
+        self._state = None
+
+    def _parse_samplesheet(self, samplesheet):
+        """Parse a samplesheet, reusing the cached result if it is unchanged."""
+        return self.metadata_cache.get(
+            self.id,
+            f"SampleSheetParser_{os.path.basename(samplesheet)}",
+            [samplesheet],
+            lambda: SampleSheetParser(samplesheet),
+        )
+
+    def _read_samplesheet(self, samplesheet):
+        """Read a samplesheet written by TACA into a SampleSheet model.
+
+        The model stored by :meth:`_store_samplesheet` when the samplesheet was
+        written is reused as long as the file is unchanged.
+        """
+        return self.metadata_cache.get(
+            self.id,
+            f"SampleSheet_{os.path.basename(samplesheet)}",
+            [samplesheet],
+            lambda: SampleSheet.read(samplesheet),
+        )
+
+    def _store_samplesheet(self, samplesheet, model):
+        """Store the model of a samplesheet just written to disk."""
+        self.metadata_cache.write(
+            self.id,
+            f"SampleSheet_{os.path.basename(samplesheet)}",
+            file_fingerprint([samplesheet]),
+            model,
+        )
+
     def demultiplex_run(self):
         raise NotImplementedError("Please Implement this method")
 
@@ -71,6 +303,10 @@ class Run:
         In the case of HiSeq check that all demux have been done and in that case perform aggregation
         """
         dex_status = self.get_run_status()
+        # Start the queued sub-demultiplexings as running ones finish
+        scheduler = get_job_scheduler()
+        if scheduler:
+            scheduler.dispatch()
         if self.software == "bcl2fastq":
             legacy_path = ""
         elif self.software == "bclconvert":
@@ -81,6 +317,7 @@ class Run:
             os.path.join(self.run_dir, "*_[0-9].csv")
         )  # A single digit, this hypothesis should hold for a while
         all_demux_done = True
+        finished_demux_ids = []
         for samplesheet in samplesheets:
             demux_id = os.path.splitext(os.path.split(samplesheet)[1])[0].split("_")[1]
             demux_folder = os.path.join(self.run_dir, f"Demultiplexing_{demux_id}")
@@ -95,6 +332,7 @@ class Run:
                 )
             ):
                 all_demux_done = all_demux_done and True
+                finished_demux_ids.append(demux_id)
                 if self.software == "bcl2fastq":
                     demux_log = os.path.join(
                         self.run_dir, f"demux_{demux_id}_bcl2fastq.err"
@@ -132,16 +370,20 @@ class Run:
                 all_demux_done = all_demux_done and False
                 logger.info(f"Sub-Demultiplexing in {demux_folder} not completed yet.")
 
+        # Fold the results of the finished sub-demultiplexings into Demultiplexing
+        # already, so that only the remaining ones are left for the final aggregation
+        if not all_demux_done and finished_demux_ids and len(samplesheets) > 1:
+            self._aggregate_finished_sub_demuxes(samplesheets, finished_demux_ids)
+
         # All demux jobs finished and all stats aggregated under Demultiplexing
         # Aggreate all the results in the Demultiplexing folder
         if all_demux_done and dex_status != "COMPLETED":
             dex_status = "COMPLETED"
             self._aggregate_demux_results()
-            self.runParserObj = RunParser(self.run_dir)
+            self.invalidate_state()
+            self.runParserObj = self._parse_run()
             # Rename undetermined if needed
-            lanes = misc.return_unique(
-                [lanes["Lane"] for lanes in self.runParserObj.samplesheet.data]
-            )
+            lanes = self.runParserObj.samplesheet.lanes
             samples_per_lane = self.get_samples_per_lane()
             for lane in lanes:
                 if self.is_unpooled_lane(lane):
@@ -152,39 +394,33 @@ class Run:
         """
         This function checks the log files of bcl2fastq/bclconvert
         Errors or warnings will be captured and email notifications will be sent
+        The logs are scanned incrementally, only reading what was appended since the last check.
+        The scan state is kept in the Demultiplexing_<N> folder, not in the run folder whose
+        mtime is part of the fingerprint of the run metadata
         """
-        with open(demux_log) as demux_log_file:
-            demux_log_content = demux_log_file.readlines()
-            if self.software == "bcl2fastq":
-                pattern = r"Processing completed with (\d+) errors and (\d+) warnings"
-                match = re.search(pattern, demux_log_content[-1])
-                if match:
-                    errors = int(match.group(1))
-                    warnings = int(match.group(2))
-                    error_and_warning_messages = []
-                    if errors or warnings:
-                        for line in demux_log_content:
-                            if "ERROR" in line or "WARN" in line:
-                                error_and_warning_messages.append(line)
-                    return errors, warnings, error_and_warning_messages
-                else:
-                    raise RuntimeError(
-                        f"Bad format with log file demux_{demux_id}_bcl2fastq.err"
-                    )
-            elif self.software == "bclconvert":
-                errors = 0
-                warnings = 0
+        scanner = DemuxLogScanner(
+            demux_log,
+            self.software,
+            state_file=os.path.join(
+                self.run_dir, f"Demultiplexing_{demux_id}", DEMUX_LOG_SCAN_STATE_FILE
+            ),
+        )
+        if self.software == "bcl2fastq":
+            pattern = r"Processing completed with (\d+) errors and (\d+) warnings"
+            match = re.search(pattern, scanner.last_line())
+            if match:
+                errors = int(match.group(1))
+                warnings = int(match.group(2))
                 error_and_warning_messages = []
-                for line in demux_log_content:
-                    if "ERROR" in line:
-                        errors += 1
-                        error_and_warning_messages.append(line)
-                    elif "WARNING" in line:
-                        warnings += 1
-                        error_and_warning_messages.append(line)
+                if errors or warnings:
+                    error_and_warning_messages = scanner.scan()[2]
                 return errors, warnings, error_and_warning_messages
             else:
-                raise RuntimeError("Unrecognized software!")
+                raise RuntimeError(
+                    f"Bad format with log file demux_{demux_id}_bcl2fastq.err"
+                )
+        else:
+            return scanner.scan()
 
     def _set_run_type(self):
         raise NotImplementedError("Please Implement this method")
@@ -204,11 +440,8 @@ class Run:
         else:
             raise RuntimeError("demux_folder not yet available!!")
 
-    def _get_samplesheet(self):
-        """
-        Locate and parse the samplesheet for a run. The idea is that there is a folder in
-        samplesheet_folders that contains a samplesheet named flowecell_id.csv.
-        """
+    def _samplesheet_path(self):
+        """Return the path of the samplesheet of the run in samplesheets_dir."""
         try:
             # Only implemented for some, (e.g. NovaSeqXPlus)
             # Will raise AttributeError if not implemented.
@@ -217,7 +450,14 @@ class Run:
             current_year = "20" + self.id[0:2]
 
         samplesheets_dir = os.path.join(self.CONFIG["samplesheets_dir"], current_year)
-        ssname = os.path.join(samplesheets_dir, f"{self.flowcell_id}.csv")
+        return os.path.join(samplesheets_dir, f"{self.flowcell_id}.csv")
+
+    def _get_samplesheet(self):
+        """
+        Locate and parse the samplesheet for a run. The idea is that there is a folder in
+        samplesheet_folders that contains a samplesheet named flowecell_id.csv.
+        """
+        ssname = self._samplesheet_path()
         if os.path.exists(ssname):
             return ssname
         else:
@@ -228,18 +468,36 @@ class Run:
                 f"Not able to find samplesheet {self.flowcell_id}.csv in {self.CONFIG['samplesheets_dir']}"
             )
 
-    def _is_demultiplexing_done(self):
-        return os.path.exists(
-            os.path.join(self.run_dir, self._get_demux_folder(), "Stats", "Stats.json")
+    def get_interop_summary(self):
+        """Summarize the InterOp metrics of the run per lane, see
+        :func:`taca.illumina.interop.summarize_interop`.
+        """
+        return interop.summarize_interop(os.path.join(self.run_dir, "InterOp"))
+
+    def get_statusdb_sources(self):
+        """Return the paths the statusdb document of the run is built from.
+
+        Besides the sources of the RunParser document, these are the InterOp
+        files of the summary and the samplesheet in samplesheets_dir, which the
+        document falls back to.
+        """
+        return (
+            self.runParserObj.obj_sources
+            + [
+                os.path.join(self.run_dir, "InterOp", name)
+                for name in interop.SUMMARY_FILES
+            ]
+            + [self._samplesheet_path()]
         )
 
+    def _is_demultiplexing_done(self):
+        return self.get_state().demultiplexing_done
+
     def _is_demultiplexing_started(self):
-        return os.path.exists(os.path.join(self.run_dir, self._get_demux_folder()))
+        return self.get_state().demultiplexing_started
 
     def _is_sequencing_done(self):
-        return os.path.exists(
-            os.path.join(self.run_dir, "RTAComplete.txt")
-        ) and os.path.exists(os.path.join(self.run_dir, "CopyComplete.txt"))
+        return self.get_state().sequencing_done
 
     def get_run_status(self):
         """Return the current status of the run."""
@@ -299,20 +557,20 @@ class Run:
         # Add R/W permissions to the group
         command_line.append("--chmod=g+rw")
         # This horrible thing here avoids data dup when we use multiple indexes in a lane/FC
-        command_line.append("--exclude=Demultiplexing_*/*_*")
-        command_line.append("--include=*/")
+        filter_options = ["--exclude=Demultiplexing_*/*_*", "--include=*/"]
         for to_include in self.CONFIG["analysis_server"]["sync"]["include"]:
-            command_line.append(f"--include={to_include}")
-        command_line.extend(["--exclude=*", "--prune-empty-dirs"])
+            filter_options.append(f"--include={to_include}")
+        filter_options.append("--exclude=*")
         r_user = self.CONFIG["analysis_server"]["user"]
         r_host = self.CONFIG["analysis_server"]["host"]
         r_dir = self.CONFIG["analysis_server"]["sync"]["data_archive"]
         remote = f"{r_user}@{r_host}:{r_dir}"
-        command_line.extend([self.run_dir, remote])
+        streams = self.CONFIG["analysis_server"]["sync"].get("streams", 1)
 
         # Create temp file indicating that the run is being transferred
         try:
             open(os.path.join(self.run_dir, "transferring"), "w").close()
+            self.invalidate_state()
         except OSError as e:
             logger.error(
                 f"Cannot create a file in {self.id}. "
@@ -324,13 +582,19 @@ class Run:
         # In this particular case we want to capture the exception because we want
         # to delete the transfer file
         try:
-            msge_text = f"I am about to transfer with this command \n{command_line}"
-            logger.info(msge_text)
-            misc.call_external_command(
-                command_line, with_log_files=True, prefix="", log_dir=self.run_dir
-            )
+            if streams > 1:
+                self._transfer_run_chunks(command_line, filter_options, remote, streams)
+            else:
+                command_line.extend(filter_options)
+                command_line.extend(["--prune-empty-dirs", self.run_dir, remote])
+                msge_text = f"I am about to transfer with this command \n{command_line}"
+                logger.info(msge_text)
+                misc.call_external_command(
+                    command_line, with_log_files=True, prefix="", log_dir=self.run_dir
+                )
         except subprocess.CalledProcessError as exception:
             os.remove(os.path.join(self.run_dir, "transferring"))
+            self.invalidate_state()
             # Send an email notifying that the transfer failed
             runname = self.id
             sbt = f"Rsync of run {runname} failed"
@@ -343,10 +607,9 @@ class Run:
             raise exception
 
         logger.info(f"Adding run {self.id} to {t_file}")
-        with open(t_file, "a") as tranfer_file:
-            tsv_writer = csv.writer(tranfer_file, delimiter="\t")
-            tsv_writer.writerow([self.id, str(datetime.now())])
+        get_ledger(t_file).add(self.id, str(datetime.now()))
         os.remove(os.path.join(self.run_dir, "transferring"))
+        self.invalidate_state()
 
         # Send an email notifying that the transfer was successful
         runname = self.id
@@ -358,6 +621,58 @@ class Run:
         if mail_recipients:
             send_mail(sbt, msg, mail_recipients)
 
+    def _transfer_run_chunks(self, command_line, filter_options, remote, streams):
+        """Transfer the run with concurrent rsyncs, one per chunk of the run folder.
+
+        The run is split into one chunk per project, one per lane for the files
+        directly under Demultiplexing and one for the rest. The largest chunks
+        are started first and each rsync logs to transfer_<chunk>_rsync.out/.err.
+
+        :raises subprocess.CalledProcessError: If the transfer of any chunk failed,
+            after all chunks have been attempted
+        """
+        source_root = os.path.dirname(os.path.normpath(self.run_dir))
+        chunks = transfer_chunks.partition_run_files(
+            transfer_chunks.list_transfer_files(self.run_dir, filter_options)
+        )
+        chunk_names = sorted(
+            chunks,
+            key=lambda name: transfer_chunks.chunk_size(source_root, chunks[name]),
+            reverse=True,
+        )
+        logger.info(
+            f"Transferring run {self.id} in {len(chunks)} chunks "
+            f"with {streams} concurrent rsyncs"
+        )
+
+        def transfer_chunk(name, files_from):
+            chunk_command = command_line + [
+                f"--files-from={files_from}",
+                source_root,
+                remote,
+            ]
+            logger.info(f"Transferring chunk {name} with command {chunk_command}")
+            misc.call_external_command(
+                chunk_command,
+                with_log_files=True,
+                prefix=f"transfer_{name}",
+                log_dir=self.run_dir,
+            )
+
+        with tempfile.TemporaryDirectory() as lists_dir:
+            futures = {}
+            with ThreadPoolExecutor(max_workers=streams) as executor:
+                for name in chunk_names:
+                    files_from = os.path.join(lists_dir, f"{name}.txt")
+                    with open(files_from, "w") as fh:
+                        fh.writelines(f"{path}\n" for path in chunks[name])
+                    futures[name] = executor.submit(transfer_chunk, name, files_from)
+            failed = [name for name, future in futures.items() if future.exception()]
+        if failed:
+            for name in failed:
+                logger.error(f"Transfer of chunk {name} of run {self.id} failed")
+            raise futures[failed[0]].exception()
+
     def archive_run(self, destination):
         """Move run to the archive folder
         :param str destination: the destination folder
@@ -381,15 +696,9 @@ class Run:
         :param str transfer_file: Path to file with information about transferred runs
         """
         try:
-            with open(transfer_file) as file_handle:
-                transfer_file_contents = csv.reader(file_handle, delimiter="\t")
-                for row in transfer_file_contents:
-                    # Rows have two columns: run and transfer date
-                    if row[0] == os.path.basename(self.id):
-                        return True
-            if os.path.exists(os.path.join(self.run_dir, "transferring")):
+            if os.path.basename(self.id) in get_ledger(transfer_file):
                 return True
-            return False
+            return self.get_state().transferring
         except OSError:
             return False
 
@@ -400,11 +709,7 @@ class Run:
         :rtype: boolean
         :returns: True if the samplesheet has one entry for that lane, False otherwise
         """
-        count = 0
-        for l in self.runParserObj.samplesheet.data:
-            if l["Lane"] == lane:
-                count += 1
-        return count == 1
+        return len(self.runParserObj.samplesheet.rows_in_lane(lane)) == 1
 
     def get_samples_per_lane(self):
         """
@@ -450,39 +755,36 @@ class Run:
             )
             os.rename(file, os.path.join(os.path.dirname(file), new_name))
 
-    def _classify_lanes(self, samplesheets):
+    def _parse_sub_samplesheets(self, samplesheets):
+        """Parse the sub-samplesheets of a run.
+
+        :param list samplesheets: Paths to the sub-samplesheets
+        :returns: A dict with the SampleSheet model of each demux id
+        """
+        sub_samplesheets = dict()
+        for samplesheet in samplesheets:
+            demux_id = os.path.splitext(os.path.split(samplesheet)[1])[0].split("_")[1]
+            sub_samplesheets[demux_id] = self._read_samplesheet(samplesheet)
+        return sub_samplesheets
+
+    def _classify_lanes(self, sub_samplesheets):
         # Prepare a list for lanes with NoIndex samples
         noindex_lanes = []
         for entry in self.runParserObj.samplesheet.data:
-            if not entry.get("index"):
-                entry["index"] = ""
-            if not entry.get("index2"):
-                entry["index2"] = ""
-            if entry["index"].upper() == "NOINDEX" or (
-                entry["index"] == "" and entry["index2"] == ""
-            ):
+            index = entry.get("index") or ""
+            index2 = entry.get("index2") or ""
+            if index.upper() == "NOINDEX" or (index == "" and index2 == ""):
                 noindex_lanes.append(entry["Lane"])
         # Prepare a dict with the lane, demux_id and index_length info based on the sub-samplesheets
         # This is for the purpose of deciding simple_lanes and complex_lanes, plus we should start with the Stats.json file from which demux_id for each lane
         lane_demuxid_indexlength = dict()
-        for samplesheet in samplesheets:
-            demux_id = os.path.splitext(os.path.split(samplesheet)[1])[0].split("_")[1]
-            ssparser = SampleSheetParser(samplesheet)
-            for row in ssparser.data:
-                if row["Lane"] not in lane_demuxid_indexlength.keys():
-                    lane_demuxid_indexlength[row["Lane"]] = {
-                        demux_id: [
-                            len(row.get("index", "")),
-                            len(row.get("index2", "")),
-                        ]
-                    }
-                elif demux_id not in lane_demuxid_indexlength[row["Lane"]].keys():
-                    lane_demuxid_indexlength[row["Lane"]][demux_id] = [
-                        len(row.get("index", "")),
-                        len(row.get("index2", "")),
-                    ]
-                else:
-                    pass
+        for demux_id, ssparser in sub_samplesheets.items():
+            for lane in ssparser.lanes:
+                row = ssparser.rows_in_lane(lane)[0]
+                lane_demuxid_indexlength.setdefault(lane, {})[demux_id] = [
+                    len(row.get("index", "")),
+                    len(row.get("index2", "")),
+                ]
 
         simple_lanes = dict()
         complex_lanes = dict()
@@ -730,48 +1032,22 @@ class Run:
         html_reports_laneBarcode,
     ):
         # Start with the lane
-        html_report_lane_parser = None
-        for next_html_report_lane in html_reports_lane:
-            if html_report_lane_parser is None:
-                html_report_lane_parser = LaneBarcodeParser(next_html_report_lane)
-            else:
-                lanesInReport = [
-                    Lane["Lane"] for Lane in html_report_lane_parser.sample_data
-                ]
-                next_html_report_lane_parser = LaneBarcodeParser(next_html_report_lane)
-                for entry in next_html_report_lane_parser.sample_data:
-                    if entry["Lane"] not in lanesInReport:
-                        # If this is a new lane not included before
-                        html_report_lane_parser.sample_data.append(entry)
+        lane_parsers = [
+            self._parse_lane_barcode_report(report) for report in html_reports_lane
+        ]
+        html_report_lane_parser = lane_parsers[0]
+        html_report_lane_parser.sample_data = lane_reports.merge_lane_data(
+            parser.sample_data for parser in lane_parsers
+        )
         # Now all lanes have been inserted
 
         # NumberReads for total lane cluster/yields and total sample cluster/yields
-        self.NumberReads_Summary = dict()
         # The numbers in Flowcell Summary also need to be aggregated if multiple demultiplexing is done
-        Clusters_Raw = 0
-        Clusters_PF = 0
-        Yield_Mbases = 0
-        for entry in html_report_lane_parser.sample_data:
-            # Update NumberReads for total lane clusters
-            self.NumberReads_Summary[entry["Lane"]] = {
-                "total_lane_cluster": int(entry["PF Clusters"].replace(",", "")),
-                "total_lane_yield": int(entry["Yield (Mbases)"].replace(",", "")),
-            }
-            Clusters_Raw += int(
-                int(entry["PF Clusters"].replace(",", ""))
-                / float(entry["% PFClusters"])
-                * 100
-            )
-            Clusters_PF += int(entry["PF Clusters"].replace(",", ""))
-            Yield_Mbases += int(entry["Yield (Mbases)"].replace(",", ""))
-            if entry["Lane"] in complex_lanes.keys():
-                entry["% Perfectbarcode"] = None
-                entry["% One mismatchbarcode"] = None
+        self.NumberReads_Summary, flowcell_data = lane_reports.summarize_lanes(
+            html_report_lane_parser.sample_data, complex_lanes
+        )
         # Update the values in Flowcell Summary
-        html_report_lane_parser.flowcell_data["Clusters (Raw)"] = f"{Clusters_Raw:,}"
-        html_report_lane_parser.flowcell_data["Clusters(PF)"] = f"{Clusters_PF:,}"
-        html_report_lane_parser.flowcell_data["Yield (MBases)"] = f"{Yield_Mbases:,}"
-        # Add lanes not present in this demux
+        html_report_lane_parser.flowcell_data.update(flowcell_data)
         # Create the new lane.html
         new_html_report_lane_dir = _create_folder_structure(
             demux_folder, ["Reports", "html", self.flowcell_id, "all", "all", "all"]
@@ -780,128 +1056,50 @@ class Run:
         _generate_lane_html(new_html_report_lane, html_report_lane_parser)
 
         # Generate the laneBarcode
-        html_report_laneBarcode_parser = None
-        for next_html_report_laneBarcode in html_reports_laneBarcode:
-            if html_report_laneBarcode_parser is None:
-                html_report_laneBarcode_parser = LaneBarcodeParser(
-                    next_html_report_laneBarcode
-                )
-            else:
-                # No need to check samples occuring in more than one file as it would be spotted while softlinking
-                next_html_report_laneBarcode_parser = LaneBarcodeParser(
-                    next_html_report_laneBarcode
-                )
-                for entry in next_html_report_laneBarcode_parser.sample_data:
-                    html_report_laneBarcode_parser.sample_data.append(entry)
-        # For complex lanes, set all numbers of undetermined to 0. And only keep one such entry
-        constant_keys = ["Lane", "Barcode sequence", "Project", "Sample"]
-        modified_complex_lanes = []
-        for entry in html_report_laneBarcode_parser.sample_data:
-            if (
-                entry["Lane"] in list(complex_lanes.keys())
-                and entry["Project"] in "default"
-            ):
-                if entry["Lane"] not in modified_complex_lanes:
-                    for key in entry.keys():
-                        if key not in constant_keys:
-                            entry[key] = "0"
-                    modified_complex_lanes.append(entry["Lane"])
-                else:
-                    html_report_laneBarcode_parser.sample_data.remove(entry)
-
-        # Update NumberReads for total sample yields
-        for entry in html_report_laneBarcode_parser.sample_data:
-            if (
-                "total_sample_cluster"
-                not in self.NumberReads_Summary[entry["Lane"]].keys()
-            ):
-                self.NumberReads_Summary[entry["Lane"]]["total_sample_cluster"] = 0
-                self.NumberReads_Summary[entry["Lane"]]["total_sample_yield"] = 0
-                if entry["Project"] != "default":
-                    self.NumberReads_Summary[entry["Lane"]]["total_sample_cluster"] += (
-                        int(entry["PF Clusters"].replace(",", ""))
-                    )
-                    self.NumberReads_Summary[entry["Lane"]]["total_sample_yield"] += (
-                        int(entry["Yield (Mbases)"].replace(",", ""))
-                    )
-            else:
-                if entry["Project"] != "default":
-                    self.NumberReads_Summary[entry["Lane"]]["total_sample_cluster"] += (
-                        int(entry["PF Clusters"].replace(",", ""))
-                    )
-                    self.NumberReads_Summary[entry["Lane"]]["total_sample_yield"] += (
-                        int(entry["Yield (Mbases)"].replace(",", ""))
-                    )
-
-        # Calculate the numbers clusters/yields of undet reads
-        for key, value in self.NumberReads_Summary.items():
-            value["undet_cluster"] = (
-                value["total_lane_cluster"] - value["total_sample_cluster"]
-            )
-            value["undet_yield"] = (
-                value["total_lane_yield"] - value["total_sample_yield"]
+        # No need to check samples occuring in more than one file as it would be spotted while softlinking
+        laneBarcode_parsers = [
+            self._parse_lane_barcode_report(report)
+            for report in html_reports_laneBarcode
+        ]
+        html_report_laneBarcode_parser = laneBarcode_parsers[0]
+        html_report_laneBarcode_parser.sample_data = (
+            lane_reports.merge_lane_barcode_data(
+                [parser.sample_data for parser in laneBarcode_parsers],
+                complex_lanes,
+                self.NumberReads_Summary,
+                # Fix special case that when we assign fake indexes for NoIndex samples
+                noindex_lanes=noindex_lanes if index_cycles != [0, 0] else None,
             )
-
-        # Update the cluster/yield info of undet for complex lanes
-        for entry in html_report_laneBarcode_parser.sample_data:
-            if entry["Project"] == "default" and entry["Lane"] in complex_lanes.keys():
-                entry["PF Clusters"] = "{:,}".format(
-                    self.NumberReads_Summary[entry["Lane"]]["undet_cluster"]
-                )
-                entry["Yield (Mbases)"] = "{:,}".format(
-                    self.NumberReads_Summary[entry["Lane"]]["undet_yield"]
-                )
-
-        # Fix special case that when we assign fake indexes for NoIndex samples
-        if noindex_lanes and index_cycles != [0, 0]:
-            lane_project_sample = dict()
-            for entry in html_report_laneBarcode_parser.sample_data:
-                if entry["Lane"] in noindex_lanes and entry["Sample"] != "Undetermined":
-                    lane_project_sample[entry["Lane"]] = {
-                        "Project": entry["Project"],
-                        "Sample": entry["Sample"],
-                    }
-            for entry in html_report_laneBarcode_parser.sample_data[:]:
-                if entry["Lane"] in noindex_lanes and entry["Sample"] == "Undetermined":
-                    entry["Project"] = lane_project_sample[entry["Lane"]]["Project"]
-                    entry["Sample"] = lane_project_sample[entry["Lane"]]["Sample"]
-                elif (
-                    entry["Lane"] in noindex_lanes and entry["Sample"] != "Undetermined"
-                ):
-                    html_report_laneBarcode_parser.sample_data.remove(entry)
-
-        # Remove the trailing "_SX" postfix from samples names for BCL Convert when it handles SmartSeq3 libraries
-        for entry in html_report_laneBarcode_parser.sample_data:
-            if "_S" in entry["Sample"]:
-                entry["Sample"] = "_".join(entry["Sample"].split("_")[:2])
-
-        # Sort sample_data: first by lane then by sample ID
-        html_report_laneBarcode_parser.sample_data = sorted(
-            html_report_laneBarcode_parser.sample_data,
-            key=lambda k: (k["Lane"].lower(), k["Sample"]),
         )
 
         # Update the values in Flowcell Summary
-        html_report_laneBarcode_parser.flowcell_data["Clusters (Raw)"] = (
-            f"{Clusters_Raw:,}"
-        )
-        html_report_laneBarcode_parser.flowcell_data["Clusters(PF)"] = (
-            f"{Clusters_PF:,}"
-        )
-        html_report_laneBarcode_parser.flowcell_data["Yield (MBases)"] = (
-            f"{Yield_Mbases:,}"
-        )
+        html_report_laneBarcode_parser.flowcell_data.update(flowcell_data)
         # Generate the new report for laneBarcode.html
         new_html_report_laneBarcode = os.path.join(
             new_html_report_lane_dir, "laneBarcode.html"
         )
         _generate_lane_html(new_html_report_laneBarcode, html_report_laneBarcode_parser)
 
+    def _parse_lane_barcode_report(self, report):
+        """Parse a lane.html or laneBarcode.html report of a sub-demultiplexing.
+
+        The parsed report is stored in the run metadata cache and reused as
+        long as the report is unchanged. Each call returns a separate copy, so
+        the result can be modified while merging reports.
+        """
+        name = os.path.relpath(report, self.run_dir).replace(os.sep, "_")
+        return self.metadata_cache.get(
+            self.id,
+            f"LaneBarcodeParser_{name}",
+            [report],
+            lambda: LaneBarcodeParser(report),
+        )
+
     def _fix_demultiplexingstats_xml_dir(
         self,
         demux_folder,
         stats_json,
-        samplesheets,
+        sub_samplesheets,
         index_cycles,
         simple_lanes,
         complex_lanes,
@@ -909,247 +1107,59 @@ class Run:
     ):
         # Create the DemultiplexingStats.xml (empty it is here only to say thay demux is done)
         DemultiplexingStats_xml_dir = _create_folder_structure(demux_folder, ["Stats"])
-        # For creating DemuxSummary.txt files for complex lanes
-        DemuxSummaryFiles_complex_lanes = dict()
-        # Generate the Stats.json
+        # Fold the Stats.json files not folded yet when their sub-demultiplexing finished
+        merged_stats = self._fold_sub_demux_stats(
+            demux_folder,
+            {
+                re.findall("Demultiplexing_([0-9])", stat_json)[0]: stat_json
+                for stat_json in stats_json
+            },
+            sub_samplesheets,
+            simple_lanes,
+            complex_lanes,
+        )
+        stats_list = merged_stats["stats"]
+        # For complex lanes, the undetermined read number and yield use values from NumberReads_Summary
+        for entry in stats_list["ConversionResults"]:
+            if entry["LaneNumber"] in merged_stats["undetermined_to_fix"]:
+                entry["Undetermined"]["NumberReads"] = self.NumberReads_Summary[
+                    str(entry["LaneNumber"])
+                ]["undet_cluster"]
+                entry["Undetermined"]["Yield"] = (
+                    self.NumberReads_Summary[str(entry["LaneNumber"])]["undet_yield"]
+                    * 1000000
+                )
+        # For creating DemuxSummary.txt files for complex lanes, from the unknown
+        # indexes of the top priority demux run of each lane
+        DemuxSummaryFiles_complex_lanes = {
+            str(entry["Lane"]): entry
+            for entry in stats_list["UnknownBarcodes"]
+            if str(entry["Lane"]) in complex_lanes.keys()
+        }
+
+        # Fix special case that when we assign fake indexes for NoIndex samples
+        if noindex_lanes and index_cycles != [0, 0]:
+            for entry in stats_list["ConversionResults"][:]:
+                if str(entry["LaneNumber"]) in noindex_lanes:
+                    del entry["DemuxResults"][0]["IndexMetrics"]
+                    entry["DemuxResults"][0].update(entry["Undetermined"])
+                    del entry["Undetermined"]
+            # Reset unknown barcodes list
+            for entry in stats_list["UnknownBarcodes"][:]:
+                if str(entry["Lane"]) in noindex_lanes:
+                    entry["Barcodes"] = {"unknown": 1}
+
+        # Write the final version of Stats.json file
         with open(
             os.path.join(DemultiplexingStats_xml_dir, "Stats.json"), "w"
         ) as json_data_cumulative:
-            stats_list = {}
-            for stat_json in stats_json:
-                demux_id = re.findall("Demultiplexing_([0-9])", stat_json)[0]
-                with open(stat_json) as json_data_partial:
-                    data = json.load(json_data_partial)
-                    if len(stats_list) == 0:
-                        # First time I do this
-                        stats_list["RunNumber"] = data["RunNumber"]
-                        stats_list["Flowcell"] = data["Flowcell"]
-                        stats_list["RunId"] = data["RunId"]
-                        stats_list["ConversionResults"] = data["ConversionResults"]
-                        stats_list["ReadInfosForLanes"] = data["ReadInfosForLanes"]
-                        stats_list["UnknownBarcodes"] = []
-                    else:
-                        # Update only the importat fields
-                        lanes_present_in_stats_json = [
-                            entry["LaneNumber"]
-                            for entry in stats_list["ConversionResults"]
-                        ]
-                        for ReadInfosForLanes_lane in data["ReadInfosForLanes"]:
-                            if (
-                                ReadInfosForLanes_lane["LaneNumber"]
-                                not in lanes_present_in_stats_json
-                            ):
-                                stats_list["ReadInfosForLanes"].extend(
-                                    [ReadInfosForLanes_lane]
-                                )
-                        for ConversionResults_lane in data["ConversionResults"]:
-                            if (
-                                ConversionResults_lane["LaneNumber"]
-                                in lanes_present_in_stats_json
-                                and str(ConversionResults_lane["LaneNumber"])
-                                in complex_lanes.keys()
-                            ):
-                                # For complex lanes, we set all stats to 0, except for read number and yield which will use values from NumberReads_Summary
-                                ConversionResults_lane["Undetermined"][
-                                    "NumberReads"
-                                ] = self.NumberReads_Summary[
-                                    str(ConversionResults_lane["LaneNumber"])
-                                ]["undet_cluster"]
-                                ConversionResults_lane["Undetermined"]["Yield"] = (
-                                    self.NumberReads_Summary[
-                                        str(ConversionResults_lane["LaneNumber"])
-                                    ]["undet_yield"]
-                                    * 1000000
-                                )
-                                ConversionResults_lane["Undetermined"]["ReadMetrics"][
-                                    0
-                                ]["QualityScoreSum"] = 0
-                                ConversionResults_lane["Undetermined"]["ReadMetrics"][
-                                    0
-                                ]["TrimmedBases"] = 0
-                                ConversionResults_lane["Undetermined"]["ReadMetrics"][
-                                    0
-                                ]["Yield"] = 0
-                                ConversionResults_lane["Undetermined"]["ReadMetrics"][
-                                    0
-                                ]["YieldQ30"] = 0
-                                if (
-                                    len(
-                                        [
-                                            r
-                                            for r in self.runParserObj.runinfo.data[
-                                                "Reads"
-                                            ]
-                                            if r["IsIndexedRead"] == "N"
-                                        ]
-                                    )
-                                    == 2
-                                ):
-                                    ConversionResults_lane["Undetermined"][
-                                        "ReadMetrics"
-                                    ][1]["QualityScoreSum"] = 0
-                                    ConversionResults_lane["Undetermined"][
-                                        "ReadMetrics"
-                                    ][1]["TrimmedBases"] = 0
-                                    ConversionResults_lane["Undetermined"][
-                                        "ReadMetrics"
-                                    ][1]["Yield"] = 0
-                                    ConversionResults_lane["Undetermined"][
-                                        "ReadMetrics"
-                                    ][1]["YieldQ30"] = 0
-                                # Find the list containing info for this lane #TODO: can lane_to_update be removed?
-                                lane_to_update = [
-                                    entry
-                                    for entry in stats_list["ConversionResults"]
-                                    if entry["LaneNumber"]
-                                    == ConversionResults_lane["LaneNumber"]
-                                ][0]
-                                lane_to_update["DemuxResults"].extend(
-                                    ConversionResults_lane["DemuxResults"]
-                                )
-                                lane_to_update["Undetermined"] = ConversionResults_lane[
-                                    "Undetermined"
-                                ]
-                            else:
-                                stats_list["ConversionResults"].extend(
-                                    [ConversionResults_lane]
-                                )
-
-                    for unknown_barcode_lane in data["UnknownBarcodes"]:
-                        if str(unknown_barcode_lane["Lane"]) in simple_lanes.keys():
-                            stats_list["UnknownBarcodes"].extend([unknown_barcode_lane])
-                        elif str(unknown_barcode_lane["Lane"]) in complex_lanes.keys():
-                            if (
-                                list(
-                                    complex_lanes[
-                                        str(unknown_barcode_lane["Lane"])
-                                    ].keys()
-                                )[0]
-                                == demux_id
-                            ):
-                                # First have the list of unknown indexes from the top priority demux run
-                                full_list_unknownbarcodes = unknown_barcode_lane
-                                # Remove the samples involved in the other samplesheets
-                                for samplesheet in samplesheets:
-                                    demux_id_ss = os.path.splitext(
-                                        os.path.split(samplesheet)[1]
-                                    )[0].split("_")[1]
-                                    if demux_id_ss != demux_id:
-                                        ssparser = SampleSheetParser(samplesheet)
-                                        ssparser_data_lane = [
-                                            row
-                                            for row in ssparser.data
-                                            if row["Lane"]
-                                            == str(unknown_barcode_lane["Lane"])
-                                        ]
-                                        for row in ssparser_data_lane:
-                                            sample_idx1 = row.get("index", "")
-                                            sample_idx2 = row.get("index2", "")
-                                            idx_copy = tuple(
-                                                full_list_unknownbarcodes[
-                                                    "Barcodes"
-                                                ].keys()
-                                            )
-                                            for idx in idx_copy:
-                                                unknownbarcode_idx1 = (
-                                                    idx.split("+")[0]
-                                                    if "+" in idx
-                                                    else idx
-                                                )
-                                                unknownbarcode_idx2 = (
-                                                    idx.split("+")[1]
-                                                    if "+" in idx
-                                                    else ""
-                                                )
-                                                if sample_idx1 and sample_idx2:
-                                                    comparepart_idx1 = (
-                                                        sample_idx1
-                                                        if len(sample_idx1)
-                                                        <= len(unknownbarcode_idx1)
-                                                        else sample_idx1[
-                                                            : len(unknownbarcode_idx1)
-                                                        ]
-                                                    )
-                                                    comparepart_idx2 = (
-                                                        sample_idx2
-                                                        if len(sample_idx2)
-                                                        <= len(unknownbarcode_idx2)
-                                                        else sample_idx2[
-                                                            : len(unknownbarcode_idx2)
-                                                        ]
-                                                    )
-                                                    if (
-                                                        comparepart_idx1
-                                                        == unknownbarcode_idx1[
-                                                            : len(comparepart_idx1)
-                                                        ]
-                                                        and comparepart_idx2
-                                                        == unknownbarcode_idx2[
-                                                            : len(comparepart_idx2)
-                                                        ]
-                                                    ):
-                                                        del full_list_unknownbarcodes[
-                                                            "Barcodes"
-                                                        ][idx]
-                                                elif sample_idx1 and not sample_idx2:
-                                                    comparepart_idx1 = (
-                                                        sample_idx1
-                                                        if len(sample_idx1)
-                                                        <= len(unknownbarcode_idx1)
-                                                        else sample_idx1[
-                                                            : len(unknownbarcode_idx1)
-                                                        ]
-                                                    )
-                                                    if (
-                                                        comparepart_idx1
-                                                        == unknownbarcode_idx1[
-                                                            : len(comparepart_idx1)
-                                                        ]
-                                                    ):
-                                                        del full_list_unknownbarcodes[
-                                                            "Barcodes"
-                                                        ][idx]
-                                                elif not sample_idx1 and sample_idx2:
-                                                    comparepart_idx2 = (
-                                                        sample_idx2
-                                                        if len(sample_idx2)
-                                                        <= len(unknownbarcode_idx1)
-                                                        else sample_idx2[
-                                                            : len(unknownbarcode_idx1)
-                                                        ]
-                                                    )
-                                                    if (
-                                                        comparepart_idx1
-                                                        == unknownbarcode_idx1[
-                                                            : len(comparepart_idx2)
-                                                        ]
-                                                    ):
-                                                        del full_list_unknownbarcodes[
-                                                            "Barcodes"
-                                                        ][idx]
-                                stats_list["UnknownBarcodes"].extend(
-                                    [full_list_unknownbarcodes]
-                                )
-                                DemuxSummaryFiles_complex_lanes[
-                                    str(unknown_barcode_lane["Lane"])
-                                ] = full_list_unknownbarcodes
-                            else:
-                                pass
-
-            # Fix special case that when we assign fake indexes for NoIndex samples
-            if noindex_lanes and index_cycles != [0, 0]:
-                for entry in stats_list["ConversionResults"][:]:
-                    if str(entry["LaneNumber"]) in noindex_lanes:
-                        del entry["DemuxResults"][0]["IndexMetrics"]
-                        entry["DemuxResults"][0].update(entry["Undetermined"])
-                        del entry["Undetermined"]
-                # Reset unknown barcodes list
-                for entry in stats_list["UnknownBarcodes"][:]:
-                    if str(entry["Lane"]) in noindex_lanes:
-                        entry["Barcodes"] = {"unknown": 1}
-
-            # Write the final version of Stats.json file
             json.dump(stats_list, json_data_cumulative)
+        # The merged Stats.json is complete, the intermediate files of the
+        # incremental aggregation are not needed anymore
+        for intermediate_file in [AGGREGATION_STATS_FILE, AGGREGATION_STATE_FILE]:
+            intermediate_path = os.path.join(demux_folder, intermediate_file)
+            if os.path.exists(intermediate_path):
+                os.remove(intermediate_path)
 
         # Create DemuxSummary.txt files for complex lanes
         if len(DemuxSummaryFiles_complex_lanes) > 0:
@@ -1172,30 +1182,20 @@ class Run:
     def _process_demux_with_complex_lanes(
         self,
         demux_folder,
-        samplesheets,
+        sub_samplesheets,
         legacy_path,
         index_cycles,
         simple_lanes,
         complex_lanes,
         noindex_lanes,
+        aggregated_demux_ids=(),
     ):
         html_reports_lane = []
         html_reports_laneBarcode = []
         stats_json = []
-        for samplesheet in samplesheets:
-            ssparser = SampleSheetParser(samplesheet)
-            demux_id = os.path.splitext(os.path.split(samplesheet)[1])[0].split("_")[1]
-            html_report_lane = os.path.join(
-                self.run_dir,
-                f"Demultiplexing_{demux_id}",
-                legacy_path,
-                "Reports",
-                "html",
-                self.flowcell_id,
-                "all",
-                "all",
-                "all",
-                "lane.html",
+        for demux_id, ssparser in sub_samplesheets.items():
+            html_report_lane = self._sub_demux_report_path(
+                demux_id, legacy_path, "lane.html"
             )
             if os.path.exists(html_report_lane):
                 html_reports_lane.append(html_report_lane)
@@ -1204,17 +1204,8 @@ class Run:
                     f"Not able to find html report {html_report_lane}: possible cause is problem in demultiplexing"
                 )
 
-            html_report_laneBarcode = os.path.join(
-                self.run_dir,
-                f"Demultiplexing_{demux_id}",
-                legacy_path,
-                "Reports",
-                "html",
-                self.flowcell_id,
-                "all",
-                "all",
-                "all",
-                "laneBarcode.html",
+            html_report_laneBarcode = self._sub_demux_report_path(
+                demux_id, legacy_path, "laneBarcode.html"
             )
             if os.path.exists(html_report_laneBarcode):
                 html_reports_laneBarcode.append(html_report_laneBarcode)
@@ -1237,182 +1228,406 @@ class Run:
                     f"Not able to find Stats.json report {stat_json}: possible cause is problem in demultiplexing"
                 )
 
-            # Aggregate fastq
-            lanes_samples = dict()
-            for row in ssparser.data:
-                if row["Lane"] not in lanes_samples.keys():
-                    lanes_samples[row["Lane"]] = [row["Sample_Name"]]
-                else:
-                    lanes_samples[row["Lane"]].append(row["Sample_Name"])
+            # Aggregate fastq, unless already done when the sub-demultiplexing finished
+            if demux_id not in aggregated_demux_ids:
+                self._aggregate_sub_demux_fastq(
+                    demux_folder,
+                    demux_id,
+                    ssparser,
+                    legacy_path,
+                    index_cycles,
+                    simple_lanes,
+                    noindex_lanes,
+                )
 
-            # Special case that when we assign fake indexes for NoIndex samples
-            if (
-                set(list(lanes_samples.keys())) & set(noindex_lanes)
-            ) and index_cycles != [0, 0]:
-                sample_counter = 1
-                for entry in sorted(ssparser.data, key=lambda k: k["Lane"]):
-                    lane = entry["Lane"]
-                    project = entry["Sample_Project"]
-                    sample = entry["Sample_ID"]
-                    project_dest = os.path.join(demux_folder, project)
-                    if not os.path.exists(project_dest):
-                        os.makedirs(project_dest)
+        return html_reports_lane, html_reports_laneBarcode, stats_json
+
+    def _sub_demux_report_path(self, demux_id, legacy_path, report):
+        return os.path.join(
+            self.run_dir,
+            f"Demultiplexing_{demux_id}",
+            legacy_path,
+            "Reports",
+            "html",
+            self.flowcell_id,
+            "all",
+            "all",
+            "all",
+            report,
+        )
+
+    def _aggregate_sub_demux_fastq(
+        self,
+        demux_folder,
+        demux_id,
+        ssparser,
+        legacy_path,
+        index_cycles,
+        simple_lanes,
+        noindex_lanes,
+    ):
+        """Link the FastQ files of a sub-demultiplexing into the Demultiplexing folder."""
+        # Special case that when we assign fake indexes for NoIndex samples
+        if (set(ssparser.lanes) & set(noindex_lanes)) and index_cycles != [0, 0]:
+            sample_counter = 1
+            for entry in sorted(ssparser.data, key=lambda k: k["Lane"]):
+                lane = entry["Lane"]
+                project = entry["Sample_Project"]
+                sample = entry["Sample_ID"]
+                project_dest = os.path.join(demux_folder, project)
+                if not os.path.exists(project_dest):
+                    os.makedirs(project_dest)
+                sample_dest = os.path.join(project_dest, sample)
+                if not os.path.exists(sample_dest):
+                    os.makedirs(sample_dest)
+                for file in glob.glob(
+                    os.path.join(
+                        self.run_dir,
+                        f"Demultiplexing_{demux_id}",
+                        f"Undetermined*L0?{lane}*",
+                    )
+                ):
+                    old_name = os.path.basename(file)
+                    old_name_comps = old_name.split("_")
+                    new_name_comps = [
+                        sample.replace("Sample_", ""),
+                        f"S{str(sample_counter)}",
+                    ] + old_name_comps[2:]
+                    new_name = "_".join(new_name_comps)
+                    _symlink(file, os.path.join(sample_dest, new_name))
+                    logger.info(
+                        "For undet sample {}, renaming {} to {}".format(
+                            sample.replace("Sample_", ""), old_name, new_name
+                        )
+                    )
+                sample_counter += 1
+        # Ordinary cases
+        else:
+            projects = [
+                project
+                for project in os.listdir(
+                    os.path.join(self.run_dir, f"Demultiplexing_{demux_id}")
+                )
+                if os.path.isdir(
+                    os.path.join(self.run_dir, f"Demultiplexing_{demux_id}", project)
+                )
+            ]
+            for project in projects:
+                if project in "Reports" or project in "Stats":
+                    continue
+                project_source = os.path.join(
+                    self.run_dir, f"Demultiplexing_{demux_id}", project
+                )
+                project_dest = os.path.join(demux_folder, project)
+                if not os.path.exists(project_dest):
+                    # There might be project seqeunced with multiple index lengths
+                    os.makedirs(project_dest)
+                samples = [
+                    sample
+                    for sample in os.listdir(project_source)
+                    if os.path.isdir(os.path.join(project_source, sample))
+                ]
+                for sample in samples:
+                    sample_source = os.path.join(project_source, sample)
                     sample_dest = os.path.join(project_dest, sample)
                     if not os.path.exists(sample_dest):
+                        # There should never be the same sample sequenced with different index length,
+                        # however a sample might be pooled in several lanes and therefore sequenced using different samplesheets
                         os.makedirs(sample_dest)
-                    for file in glob.glob(
+                    fastqfiles = glob.glob(os.path.join(sample_source, "*.fastq*"))
+                    for fastqfile in fastqfiles:
+                        _symlink(
+                            fastqfile,
+                            os.path.join(sample_dest, os.path.split(fastqfile)[1]),
+                        )
+            # Copy fastq files for undetermined and the undetermined stats for simple lanes only
+            for lane in ssparser.lanes:
+                if lane in simple_lanes.keys():
+                    undetermined_fastq_files = glob.glob(
                         os.path.join(
                             self.run_dir,
                             f"Demultiplexing_{demux_id}",
-                            f"Undetermined*L0?{lane}*",
+                            f"Undetermined_S0_L00{lane}*.fastq*",
                         )
-                    ):
-                        old_name = os.path.basename(file)
-                        old_name_comps = old_name.split("_")
-                        new_name_comps = [
-                            sample.replace("Sample_", ""),
-                            f"S{str(sample_counter)}",
-                        ] + old_name_comps[2:]
-                        new_name = "_".join(new_name_comps)
-                        os.symlink(file, os.path.join(sample_dest, new_name))
-                        logger.info(
-                            "For undet sample {}, renaming {} to {}".format(
-                                sample.replace("Sample_", ""), old_name, new_name
-                            )
+                    )  # Contains only simple lanes undetermined
+                    for fastqfile in undetermined_fastq_files:
+                        _symlink(
+                            fastqfile,
+                            os.path.join(demux_folder, os.path.split(fastqfile)[1]),
                         )
-                    sample_counter += 1
-            # Ordinary cases
-            else:
-                projects = [
-                    project
-                    for project in os.listdir(
-                        os.path.join(self.run_dir, f"Demultiplexing_{demux_id}")
-                    )
-                    if os.path.isdir(
+                    DemuxSummaryFiles = glob.glob(
                         os.path.join(
-                            self.run_dir, f"Demultiplexing_{demux_id}", project
+                            self.run_dir,
+                            f"Demultiplexing_{demux_id}",
+                            legacy_path,
+                            "Stats",
+                            f"*L{lane}*txt",
                         )
                     )
-                ]
-                for project in projects:
-                    if project in "Reports" or project in "Stats":
-                        continue
-                    project_source = os.path.join(
-                        self.run_dir, f"Demultiplexing_{demux_id}", project
-                    )
-                    project_dest = os.path.join(demux_folder, project)
-                    if not os.path.exists(project_dest):
-                        # There might be project seqeunced with multiple index lengths
-                        os.makedirs(project_dest)
-                    samples = [
-                        sample
-                        for sample in os.listdir(project_source)
-                        if os.path.isdir(os.path.join(project_source, sample))
-                    ]
-                    for sample in samples:
-                        sample_source = os.path.join(project_source, sample)
-                        sample_dest = os.path.join(project_dest, sample)
-                        if not os.path.exists(sample_dest):
-                            # There should never be the same sample sequenced with different index length,
-                            # however a sample might be pooled in several lanes and therefore sequenced using different samplesheets
-                            os.makedirs(sample_dest)
-                        fastqfiles = glob.glob(os.path.join(sample_source, "*.fastq*"))
-                        for fastqfile in fastqfiles:
-                            os.symlink(
-                                fastqfile,
-                                os.path.join(sample_dest, os.path.split(fastqfile)[1]),
-                            )
-                # Copy fastq files for undetermined and the undetermined stats for simple lanes only
-                lanes_in_sub_samplesheet = []
-                header = [
-                    "[Header]",
-                    "[Data]",
-                    "FCID",
-                    "Lane",
-                    "Sample_ID",
-                    "Sample_Name",
-                    "Sample_Ref",
-                    "index",
-                    "index2",
-                    "Description",
-                    "Control",
-                    "Recipe",
-                    "Operator",
-                    "Sample_Project",
-                    "[Settings]",
-                    "OverrideCycles",
-                    "MinimumTrimmedReadLength",
-                    "MaskShortReads",
-                    "CreateFastqForIndexReads",
-                    "BarcodeMismatchesIndex1",
-                    "BarcodeMismatchesIndex2",
-                    "TrimUMI",
-                ]
-                with open(samplesheet) as sub_samplesheet_file:
-                    sub_samplesheet_reader = csv.reader(sub_samplesheet_file)
-                    for row in sub_samplesheet_reader:
-                        if row[0] not in header:
-                            lanes_in_sub_samplesheet.append(row[1])
-                lanes_in_sub_samplesheet = list(set(lanes_in_sub_samplesheet))
-                for lane in lanes_in_sub_samplesheet:
-                    if lane in simple_lanes.keys():
-                        undetermined_fastq_files = glob.glob(
+                    if not os.path.exists(os.path.join(demux_folder, "Stats")):
+                        os.makedirs(os.path.join(demux_folder, "Stats"))
+                    for DemuxSummaryFile in DemuxSummaryFiles:
+                        _symlink(
+                            DemuxSummaryFile,
                             os.path.join(
-                                self.run_dir,
-                                f"Demultiplexing_{demux_id}",
-                                f"Undetermined_S0_L00{lane}*.fastq*",
-                            )
-                        )  # Contains only simple lanes undetermined
-                        for fastqfile in undetermined_fastq_files:
-                            os.symlink(
-                                fastqfile,
-                                os.path.join(demux_folder, os.path.split(fastqfile)[1]),
-                            )
-                        DemuxSummaryFiles = glob.glob(
-                            os.path.join(
-                                self.run_dir,
-                                f"Demultiplexing_{demux_id}",
-                                legacy_path,
+                                demux_folder,
                                 "Stats",
-                                f"*L{lane}*txt",
-                            )
+                                os.path.split(DemuxSummaryFile)[1],
+                            ),
                         )
-                        if not os.path.exists(os.path.join(demux_folder, "Stats")):
-                            os.makedirs(os.path.join(demux_folder, "Stats"))
-                        for DemuxSummaryFile in DemuxSummaryFiles:
-                            os.symlink(
-                                DemuxSummaryFile,
-                                os.path.join(
-                                    demux_folder,
-                                    "Stats",
-                                    os.path.split(DemuxSummaryFile)[1],
-                                ),
-                            )
 
-        return html_reports_lane, html_reports_laneBarcode, stats_json
+    def _aggregate_finished_sub_demuxes(self, samplesheets, finished_demux_ids):
+        """Aggregate the results of sub-demultiplexings as soon as they finish.
 
-    def _aggregate_demux_results_simple_complex(self):
-        runSetup = self.runParserObj.runinfo.get_read_configuration()
+        The FastQ files are linked and the Stats.json is folded into the merged
+        stats, see :meth:`_fold_sub_demux_stats`. The ids of the aggregated
+        sub-demultiplexings are persisted, so that they are skipped by later
+        ticks and by the final aggregation.
+        """
+        aggregated_demux_ids = self._load_aggregation_state()
+        to_aggregate = [
+            demux_id
+            for demux_id in finished_demux_ids
+            if demux_id not in aggregated_demux_ids
+        ]
+        if not to_aggregate:
+            return
+        sub_samplesheets = self._parse_sub_samplesheets(samplesheets)
+        noindex_lanes, simple_lanes, complex_lanes = self._classify_lanes(
+            sub_samplesheets
+        )
         demux_folder = os.path.join(self.run_dir, self.demux_dir)
-        samplesheets = glob.glob(os.path.join(self.run_dir, "*_[0-9].csv"))
+        legacy_path = self._get_legacy_path()
+        index_cycles = self._get_index_cycles()
+        self._fold_sub_demux_stats(
+            demux_folder,
+            {
+                demux_id: os.path.join(
+                    self.run_dir,
+                    f"Demultiplexing_{demux_id}",
+                    legacy_path,
+                    "Stats",
+                    "Stats.json",
+                )
+                for demux_id in finished_demux_ids
+            },
+            sub_samplesheets,
+            simple_lanes,
+            complex_lanes,
+        )
+        for demux_id in to_aggregate:
+            logger.info(
+                f"Aggregating FastQ files of finished sub-demultiplexing {demux_id} for run {self.id}"
+            )
+            self._aggregate_sub_demux_fastq(
+                demux_folder,
+                demux_id,
+                sub_samplesheets[demux_id],
+                legacy_path,
+                index_cycles,
+                simple_lanes,
+                noindex_lanes,
+            )
+            # Parse the html reports already, so that they are cached for the final aggregation
+            for report in ["lane.html", "laneBarcode.html"]:
+                report_path = self._sub_demux_report_path(demux_id, legacy_path, report)
+                if os.path.exists(report_path):
+                    self._parse_lane_barcode_report(report_path)
+            aggregated_demux_ids.append(demux_id)
+            self._save_aggregation_state(aggregated_demux_ids)
+
+    def _load_aggregation_state(self):
+        # Kept in the Demultiplexing folder, so that it is removed with it
+        # when the demultiplexing of the run is reset
+        try:
+            with open(
+                os.path.join(self.run_dir, self.demux_dir, AGGREGATION_STATE_FILE)
+            ) as state:
+                return json.load(state)["aggregated"]
+        except FileNotFoundError:
+            return []
+
+    def _save_aggregation_state(self, aggregated_demux_ids):
+        _write_json_atomically(
+            os.path.join(self.run_dir, self.demux_dir, AGGREGATION_STATE_FILE),
+            {"aggregated": aggregated_demux_ids},
+        )
+
+    def _fold_sub_demux_stats(
+        self, demux_folder, stats_json, sub_samplesheets, simple_lanes, complex_lanes
+    ):
+        """Fold the Stats.json of finished sub-demultiplexings into the merged stats.
+
+        The merged stats are kept in demux_folder between calls, so that each
+        Stats.json is read once, when its sub-demultiplexing finishes, and only
+        one of them is in memory at a time. The sub-demultiplexings are folded
+        in the order of their ids, so a finished one waits for the ones before
+        it and the result does not depend on the order they finish in.
+
+        :param str demux_folder: The Demultiplexing folder of the run
+        :param dict stats_json: Path of the Stats.json of each finished demux id
+        :param dict sub_samplesheets: The SampleSheet model of each demux id
+        :param dict simple_lanes: The lanes demultiplexed in one part
+        :param dict complex_lanes: The lanes demultiplexed in several parts
+        :returns: A dict with the merged "stats", the "folded" demux ids and the
+            lanes whose undetermined numbers are "undetermined_to_fix" once all
+            sub-demultiplexings are done
+        """
+        merged_stats_file = os.path.join(demux_folder, AGGREGATION_STATS_FILE)
+        try:
+            with open(merged_stats_file) as fh:
+                merged_stats = json.load(fh)
+        except FileNotFoundError:
+            merged_stats = {"folded": [], "undetermined_to_fix": [], "stats": {}}
+        folded = False
+        for demux_id in sorted(sub_samplesheets, key=int):
+            if demux_id in merged_stats["folded"]:
+                continue
+            if demux_id not in stats_json:
+                break
+            with open(stats_json[demux_id]) as json_data_partial:
+                data = json.load(json_data_partial)
+            self._merge_stats_json(
+                merged_stats,
+                data,
+                demux_id,
+                sub_samplesheets,
+                simple_lanes,
+                complex_lanes,
+            )
+            merged_stats["folded"].append(demux_id)
+            folded = True
+        if folded:
+            _write_json_atomically(merged_stats_file, merged_stats)
+        return merged_stats
+
+    def _merge_stats_json(
+        self,
+        merged_stats,
+        data,
+        demux_id,
+        sub_samplesheets,
+        simple_lanes,
+        complex_lanes,
+    ):
+        """Merge the Stats.json of a sub-demultiplexing into the merged stats,
+        see :meth:`_fold_sub_demux_stats`.
+        """
+        stats_list = merged_stats["stats"]
+        if len(stats_list) == 0:
+            # First time I do this
+            stats_list["RunNumber"] = data["RunNumber"]
+            stats_list["Flowcell"] = data["Flowcell"]
+            stats_list["RunId"] = data["RunId"]
+            stats_list["ConversionResults"] = data["ConversionResults"]
+            stats_list["ReadInfosForLanes"] = data["ReadInfosForLanes"]
+            stats_list["UnknownBarcodes"] = []
+        else:
+            # Update only the importat fields
+            lanes_present_in_stats_json = [
+                entry["LaneNumber"] for entry in stats_list["ConversionResults"]
+            ]
+            for ReadInfosForLanes_lane in data["ReadInfosForLanes"]:
+                if (
+                    ReadInfosForLanes_lane["LaneNumber"]
+                    not in lanes_present_in_stats_json
+                ):
+                    stats_list["ReadInfosForLanes"].extend([ReadInfosForLanes_lane])
+            for ConversionResults_lane in data["ConversionResults"]:
+                if (
+                    ConversionResults_lane["LaneNumber"] in lanes_present_in_stats_json
+                    and str(ConversionResults_lane["LaneNumber"])
+                    in complex_lanes.keys()
+                ):
+                    # For complex lanes, we set all stats to 0, except for read number and yield which
+                    # will use values from NumberReads_Summary once all sub-demultiplexings are done
+                    undetermined = ConversionResults_lane["Undetermined"]
+                    n_reads = len(
+                        [
+                            r
+                            for r in self.runParserObj.runinfo.data["Reads"]
+                            if r["IsIndexedRead"] == "N"
+                        ]
+                    )
+                    for read_metrics in undetermined["ReadMetrics"][
+                        : 2 if n_reads == 2 else 1
+                    ]:
+                        read_metrics["QualityScoreSum"] = 0
+                        read_metrics["TrimmedBases"] = 0
+                        read_metrics["Yield"] = 0
+                        read_metrics["YieldQ30"] = 0
+                    # Find the list containing info for this lane #TODO: can lane_to_update be removed?
+                    lane_to_update = [
+                        entry
+                        for entry in stats_list["ConversionResults"]
+                        if entry["LaneNumber"] == ConversionResults_lane["LaneNumber"]
+                    ][0]
+                    lane_to_update["DemuxResults"].extend(
+                        ConversionResults_lane["DemuxResults"]
+                    )
+                    lane_to_update["Undetermined"] = undetermined
+                    if (
+                        ConversionResults_lane["LaneNumber"]
+                        not in merged_stats["undetermined_to_fix"]
+                    ):
+                        merged_stats["undetermined_to_fix"].append(
+                            ConversionResults_lane["LaneNumber"]
+                        )
+                else:
+                    stats_list["ConversionResults"].extend([ConversionResults_lane])
+
+        for unknown_barcode_lane in data["UnknownBarcodes"]:
+            if str(unknown_barcode_lane["Lane"]) in simple_lanes.keys():
+                stats_list["UnknownBarcodes"].extend([unknown_barcode_lane])
+            elif str(unknown_barcode_lane["Lane"]) in complex_lanes.keys():
+                if (
+                    list(complex_lanes[str(unknown_barcode_lane["Lane"])].keys())[0]
+                    == demux_id
+                ):
+                    # First have the list of unknown indexes from the top priority demux run
+                    full_list_unknownbarcodes = unknown_barcode_lane
+                    # Remove the samples involved in the other samplesheets
+                    known_indexes = KnownIndexPrefixes(
+                        (row.get("index", ""), row.get("index2", ""))
+                        for demux_id_ss, ssparser in sub_samplesheets.items()
+                        if demux_id_ss != demux_id
+                        for row in ssparser.rows_in_lane(
+                            str(unknown_barcode_lane["Lane"])
+                        )
+                    )
+                    known_indexes.remove_matching(full_list_unknownbarcodes["Barcodes"])
+                    stats_list["UnknownBarcodes"].extend([full_list_unknownbarcodes])
+
+    def _get_legacy_path(self):
         if self.software == "bcl2fastq":
-            legacy_path = ""
+            return ""
         elif self.software == "bclconvert":
-            legacy_path = f"Reports/{self.legacy_dir}"
+            return f"Reports/{self.legacy_dir}"
         else:
             raise RuntimeError("Unrecognized software!")
 
+    def _get_index_cycles(self):
         index_cycles = [0, 0]
-        for read in runSetup:
+        for read in self.runParserObj.runinfo.get_read_configuration():
             if read["IsIndexedRead"] == "Y":
                 if int(read["Number"]) == 2:
                     index_cycles[0] = int(read["NumCycles"])
                 else:
                     index_cycles[1] = int(read["NumCycles"])
+        return index_cycles
+
+    def _aggregate_demux_results_simple_complex(self):
+        demux_folder = os.path.join(self.run_dir, self.demux_dir)
+        samplesheets = glob.glob(os.path.join(self.run_dir, "*_[0-9].csv"))
+        legacy_path = self._get_legacy_path()
+        index_cycles = self._get_index_cycles()
+
+        # Parse the sub-samplesheets once for all aggregation steps
+        sub_samplesheets = self._parse_sub_samplesheets(samplesheets)
 
         # Classify lanes in samplesheets
         (noindex_lanes, simple_lanes, complex_lanes) = self._classify_lanes(
-            samplesheets
+            sub_samplesheets
         )
 
         # Case with only one sub-demultiplexing
@@ -1438,12 +1653,13 @@ class Run:
             stats_json,
         ) = self._process_demux_with_complex_lanes(
             demux_folder,
-            samplesheets,
+            sub_samplesheets,
             legacy_path,
             index_cycles,
             simple_lanes,
             complex_lanes,
             noindex_lanes,
+            aggregated_demux_ids=self._load_aggregation_state(),
         )
 
         # Create the html reports
@@ -1460,7 +1676,7 @@ class Run:
         self._fix_demultiplexingstats_xml_dir(
             demux_folder,
             stats_json,
-            samplesheets,
+            sub_samplesheets,
             index_cycles,
             simple_lanes,
             complex_lanes,
@@ -1470,6 +1686,20 @@ class Run:
         return True
 
 
+def _write_json_atomically(path, data):
+    """Write data as JSON, replacing path only once it is completely written."""
+    with open(f"{path}.tmp", "w") as fh:
+        json.dump(data, fh)
+    os.replace(f"{path}.tmp", path)
+
+
+def _symlink(src, dst):
+    """Create a symlink, accepting an identical one left by an interrupted aggregation."""
+    if os.path.islink(dst) and os.readlink(dst) == src:
+        return
+    os.symlink(src, dst)
+
+
 def _create_folder_structure(root, dirs):
     """Creates a fodler stucture rooted in root usinf all dirs listed in dirs (a list)
     returns the path to the deepest directory
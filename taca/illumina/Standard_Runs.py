@@ -3,20 +3,29 @@ import os
 import re
 from datetime import datetime
 
-from flowcell_parser.classes import SampleSheetParser
-
+from taca.illumina import demux_plan, index_catalog
+from taca.illumina.index_catalog import IDT_UMI_PAT, SMARTSEQ_PAT, TENX_DUAL_PAT
 from taca.illumina.Runs import Run
+from taca.illumina.samplesheet import SampleSheet
 from taca.utils import misc
 from taca.utils.filesystem import chdir
+from taca.utils.job_scheduler import get_job_scheduler
 
 logger = logging.getLogger(__name__)
 
-TENX_SINGLE_PAT = re.compile("SI-(?:GA|NA)-[A-H][1-9][0-2]?")
-TENX_DUAL_PAT = re.compile("SI-(?:TT|NT|NN|TN|TS)-[A-H][1-9][0-2]?")
-SMARTSEQ_PAT = re.compile("SMARTSEQ[1-9]?-[1-9][0-9]?[A-P]")
-IDT_UMI_PAT = re.compile("([ATCG]{4,}N+$)")
 RECIPE_PAT = re.compile("[0-9]+-[0-9]+")
 
+# Options setting the number of threads of the demultiplexing software, with
+# the share of the cores of a job given to each of them
+THREAD_OPTIONS = {
+    "bcl2fastq": {"processing-threads": 1},
+    "bclconvert": {
+        "bcl-num-conversion-threads": 2,
+        "bcl-num-compression-threads": 1,
+        "bcl-num-decompression-threads": 1,
+    },
+}
+
 
 class Standard_Run(Run):
     def __init__(self, run_dir, software, configuration):
@@ -30,20 +39,9 @@ class Standard_Run(Run):
 
     def _copy_samplesheet(self):
         ssname = self._get_samplesheet()
-        ssparser = SampleSheetParser(ssname)
-        indexfile = dict()
+        ssparser = SampleSheet.from_parser(self._parse_samplesheet(ssname))
         runSetup = self.runParserObj.runinfo.get_read_configuration()
-        # Loading index files
-        try:
-            indexfile["tenX"] = self.CONFIG[self.software]["tenX_index_path"]
-        except KeyError:
-            logger.error("Path to index file (10X) not found in the config file")
-            raise RuntimeError
-        try:
-            indexfile["smartseq"] = self.CONFIG[self.software]["smartseq_index_path"]
-        except KeyError:
-            logger.error("Path to index file (Smart-seq) not found in the config file")
-            raise RuntimeError
+        indexfile = self._get_index_files()
         # Samplesheet need to be positioned in the FC directory with name SampleSheet.csv (Illumina default)
         # If this is not the case then create it and take special care of modification to be done on the SampleSheet
         samplesheet_dest = os.path.join(self.run_dir, "SampleSheet.csv")
@@ -73,46 +71,43 @@ class Standard_Run(Run):
 
         # When demultiplexing SampleSheet.csv is the one I need to use
         # Need to rewrite so that SampleSheet_0.csv is always used.
-        self.runParserObj.samplesheet = SampleSheetParser(
-            os.path.join(self.run_dir, "SampleSheet.csv")
-        )
-        if not self.runParserObj.obj.get("samplesheet_csv"):
-            self.runParserObj.obj["samplesheet_csv"] = (
-                self.runParserObj.samplesheet.data
-            )
+        self.runParserObj.samplesheet = self._read_samplesheet(samplesheet_dest)
+
+    def _get_index_files(self):
+        """Return the paths to the 10X and Smart-seq index files from the config."""
+        indexfile = dict()
+        try:
+            indexfile["tenX"] = self.CONFIG[self.software]["tenX_index_path"]
+        except KeyError:
+            logger.error("Path to index file (10X) not found in the config file")
+            raise RuntimeError
+        try:
+            indexfile["smartseq"] = self.CONFIG[self.software]["smartseq_index_path"]
+        except KeyError:
+            logger.error("Path to index file (Smart-seq) not found in the config file")
+            raise RuntimeError
+        return indexfile
 
     def _parse_10X_indexes(self, indexfile):
         """
         Takes a file of 10X indexes and returns them as a dict.
-        Todo: Set it up to take the file from config instead
+        The file is only read again if it changed since it was last read.
         """
-        index_dict = {}
-        with open(indexfile) as f:
-            for line in f:
-                line_ = line.rstrip().split(",")
-                index_dict[line_[0]] = line_[1:5]
-        return index_dict
+        return index_catalog.get_10X_indexes(indexfile)
 
     def _parse_smartseq_indexes(self, indexfile):
         """
         Takes a file of Smart-seq indexes and returns them as a dict.
-        Todo: Set it up to take the file from config instead
+        The file is only read again if it changed since it was last read.
         """
-        index_dict = {}
-        with open(indexfile) as f:
-            for line in f:
-                line_ = line.rstrip().split(",")
-                if index_dict.get(line_[0]):
-                    index_dict[line_[0]].append((line_[1], line_[2]))
-                else:
-                    index_dict.update({line_[0]: [(line_[1], line_[2])]})
-        return index_dict
+        return index_catalog.get_smartseq_indexes(indexfile)
 
     def _classify_samples(self, indexfile, ssparser, runSetup):
         """Given an ssparser object, go through all samples and decide sample types."""
         sample_table = dict()
-        index_dict_tenX = self._parse_10X_indexes(indexfile["tenX"])
-        index_dict_smartseq = self._parse_smartseq_indexes(indexfile["smartseq"])
+        catalog = index_catalog.get_index_catalog(
+            indexfile["tenX"], indexfile["smartseq"]
+        )
         index_cycles = [0, 0]
         read_cycles = [0, 0]
         for read in runSetup:
@@ -129,7 +124,6 @@ class Standard_Run(Run):
         for sample in ssparser.data:
             lane = sample["Lane"]
             sample_name = sample.get("Sample_Name") or sample.get("SampleName")
-            umi_length = [0, 0]
             read_length = read_cycles
             if not sample.get("index"):
                 sample["index"] = ""
@@ -146,57 +140,9 @@ class Standard_Run(Run):
             # By default use the read cycles from the sequncing setup. Otherwise use the shorter read length
             if ss_read_length != [0, 0]:
                 read_length = [min(rd) for rd in zip(ss_read_length, read_length)]
-            # 10X single index
-            if TENX_SINGLE_PAT.findall(sample["index"]):
-                index_length = [len(index_dict_tenX[sample["index"]][0]), 0]
-                sample_type = "10X_SINGLE"
-            # 10X dual index
-            elif TENX_DUAL_PAT.findall(sample["index"]):
-                index_length = [
-                    len(index_dict_tenX[sample["index"]][0]),
-                    len(index_dict_tenX[sample["index"]][1]),
-                ]
-                sample_type = "10X_DUAL"
-            # IDT UMI samples
-            elif IDT_UMI_PAT.findall(sample["index"]) or IDT_UMI_PAT.findall(
-                sample["index2"]
-            ):
-                # Index length after removing "N" part
-                index_length = [
-                    len(sample["index"].replace("N", "")),
-                    len(sample["index2"].replace("N", "")),
-                ]
-                sample_type = "IDT_UMI"
-                umi_length = [
-                    sample["index"].upper().count("N"),
-                    sample["index2"].upper().count("N"),
-                ]
-            # Smart-seq
-            elif SMARTSEQ_PAT.findall(sample["index"]):
-                smartseq_index = sample["index"].split("-")[1]
-                index_length = [
-                    len(index_dict_smartseq[smartseq_index][0][0]),
-                    len(index_dict_smartseq[smartseq_index][0][1]),
-                ]
-                sample_type = "SMARTSEQ"
-            # No Index case 1. We will write indexes to separate FastQ files
-            elif sample["index"].upper() == "NOINDEX" and index_cycles != [0, 0]:
-                index_length = index_cycles
-                sample_type = "NOINDEX"
-            # No Index case 2. Both index 1 and 2 are empty, it will be the same index type but will be handled in the next case
-            elif sample["index"].upper() == "NOINDEX" and index_cycles == [0, 0]:
-                index_length = [0, 0]
-                sample_type = "ordinary"
-            # Ordinary samples
-            else:
-                index_length = [len(sample["index"]), len(sample["index2"])]
-                # Short single index (<=6nt)
-                if (index_length[0] <= 8 and index_length[1] == 0) or (
-                    index_length[0] == 0 and index_length[1] <= 8
-                ):
-                    sample_type = "short_single_index"
-                else:
-                    sample_type = "ordinary"
+            sample_type, index_length, umi_length = catalog.classify(
+                sample["index"], sample["index2"], index_cycles
+            )
 
             # Write in sample table
             # {'1': [('101', {'sample_type': 'ordinary', 'index_length': [8, 8]}), ('102', {'sample_type': 'ordinary', 'index_length': [8, 8]})]}
@@ -239,188 +185,93 @@ class Standard_Run(Run):
          - run bcl2fastq/bclconvert conversion
         """
         runSetup = self.runParserObj.runinfo.get_read_configuration()
-        # Check sample types
-        sample_type_list = []
-        for lane, lane_contents in self.sample_table.items():
-            for sample in lane_contents:
-                sample_detail = sample[1]
-                sample_type = sample_detail["sample_type"]
-                if sample_type not in sample_type_list:
-                    sample_type_list.append(sample_type)
-
-        # Go through sample_table for demultiplexing
-        bcl_cmd_counter = 0
-        for sample_type in sorted(sample_type_list):
-            # Looking for lanes with multiple masks under the same sample type
-            lane_table = dict()
-            for lane, lane_contents in self.sample_table.items():
-                for sample in lane_contents:
-                    sample_detail = sample[1]
-                    sample_type_t = sample_detail["sample_type"]
-                    sample_index_length = sample_detail["index_length"]
-                    sample_umi_length = sample_detail["umi_length"]
-                    sample_read_length = sample_detail["read_length"]
-                    if sample_type_t == sample_type:
-                        if lane_table.get(lane):
-                            if (
-                                sample_index_length,
-                                sample_umi_length,
-                                sample_read_length,
-                            ) not in lane_table[lane]:
-                                lane_table[lane].append(
-                                    (
-                                        sample_index_length,
-                                        sample_umi_length,
-                                        sample_read_length,
-                                    )
-                                )
-                        else:
-                            lane_table.update(
-                                {
-                                    lane: [
-                                        (
-                                            sample_index_length,
-                                            sample_umi_length,
-                                            sample_read_length,
-                                        )
-                                    ]
-                                }
-                            )
-
-            # Determine the number of demux needed for the same sample type
-            if self.software == "bcl2fastq":
-                demux_number_with_the_same_sample_type = len(
-                    max([v for k, v in lane_table.items()], key=len)
+        scheduler = get_job_scheduler()
+        plans = self.plan_demultiplexing()
+        # One sub-demultiplexing per sample type and mask
+        for plan in plans:
+            bcl_cmd_counter = plan["demux_id"]
+            sample_type = plan["sample_type"]
+            mask_table = plan["mask_table"]
+            samples_to_include = plan["samples_to_include"]
+            if self.software == "bclconvert":
+                (index_length, umi_length, read_length) = plan["mask"]
+                index1_size = int(index_length[0])
+                index2_size = int(index_length[1])
+                umi1_size = int(umi_length[0])
+                umi2_size = int(umi_length[1])
+                read1_size = int(read_length[0])
+                read2_size = int(read_length[1])
+                is_dual_index = False
+                if (index1_size != 0 and index2_size != 0) or (
+                    index1_size == 0 and index2_size != 0
+                ):
+                    is_dual_index = True
+                base_mask = self._compute_base_mask(
+                    runSetup,
+                    sample_type,
+                    index1_size,
+                    is_dual_index,
+                    index2_size,
+                    umi1_size,
+                    umi2_size,
+                    read1_size,
+                    read2_size,
                 )
-            elif self.software == "bclconvert":
-                unique_masks = []
-                for masks in lane_table.values():
-                    for mask in masks:
-                        if mask not in unique_masks:
-                            unique_masks.append(mask)
-                demux_number_with_the_same_sample_type = len(unique_masks)
-            # Prepare sub-samplesheets, masks and commands
-            for i in range(0, demux_number_with_the_same_sample_type):
-                # Prepare sub-samplesheet
-                # A dictionary with lane and sample IDs to include
-                samples_to_include = dict()
-                # A dictionary with lane and index length for generating masks
-                mask_table = dict()
-                if self.software == "bcl2fastq":
-                    for lane, lane_contents in self.sample_table.items():
-                        try:
-                            (index_length, umi_length, read_length) = lane_table[lane][
-                                i
-                            ]
-                            mask_table.update(
-                                {lane: (index_length, umi_length, read_length)}
-                            )
-                            for sample in lane_contents:
-                                sample_name = sample[0]
-                                sample_detail = sample[1]
-                                sample_type_t = sample_detail["sample_type"]
-                                sample_index_length = sample_detail["index_length"]
-                                sample_umi_length = sample_detail["umi_length"]
-                                sample_read_length = sample_detail["read_length"]
-                                if (
-                                    sample_type_t == sample_type
-                                    and sample_index_length == index_length
-                                    and sample_umi_length == umi_length
-                                    and sample_read_length == read_length
-                                ):
-                                    if samples_to_include.get(lane):
-                                        samples_to_include[lane].append(sample_name)
-                                    else:
-                                        samples_to_include.update({lane: [sample_name]})
-                        except (KeyError, IndexError):
-                            logger.info(
-                                f"No corresponding mask in lane {lane}. Skip it."
-                            )
-                            continue
-                elif self.software == "bclconvert":
-                    mask = unique_masks[i]
-                    for lane, lane_contents in self.sample_table.items():
-                        if lane_table.get(lane):
-                            if mask in lane_table[lane]:
-                                mask_table.update({lane: mask})
-                                for sample in lane_contents:
-                                    sample_name = sample[0]
-                                    sample_detail = sample[1]
-                                    sample_type_t = sample_detail["sample_type"]
-                                    sample_index_length = sample_detail["index_length"]
-                                    sample_umi_length = sample_detail["umi_length"]
-                                    sample_read_length = sample_detail["read_length"]
-                                    if (
-                                        sample_type_t == sample_type
-                                        and sample_index_length == mask[0]
-                                        and sample_umi_length == mask[1]
-                                        and sample_read_length == mask[2]
-                                    ):
-                                        if samples_to_include.get(lane):
-                                            samples_to_include[lane].append(sample_name)
-                                        else:
-                                            samples_to_include.update(
-                                                {lane: [sample_name]}
-                                            )
-
-                if self.software == "bclconvert":
-                    runSetup = self.runParserObj.runinfo.get_read_configuration()
-                    (index_length, umi_length, read_length) = mask
-                    index1_size = int(index_length[0])
-                    index2_size = int(index_length[1])
-                    umi1_size = int(umi_length[0])
-                    umi2_size = int(umi_length[1])
-                    read1_size = int(read_length[0])
-                    read2_size = int(read_length[1])
-                    is_dual_index = False
-                    if (index1_size != 0 and index2_size != 0) or (
-                        index1_size == 0 and index2_size != 0
-                    ):
-                        is_dual_index = True
-                    base_mask = self._compute_base_mask(
-                        runSetup,
-                        sample_type,
-                        index1_size,
-                        is_dual_index,
-                        index2_size,
-                        umi1_size,
-                        umi2_size,
-                        read1_size,
-                        read2_size,
-                    )
-                else:
-                    index1_size = 0
-                    index2_size = 0
-                    base_mask = []
-                # Make sub-samplesheet
-                with chdir(self.run_dir):
-                    samplesheet_dest = f"SampleSheet_{bcl_cmd_counter}.csv"
-                    with open(samplesheet_dest, "w") as fcd:
-                        fcd.write(
-                            self._generate_samplesheet_subset(
-                                self.runParserObj.samplesheet,
-                                samples_to_include,
-                                runSetup,
-                                self.software,
-                                sample_type,
-                                index1_size,
-                                index2_size,
-                                base_mask,
-                                self.CONFIG,
-                            )
+            else:
+                index1_size = 0
+                index2_size = 0
+                base_mask = []
+            # Make sub-samplesheet
+            with chdir(self.run_dir):
+                samplesheet_dest = f"SampleSheet_{bcl_cmd_counter}.csv"
+                samplesheet_subset = self.runParserObj.samplesheet.subset(
+                    samples_to_include
+                )
+                with open(samplesheet_dest, "w") as fcd:
+                    fcd.write(
+                        self._generate_samplesheet_subset(
+                            self.runParserObj.samplesheet,
+                            samples_to_include,
+                            runSetup,
+                            self.software,
+                            sample_type,
+                            index1_size,
+                            index2_size,
+                            base_mask,
+                            self.CONFIG,
                         )
+                    )
+            # Keep the model of the sub-samplesheet for the aggregation
+            self._store_samplesheet(
+                os.path.join(self.run_dir, samplesheet_dest), samplesheet_subset
+            )
 
-                # Prepare demultiplexing dir
-                with chdir(self.run_dir):
-                    # Create Demultiplexing dir, this changes the status to IN_PROGRESS
-                    if not os.path.exists("Demultiplexing"):
-                        os.makedirs("Demultiplexing")
-
-                # Prepare demultiplexing command
-                with chdir(self.run_dir):
-                    cmd = self.generate_bcl_command(
-                        sample_type, mask_table, bcl_cmd_counter
+            # Prepare demultiplexing dir
+            with chdir(self.run_dir):
+                # Create Demultiplexing dir, this changes the status to IN_PROGRESS
+                if not os.path.exists("Demultiplexing"):
+                    os.makedirs("Demultiplexing")
+                self.invalidate_state()
+
+            # Prepare demultiplexing command
+            with chdir(self.run_dir):
+                cmd = self.generate_bcl_command(
+                    sample_type, mask_table, bcl_cmd_counter
+                )
+                if scheduler:
+                    # Demultiplex the largest set of lanes first
+                    self._submit_bcl_command(
+                        scheduler,
+                        cmd,
+                        bcl_cmd_counter,
+                        priority=len(mask_table),
+                        n_groups=len(plans),
+                    )
+                    logger.info(
+                        "BCL to FASTQ conversion and demultiplexing "
+                        f"queued for run {os.path.basename(self.id)} on {datetime.now()}"
                     )
+                else:
                     misc.call_external_command_detached(
                         cmd, with_log_files=True, prefix=f"demux_{bcl_cmd_counter}"
                     )
@@ -429,11 +280,77 @@ class Standard_Run(Run):
                         f"started for run {os.path.basename(self.id)} on {datetime.now()}"
                     )
 
-                # Demultiplexing done for one mask type and scripts will continue
-                # Working with the next type. Command counter should increase by 1
-                bcl_cmd_counter += 1
         return True
 
+    def plan_demultiplexing(self):
+        """Return the sub-demultiplexings needed for the samples of the run, see
+        :func:`taca.illumina.demux_plan.plan_demultiplexing`.
+
+        The samples are classified if not yet done, without writing anything to
+        the run folder, so that the plan can be inspected before demultiplexing.
+        The plan of a run without samplesheet is empty.
+        """
+        if not hasattr(self, "sample_table"):
+            try:
+                ssname = self._get_samplesheet()
+            except RuntimeError as e:
+                logger.warning(f"No demultiplexing to plan for run {self.id}: {e}")
+                return []
+            # Some MiSeq runs have no samplesheet at all
+            if ssname is None:
+                return []
+            self.sample_table = self._classify_samples(
+                self._get_index_files(),
+                SampleSheet.from_parser(self._parse_samplesheet(ssname)),
+                self.runParserObj.runinfo.get_read_configuration(),
+            )
+        return demux_plan.plan_demultiplexing(self.sample_table, self.software)
+
+    def get_job_cores(self, n_groups, budget=None):
+        """Return the number of cores of each demultiplexing job.
+
+        Unless set with job_cores, the cores of the budget are shared by the
+        sub-demultiplexings of the run, with at least job_min_cores (4 by
+        default) each, and the sub-demultiplexings not fitting in the budget
+        are queued.
+
+        :param int n_groups: Number of sub-demultiplexings of the run
+        :param int budget: Number of cores available on the host, if limited
+        """
+        software_config = self.CONFIG.get(self.software)
+        if "job_cores" in software_config:
+            return software_config["job_cores"]
+        if not budget:
+            return 0
+        min_cores = software_config.get("job_min_cores", 4)
+        return min(budget, max(min_cores, budget // max(n_groups, 1)))
+
+    def _submit_bcl_command(
+        self, scheduler, cmd, bcl_cmd_counter, priority, n_groups=1
+    ):
+        """Queue a demultiplexing command on the host job scheduler.
+
+        The cores given to each job are shared by the thread pools of the
+        demultiplexing software, unless set in the options of the software.
+        """
+        software_config = self.CONFIG.get(self.software)
+        cores = self.get_job_cores(n_groups, scheduler.cores)
+        if cores:
+            shares = THREAD_OPTIONS[self.software]
+            for option, share in shares.items():
+                if f"--{option}" not in cmd:
+                    threads = max(1, cores * share // sum(shares.values()))
+                    cmd.extend([f"--{option}", str(threads)])
+        scheduler.submit(
+            f"{self.id}_demux_{bcl_cmd_counter}",
+            cmd,
+            self.run_dir,
+            f"demux_{bcl_cmd_counter}",
+            cores=cores or 1,
+            memory_gb=software_config.get("job_memory_gb", 0),
+            priority=priority,
+        )
+
     def _aggregate_demux_results(self):
         """Take the Stats.json files from the different
         demultiplexing folders and merges them into one
@@ -774,6 +691,7 @@ class Standard_Run(Run):
         index_dict_tenX = self._parse_10X_indexes(indexfile["tenX"])
         index_dict_smartseq = self._parse_smartseq_indexes(indexfile["smartseq"])
         # Replace 10X or Smart-seq indices
+        new_samples = []
         for sample in ssparser.data:
             if sample["index"] in index_dict_tenX.keys():
                 tenX_index = sample["index"]
@@ -786,9 +704,9 @@ class Standard_Run(Run):
                     x = 0
                     indices_number = len(index_dict_tenX[tenX_index])
                     while x < indices_number - 1:
-                        new_sample = dict(sample)
+                        new_sample = sample.copy()
                         new_sample["index"] = index_dict_tenX[tenX_index][x]
-                        ssparser.data.append(new_sample)
+                        new_samples.append(new_sample)
                         x += 1
                     # Set the original 10X index to the 4th correct index
                     sample["index"] = index_dict_tenX[tenX_index][x]
@@ -797,17 +715,20 @@ class Standard_Run(Run):
                 smartseq_index = sample["index"].split("-")[1]
                 indices_number = len(index_dict_smartseq[smartseq_index])
                 while x < indices_number - 1:
-                    new_sample = dict(sample)
+                    new_sample = sample.copy()
                     new_sample["index"] = index_dict_smartseq[smartseq_index][x][0]
                     new_sample["index2"] = index_dict_smartseq[smartseq_index][x][1]
-                    ssparser.data.append(new_sample)
+                    new_samples.append(new_sample)
                     x += 1
                 sample["index"] = index_dict_smartseq[smartseq_index][x][0]
                 sample["index2"] = index_dict_smartseq[smartseq_index][x][1]
 
         # Sort to get the added indicies from 10x in the right place
         # Python 3 doesn't support sorting a list of dicts implicitly. Sort by lane and then Sample_ID
-        ssparser.data.sort(key=lambda item: (item.get("Lane"), item.get("Sample_ID")))
+        ssparser.data = sorted(
+            ssparser.data + new_samples,
+            key=lambda item: (item.get("Lane"), item.get("Sample_ID")),
+        )
 
         if not fields_to_remove:
             fields_to_remove = []
@@ -911,31 +832,23 @@ class Standard_Run(Run):
             datafields.append(field)
         output += ",".join(datafields)
         output += os.linesep
-        for line in ssparser.data:
-            sample_name = line.get("Sample_Name") or line.get("SampleName")
-            lane = line["Lane"]
+        for line in ssparser.subset(samples_to_include).data:
             noindex_flag = False
-            if lane in samples_to_include.keys():
-                if sample_name in samples_to_include.get(lane):
-                    line_ar = []
-                    for field in datafields:
-                        # Case with NoIndex
-                        if field == "index" and "NOINDEX" in line["index"].upper():
-                            line[field] = (
-                                "T" * index_cycles[0] if index_cycles[0] != 0 else ""
-                            )
-                            noindex_flag = True
-                        if field == "index2" and noindex_flag:
-                            line[field] = (
-                                "A" * index_cycles[1] if index_cycles[1] != 0 else ""
-                            )
-                            noindex_flag = False
-                        # Case of IDT UMI
-                        if (
-                            field == "index" or field == "index2"
-                        ) and IDT_UMI_PAT.findall(line[field]):
-                            line[field] = line[field].replace("N", "")
-                        line_ar.append(line[field])
-                    output += ",".join(line_ar)
-                    output += os.linesep
+            line_ar = []
+            for field in datafields:
+                # Case with NoIndex
+                if field == "index" and "NOINDEX" in line["index"].upper():
+                    line[field] = "T" * index_cycles[0] if index_cycles[0] != 0 else ""
+                    noindex_flag = True
+                if field == "index2" and noindex_flag:
+                    line[field] = "A" * index_cycles[1] if index_cycles[1] != 0 else ""
+                    noindex_flag = False
+                # Case of IDT UMI
+                if (field == "index" or field == "index2") and IDT_UMI_PAT.findall(
+                    line[field]
+                ):
+                    line[field] = line[field].replace("N", "")
+                line_ar.append(line[field])
+            output += ",".join(line_ar)
+            output += os.linesep
         return output
@@ -0,0 +1,58 @@
+"""Matching of unknown barcodes against known sample indexes."""
+
+from collections import defaultdict
+
+
+def split_barcode(barcode):
+    """Split an unknown barcode like ACGT+TTGA into its two indexes."""
+    idx1, _, idx2 = barcode.partition("+")
+    return idx1, idx2
+
+
+class KnownIndexPrefixes:
+    """Prefix index of the sample indexes used in a lane.
+
+    An unknown barcode overlaps a sample if, for both indexes, the shorter of
+    the sample index and the unknown index is a prefix of the other. Samples
+    with only index2 are compared on their index2 against index1 of the
+    barcode, and samples without indexes never overlap.
+
+    Sample index pairs are grouped by their lengths. For each group and each
+    length of unknown barcodes, the sample indexes truncated to the compared
+    length are kept in a hash set, so each lookup costs one set lookup per
+    group of index lengths instead of one comparison per sample.
+    """
+
+    def __init__(self, index_pairs=()):
+        self._by_length = defaultdict(set)
+        self._truncated = {}
+        for idx1, idx2 in index_pairs:
+            self.add(idx1, idx2)
+
+    def add(self, idx1, idx2):
+        idx1, idx2 = idx1 or "", idx2 or ""
+        if not idx1:
+            idx1, idx2 = idx2, ""
+        if not idx1:
+            return
+        self._by_length[(len(idx1), len(idx2))].add((idx1, idx2))
+        self._truncated.clear()
+
+    def matches(self, barcode):
+        """Return True if the unknown barcode overlaps any known index pair."""
+        idx1, idx2 = split_barcode(barcode)
+        for (len1, len2), pairs in self._by_length.items():
+            cut1 = min(len1, len(idx1))
+            cut2 = min(len2, len(idx2))
+            key = (len1, len2, cut1, cut2)
+            if key not in self._truncated:
+                self._truncated[key] = {(i1[:cut1], i2[:cut2]) for i1, i2 in pairs}
+            if (idx1[:cut1], idx2[:cut2]) in self._truncated[key]:
+                return True
+        return False
+
+    def remove_matching(self, barcodes):
+        """Remove the barcodes overlapping known indexes from a barcode: count dict."""
+        for barcode in [barcode for barcode in barcodes if self.matches(barcode)]:
+            del barcodes[barcode]
+        return barcodes
@@ -0,0 +1,133 @@
+"""Incremental scanning of bcl2fastq/bclconvert log files."""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Substrings marking error and warning lines in the logs of each software
+LOG_PATTERNS = {
+    "bcl2fastq": {"error": "ERROR", "warning": "WARN"},
+    "bclconvert": {"error": "ERROR", "warning": "WARNING"},
+}
+
+CHUNK_SIZE = 1024 * 1024
+# Number of error and warning lines kept, the rest are only counted
+MAX_MESSAGES = 100
+# Number of bytes at the start of the log used to recognize it
+HEAD_SIZE = 256
+
+
+class DemuxLogScanner:
+    """Counts error and warning lines of a demultiplexing log.
+
+    The log is streamed instead of read into memory, and the byte offset of
+    the last complete line scanned is persisted in state_file together with
+    the counts and the first MAX_MESSAGES messages found so far. Subsequent
+    scans only read the bytes appended since then, and the state file is only
+    written when they found any. The scan is restarted from the start if the
+    log has been truncated or replaced by another file, which is recognized by
+    its inode and first bytes. Without a state file the whole log is scanned
+    every time.
+    """
+
+    def __init__(self, demux_log, software, state_file=None):
+        if software not in LOG_PATTERNS:
+            raise RuntimeError("Unrecognized software!")
+        self.demux_log = demux_log
+        self.patterns = LOG_PATTERNS[software]
+        self.state_file = state_file
+
+    def _new_state(self):
+        return {"offset": 0, "head": "", "errors": 0, "warnings": 0, "messages": []}
+
+    def _load_state(self, log, log_stat):
+        if not self.state_file:
+            return self._new_state()
+        try:
+            with open(self.state_file) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            return self._new_state()
+        if state["offset"] > log_stat.st_size:
+            logger.info(f"{self.demux_log} has been truncated, scanning it again")
+            return self._new_state()
+        head = bytes.fromhex(state["head"])
+        if state["inode"] != [log_stat.st_dev, log_stat.st_ino] or (
+            log.read(len(head)) != head
+        ):
+            logger.info(f"{self.demux_log} has been replaced, scanning it again")
+            return self._new_state()
+        return state
+
+    def _save_state(self, log, log_stat, state):
+        if not self.state_file:
+            return
+        state["inode"] = [log_stat.st_dev, log_stat.st_ino]
+        log.seek(0)
+        state["head"] = log.read(min(state["offset"], HEAD_SIZE)).hex()
+        tmp_file = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_file, "w") as fh:
+                json.dump(state, fh)
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save scan state of {self.demux_log}: {e}")
+
+    def _classify(self, line, state):
+        if self.patterns["error"] in line:
+            state["errors"] += 1
+        elif self.patterns["warning"] in line:
+            state["warnings"] += 1
+        else:
+            return
+        if len(state["messages"]) < MAX_MESSAGES:
+            state["messages"].append(line)
+
+    def scan(self):
+        """Scan the log for error and warning lines.
+
+        :returns: A tuple with the number of error lines, the number of warning
+            lines and the list of these lines
+        """
+        with open(self.demux_log, "rb") as log:
+            log_stat = os.fstat(log.fileno())
+            state = self._load_state(log, log_stat)
+            scanned = (state["offset"], state["errors"], state["warnings"])
+            log.seek(state["offset"])
+            remainder = b""
+            while True:
+                chunk = log.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                lines = (remainder + chunk).split(b"\n")
+                remainder = lines.pop()
+                for line in lines:
+                    self._classify(
+                        line.decode(errors="replace").rstrip("\r") + "\n", state
+                    )
+                state["offset"] = log.tell() - len(remainder)
+            # Only store the state if something was scanned, to not rewrite it
+            # on every check of a finished log
+            if (state["offset"], state["errors"], state["warnings"]) != scanned:
+                self._save_state(log, log_stat, state)
+        # A last line without newline may still be written to, so it is
+        # counted but not persisted
+        if remainder:
+            self._classify(remainder.decode(errors="replace"), state)
+        return state["errors"], state["warnings"], state["messages"]
+
+    def last_line(self):
+        """Return the last line of the log, reading only the end of the file."""
+        with open(self.demux_log, "rb") as log:
+            log_size = os.fstat(log.fileno()).st_size
+            block_size = 4096
+            while True:
+                start = max(0, log_size - block_size)
+                log.seek(start)
+                lines = log.read(log_size - start).splitlines(keepends=True)
+                # The first line of the block may be incomplete
+                if len(lines) > 1 or start == 0:
+                    return lines[-1].decode(errors="replace") if lines else ""
+                block_size *= 2
@@ -0,0 +1,110 @@
+"""Planning of the sub-demultiplexings of an Illumina run."""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _group_samples(sample_table):
+    """Group the samples of a sample table by sample type, lane and mask.
+
+    :returns: A dict of sample type: dict of lane: dict of mask key: (mask,
+        list of sample names). Lanes and masks are in order of first appearance.
+    """
+    groups = {}
+    for lane, lane_contents in sample_table.items():
+        for sample_name, sample_detail in lane_contents:
+            mask = (
+                sample_detail["index_length"],
+                sample_detail["umi_length"],
+                sample_detail["read_length"],
+            )
+            mask_key = tuple(tuple(lengths) for lengths in mask)
+            lane_masks = groups.setdefault(sample_detail["sample_type"], {}).setdefault(
+                lane, {}
+            )
+            lane_masks.setdefault(mask_key, (mask, []))[1].append(sample_name)
+    return groups
+
+
+def plan_demultiplexing(sample_table, software):
+    """Plan the sub-demultiplexings needed for the samples of a run.
+
+    Samples are demultiplexed together if they have the same sample type and
+    the same (index_length, umi_length, read_length) mask. With bcl2fastq a
+    sub-demultiplexing can use a different mask in each lane, so the n-th mask
+    of each lane is demultiplexed in the n-th sub-demultiplexing of a sample
+    type. With bclconvert each distinct mask is a sub-demultiplexing.
+
+    :param dict sample_table: A dict of lane: list of (sample name, sample
+        detail) tuples, as returned by Standard_Run._classify_samples
+    :param str software: bcl2fastq or bclconvert
+    :returns: A list of dicts with the keys demux_id, sample_type, mask (None
+        for bcl2fastq), mask_table (lane: mask) and samples_to_include (lane:
+        list of sample names)
+    """
+    plans = []
+    groups = _group_samples(sample_table)
+    for sample_type in sorted(groups):
+        lanes = groups[sample_type]
+        if software == "bcl2fastq":
+            for i in range(max(len(lane_masks) for lane_masks in lanes.values())):
+                mask_table = {}
+                samples_to_include = {}
+                for lane in sample_table:
+                    lane_masks = list(lanes.get(lane, {}).values())
+                    if i >= len(lane_masks):
+                        logger.info(f"No corresponding mask in lane {lane}. Skip it.")
+                        continue
+                    mask_table[lane], samples = lane_masks[i]
+                    samples_to_include[lane] = list(samples)
+                plans.append(
+                    {
+                        "sample_type": sample_type,
+                        "mask": None,
+                        "mask_table": mask_table,
+                        "samples_to_include": samples_to_include,
+                    }
+                )
+        elif software == "bclconvert":
+            unique_masks = {}
+            for lane_masks in lanes.values():
+                for mask_key, (mask, _) in lane_masks.items():
+                    unique_masks.setdefault(mask_key, mask)
+            for mask_key, mask in unique_masks.items():
+                mask_table = {}
+                samples_to_include = {}
+                for lane, lane_masks in lanes.items():
+                    if mask_key in lane_masks:
+                        mask_table[lane] = mask
+                        samples_to_include[lane] = list(lane_masks[mask_key][1])
+                plans.append(
+                    {
+                        "sample_type": sample_type,
+                        "mask": mask,
+                        "mask_table": mask_table,
+                        "samples_to_include": samples_to_include,
+                    }
+                )
+        else:
+            raise RuntimeError("Unrecognized software!")
+    for demux_id, plan in enumerate(plans):
+        plan["demux_id"] = demux_id
+    return plans
+
+
+def format_demux_plan(plans):
+    """Format a demultiplexing plan as human readable text."""
+    lines = []
+    for plan in plans:
+        lines.append(
+            f"Demultiplexing_{plan['demux_id']}: sample type {plan['sample_type']}"
+        )
+        for lane, mask in plan["mask_table"].items():
+            index_length, umi_length, read_length = mask
+            lines.append(
+                f"  Lane {lane}: index length {index_length}, "
+                f"UMI length {umi_length}, read length {read_length}, "
+                f"{len(plan['samples_to_include'].get(lane, []))} samples"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,145 @@
+"""Process-wide catalogs of 10X and Smart-seq indexes and sample classification."""
+
+import re
+from collections.abc import Callable
+
+from taca.utils.metadata_cache import file_fingerprint
+
+TENX_SINGLE_PAT = re.compile("SI-(?:GA|NA)-[A-H][1-9][0-2]?")
+TENX_DUAL_PAT = re.compile("SI-(?:TT|NT|NN|TN|TS)-[A-H][1-9][0-2]?")
+SMARTSEQ_PAT = re.compile("SMARTSEQ[1-9]?-[1-9][0-9]?[A-P]")
+IDT_UMI_PAT = re.compile("([ATCG]{4,}N+$)")
+
+_index_files: dict[tuple[Callable, str], tuple[tuple, dict]] = {}
+_catalogs: dict[tuple[str, str], "IndexCatalog"] = {}
+
+
+def parse_10X_indexes(indexfile):
+    """Parse a file of 10X indexes into a dict of index name: list of indexes."""
+    index_dict = {}
+    with open(indexfile) as f:
+        for line in f:
+            line_ = line.rstrip().split(",")
+            index_dict[line_[0]] = line_[1:5]
+    return index_dict
+
+
+def parse_smartseq_indexes(indexfile):
+    """Parse a file of Smart-seq indexes into a dict of index name: list of
+    (index, index2) tuples.
+    """
+    index_dict = {}
+    with open(indexfile) as f:
+        for line in f:
+            line_ = line.rstrip().split(",")
+            index_dict.setdefault(line_[0], []).append((line_[1], line_[2]))
+    return index_dict
+
+
+class IndexCatalog:
+    """The 10X and Smart-seq indexes used to classify the samples of a run.
+
+    The classification of each distinct (index, index2) pair is memoized, so
+    that samplesheets with many samples sharing indexes are classified with
+    one dict lookup per sample. The index dicts are shared by all users of
+    the catalog and must not be modified.
+    """
+
+    def __init__(self, tenX_indexes, smartseq_indexes):
+        self.tenX = tenX_indexes
+        self.smartseq = smartseq_indexes
+        self._classified = {}
+
+    def classify(self, index, index2, index_cycles):
+        """Return the sample type, index lengths and UMI lengths of a sample.
+
+        :param str index: The index of the sample, or an index name
+        :param str index2: The index2 of the sample
+        :param list index_cycles: The number of cycles of index 1 and 2 of the run
+        :returns: A tuple (sample_type, index_length, umi_length)
+        :raises KeyError: If a 10X or Smart-seq index name is not in the catalog
+        """
+        key = (index, index2, tuple(index_cycles))
+        if key not in self._classified:
+            self._classified[key] = self._classify(index, index2, index_cycles)
+        sample_type, index_length, umi_length = self._classified[key]
+        return sample_type, list(index_length), list(umi_length)
+
+    def _classify(self, index, index2, index_cycles):
+        umi_length = (0, 0)
+        # 10X single index
+        if TENX_SINGLE_PAT.findall(index):
+            index_length = (len(self.tenX[index][0]), 0)
+            sample_type = "10X_SINGLE"
+        # 10X dual index
+        elif TENX_DUAL_PAT.findall(index):
+            index_length = (len(self.tenX[index][0]), len(self.tenX[index][1]))
+            sample_type = "10X_DUAL"
+        # IDT UMI samples
+        elif IDT_UMI_PAT.findall(index) or IDT_UMI_PAT.findall(index2):
+            # Index length after removing "N" part
+            index_length = (len(index.replace("N", "")), len(index2.replace("N", "")))
+            sample_type = "IDT_UMI"
+            umi_length = (index.upper().count("N"), index2.upper().count("N"))
+        # Smart-seq
+        elif SMARTSEQ_PAT.findall(index):
+            smartseq_index = index.split("-")[1]
+            index_length = (
+                len(self.smartseq[smartseq_index][0][0]),
+                len(self.smartseq[smartseq_index][0][1]),
+            )
+            sample_type = "SMARTSEQ"
+        # No Index case 1. We will write indexes to separate FastQ files
+        elif index.upper() == "NOINDEX" and index_cycles != [0, 0]:
+            index_length = tuple(index_cycles)
+            sample_type = "NOINDEX"
+        # No Index case 2. Both index 1 and 2 are empty, it will be the same index type but will be handled in the next case
+        elif index.upper() == "NOINDEX" and index_cycles == [0, 0]:
+            index_length = (0, 0)
+            sample_type = "ordinary"
+        # Ordinary samples
+        else:
+            index_length = (len(index), len(index2))
+            # Short single index (<=6nt)
+            if (index_length[0] <= 8 and index_length[1] == 0) or (
+                index_length[0] == 0 and index_length[1] <= 8
+            ):
+                sample_type = "short_single_index"
+            else:
+                sample_type = "ordinary"
+        return sample_type, index_length, umi_length
+
+
+def _load(parse, indexfile):
+    """Parse an index file once per process, and again only if it changed."""
+    fingerprint = file_fingerprint([indexfile])
+    cached = _index_files.get((parse, indexfile))
+    if cached is None or cached[0] != fingerprint:
+        cached = (fingerprint, parse(indexfile))
+        _index_files[(parse, indexfile)] = cached
+    return cached[1]
+
+
+def get_10X_indexes(indexfile):
+    """Return the 10X indexes of a file, see :func:`parse_10X_indexes`."""
+    return _load(parse_10X_indexes, indexfile)
+
+
+def get_smartseq_indexes(indexfile):
+    """Return the Smart-seq indexes of a file, see :func:`parse_smartseq_indexes`."""
+    return _load(parse_smartseq_indexes, indexfile)
+
+
+def get_index_catalog(tenX_index_path, smartseq_index_path):
+    """Return the catalog of the given index files.
+
+    Catalogs are kept for the lifetime of the process and replaced when one of
+    their index files changes.
+    """
+    tenX = get_10X_indexes(tenX_index_path)
+    smartseq = get_smartseq_indexes(smartseq_index_path)
+    key = (tenX_index_path, smartseq_index_path)
+    catalog = _catalogs.get(key)
+    if catalog is None or catalog.tenX is not tenX or catalog.smartseq is not smartseq:
+        catalog = _catalogs[key] = IndexCatalog(tenX, smartseq)
+    return catalog
@@ -0,0 +1,281 @@
+"""Reading of Illumina InterOp metrics into NumPy structured arrays.
+
+The binary InterOp files start with a header holding the format version and
+the size of a record, followed by fixed size records. The records are memory
+mapped as structured arrays, and the per lane aggregates are computed with
+vectorized reductions. A record only partially written by the instrument is
+ignored, so the files can be read while the run is sequencing.
+"""
+
+import logging
+import os
+import struct
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TILE_METRICS = "TileMetricsOut.bin"
+Q_METRICS = "QMetricsOut.bin"
+ERROR_METRICS = "ErrorMetricsOut.bin"
+EXTRACTION_METRICS = "ExtractionMetricsOut.bin"
+# InterOp files read by summarize_interop
+SUMMARY_FILES = [EXTRACTION_METRICS, Q_METRICS, TILE_METRICS, ERROR_METRICS]
+
+# Tile metric codes of version 2 of TileMetricsOut.bin
+TILE_CLUSTER_DENSITY = 100
+TILE_CLUSTER_COUNT = 102
+TILE_PF_CLUSTER_COUNT = 103
+
+# Number of quality scores of unbinned QMetricsOut.bin histograms
+Q_SCORES = 50
+
+
+class InterOpError(Exception):
+    """Raised when an InterOp file has an unsupported version or is corrupt."""
+
+
+def _read_header(path, size):
+    """Read the first bytes of an InterOp file, which may still be being written."""
+    with open(path, "rb") as fh:
+        header = fh.read(size)
+    if len(header) < size:
+        raise InterOpError(f"Truncated header of {path}")
+    return header
+
+
+def _map_records(path, header_size, dtype):
+    """Memory map the complete records of an InterOp file as a structured array."""
+    dtype = np.dtype(dtype)
+    count = (os.path.getsize(path) - header_size) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(count,))
+
+
+def _check_record_size(path, version, record_size, dtype):
+    if np.dtype(dtype).itemsize != record_size:
+        raise InterOpError(
+            f"Unexpected record size {record_size} for version {version} of {path}"
+        )
+
+
+def read_tile_metrics(path):
+    """Read TileMetricsOut.bin (versions 2 and 3).
+
+    :returns: A structured array with the fields lane, cluster_count,
+        pf_cluster_count and cluster_density (clusters/mm2) of each tile
+    """
+    version, record_size = _read_header(path, 2)
+    if version == 2:
+        dtype = [("lane", "<u2"), ("tile", "<u2"), ("code", "<u2"), ("value", "<f4")]
+        _check_record_size(path, version, record_size, dtype)
+        records = _map_records(path, 2, dtype)
+        codes = (TILE_CLUSTER_DENSITY, TILE_CLUSTER_COUNT, TILE_PF_CLUSTER_COUNT)
+        records = records[np.isin(records["code"], codes)]
+        # One row per tile, with one column per code
+        tile_keys, tile_index = np.unique(
+            (records["lane"].astype(np.uint64) << 32) | records["tile"],
+            return_inverse=True,
+        )
+        values = np.zeros((len(tile_keys), len(codes)))
+        values[tile_index, np.searchsorted(codes, records["code"])] = records["value"]
+        density, clusters, pf_clusters = values.T
+        lanes = tile_keys >> 32
+    elif version == 3:
+        # The header holds the area of a tile, in mm2
+        (tile_area,) = struct.unpack("<f", _read_header(path, 6)[2:])
+        dtype = [
+            ("lane", "<u2"),
+            ("tile", "<u4"),
+            ("code", "u1"),
+            ("value1", "<f4"),
+            ("value2", "<f4"),
+        ]
+        _check_record_size(path, version, record_size, dtype)
+        records = _map_records(path, 6, dtype)
+        # Cluster counts are recorded with the code "t"
+        tiles = records[records["code"] == ord("t")]
+        lanes = tiles["lane"]
+        clusters = tiles["value1"].astype(np.float64)
+        pf_clusters = tiles["value2"].astype(np.float64)
+        density = clusters / tile_area if tile_area else np.full(len(tiles), np.nan)
+    else:
+        raise InterOpError(f"Unsupported version {version} of {path}")
+    summary = np.zeros(
+        len(clusters),
+        dtype=[
+            ("lane", "<u2"),
+            ("cluster_count", "<f8"),
+            ("pf_cluster_count", "<f8"),
+            ("cluster_density", "<f8"),
+        ],
+    )
+    summary["lane"] = lanes
+    summary["cluster_count"] = clusters
+    summary["pf_cluster_count"] = pf_clusters
+    summary["cluster_density"] = density
+    return summary
+
+
+def read_q_metrics(path):
+    """Read QMetricsOut.bin (versions 4 to 7).
+
+    :returns: A tuple of a structured array with the fields lane, tile, cycle
+        and hist (the number of clusters per quality score bin), and an array
+        with the quality score of each bin
+    """
+    header = _read_header(path, 3)
+    version, record_size = header[0], header[1]
+    if version not in (4, 5, 6, 7):
+        raise InterOpError(f"Unsupported version {version} of {path}")
+    header_size = 2
+    qscores = np.arange(1, Q_SCORES + 1)
+    if version > 4:
+        header_size = 3
+        if header[2]:
+            # Binned quality scores: count, lower bounds, upper bounds and values
+            (bin_count,) = _read_header(path, 4)[3:]
+            header_size = 4 + 3 * bin_count
+            bin_values = _read_header(path, header_size)[4 + 2 * bin_count :]
+            if version > 5:
+                qscores = np.frombuffer(bin_values, dtype="u1").astype(int)
+    tile_type = "<u4" if version == 7 else "<u2"
+    dtype = [
+        ("lane", "<u2"),
+        ("tile", tile_type),
+        ("cycle", "<u2"),
+        ("hist", "<u4", (len(qscores),)),
+    ]
+    _check_record_size(path, version, record_size, dtype)
+    return _map_records(path, header_size, dtype), qscores
+
+
+def read_error_metrics(path):
+    """Read ErrorMetricsOut.bin (versions 3 and 4).
+
+    :returns: A structured array with the fields lane, tile, cycle and error_rate
+    """
+    version, record_size = _read_header(path, 2)
+    if version == 3:
+        dtype = [
+            ("lane", "<u2"),
+            ("tile", "<u2"),
+            ("cycle", "<u2"),
+            ("error_rate", "<f4"),
+            ("errors", "<u4", (5,)),
+        ]
+    elif version == 4:
+        dtype = [
+            ("lane", "<u2"),
+            ("tile", "<u4"),
+            ("cycle", "<u2"),
+            ("error_rate", "<f4"),
+        ]
+    else:
+        raise InterOpError(f"Unsupported version {version} of {path}")
+    _check_record_size(path, version, record_size, dtype)
+    return _map_records(path, 2, dtype)
+
+
+def read_extraction_metrics(path):
+    """Read ExtractionMetricsOut.bin (versions 2 and 3).
+
+    :returns: A structured array with the fields lane, tile, cycle, fwhm and
+        intensity, the last two with one value per channel
+    """
+    version, record_size = _read_header(path, 2)
+    if version == 2:
+        header_size = 2
+        dtype = [
+            ("lane", "<u2"),
+            ("tile", "<u2"),
+            ("cycle", "<u2"),
+            ("fwhm", "<f4", (4,)),
+            ("intensity", "<u2", (4,)),
+            ("date_time", "<u8"),
+        ]
+    elif version == 3:
+        header_size = 3
+        channels = _read_header(path, 3)[2]
+        dtype = [
+            ("lane", "<u2"),
+            ("tile", "<u4"),
+            ("cycle", "<u2"),
+            ("fwhm", "<f4", (channels,)),
+            ("intensity", "<u2", (channels,)),
+        ]
+    else:
+        raise InterOpError(f"Unsupported version {version} of {path}")
+    _check_record_size(path, version, record_size, dtype)
+    return _map_records(path, header_size, dtype)
+
+
+def _lane_sums(lanes, values):
+    """Sum values per lane, returning the lanes and their sums."""
+    lanes, lane_index = np.unique(lanes, return_inverse=True)
+    return lanes, np.bincount(lane_index, weights=values, minlength=len(lanes))
+
+
+def _ratio(numerator, denominator):
+    return float(numerator / denominator) if denominator else None
+
+
+def summarize_interop(interop_dir):
+    """Summarize the InterOp metrics of a run per lane.
+
+    Metrics whose InterOp file is missing are left out of the summary.
+
+    :param str interop_dir: Path to the InterOp folder of a run
+    :returns: A dict of lane: dict of metrics, with the lanes as strings. The
+        metrics are cycles_extracted, percent_q30, cluster_density (K/mm2),
+        percent_pf and error_rate (%)
+    """
+    summary = {}
+
+    def add(lanes, name, values):
+        for lane, value in zip(lanes, values):
+            summary.setdefault(str(lane), {})[name] = value
+
+    path = os.path.join(interop_dir, EXTRACTION_METRICS)
+    if os.path.exists(path):
+        records = read_extraction_metrics(path)
+        lanes, lane_index = np.unique(records["lane"], return_inverse=True)
+        cycles = np.zeros(len(lanes), dtype=int)
+        np.maximum.at(cycles, lane_index, records["cycle"])
+        add(lanes, "cycles_extracted", [int(cycle) for cycle in cycles])
+
+    path = os.path.join(interop_dir, Q_METRICS)
+    if os.path.exists(path):
+        records, qscores = read_q_metrics(path)
+        hist = records["hist"].astype(np.float64)
+        lanes, q30 = _lane_sums(records["lane"], hist[:, qscores >= 30].sum(axis=1))
+        _, total = _lane_sums(records["lane"], hist.sum(axis=1))
+        add(lanes, "percent_q30", [_ratio(100 * q, t) for q, t in zip(q30, total)])
+
+    path = os.path.join(interop_dir, TILE_METRICS)
+    if os.path.exists(path):
+        tiles = read_tile_metrics(path)
+        lanes, clusters = _lane_sums(tiles["lane"], tiles["cluster_count"])
+        _, pf_clusters = _lane_sums(tiles["lane"], tiles["pf_cluster_count"])
+        _, density = _lane_sums(tiles["lane"], tiles["cluster_density"])
+        _, tile_count = _lane_sums(tiles["lane"], np.ones(len(tiles)))
+        add(
+            lanes,
+            "cluster_density",
+            [_ratio(d / 1000, n) for d, n in zip(density, tile_count)],
+        )
+        add(
+            lanes,
+            "percent_pf",
+            [_ratio(100 * pf, c) for pf, c in zip(pf_clusters, clusters)],
+        )
+
+    path = os.path.join(interop_dir, ERROR_METRICS)
+    if os.path.exists(path):
+        records = read_error_metrics(path)
+        lanes, errors = _lane_sums(records["lane"], records["error_rate"])
+        _, counts = _lane_sums(records["lane"], np.ones(len(records)))
+        add(lanes, "error_rate", [_ratio(e, n) for e, n in zip(errors, counts)])
+
+    return summary
@@ -0,0 +1,142 @@
+"""Merging of the lane.html and laneBarcode.html reports of sub-demultiplexings."""
+
+# Columns of laneBarcode.html identifying a row, the others are numbers
+CONSTANT_KEYS = ["Lane", "Barcode sequence", "Project", "Sample"]
+
+
+def _to_int(value):
+    return int(value.replace(",", ""))
+
+
+def merge_lane_data(reports):
+    """Merge the sample_data of lane.html reports.
+
+    Each lane is taken from the first report it appears in.
+
+    :param list reports: The sample_data of each lane.html, in priority order
+    :returns: The merged list of lane rows
+    """
+    lanes = {}
+    for sample_data in reports:
+        for entry in sample_data:
+            lanes.setdefault(entry["Lane"], entry)
+    return list(lanes.values())
+
+
+def summarize_lanes(lane_data, complex_lanes):
+    """Sum up the clusters and yields of merged lane.html rows.
+
+    The barcode percentages of complex lanes are cleared, as they are not
+    meaningful for a lane demultiplexed in several parts.
+
+    :param list lane_data: Merged lane rows, see :func:`merge_lane_data`
+    :param dict complex_lanes: The lanes demultiplexed in several parts
+    :returns: A tuple (number_reads_summary, flowcell_data) of the total
+        cluster/yield of each lane and the updated flowcell summary values
+    """
+    number_reads_summary = {}
+    clusters_raw = 0
+    clusters_pf = 0
+    yield_mbases = 0
+    for entry in lane_data:
+        lane_clusters = _to_int(entry["PF Clusters"])
+        lane_yield = _to_int(entry["Yield (Mbases)"])
+        number_reads_summary[entry["Lane"]] = {
+            "total_lane_cluster": lane_clusters,
+            "total_lane_yield": lane_yield,
+        }
+        clusters_raw += int(lane_clusters / float(entry["% PFClusters"]) * 100)
+        clusters_pf += lane_clusters
+        yield_mbases += lane_yield
+        if entry["Lane"] in complex_lanes:
+            entry["% Perfectbarcode"] = None
+            entry["% One mismatchbarcode"] = None
+    flowcell_data = {
+        "Clusters (Raw)": f"{clusters_raw:,}",
+        "Clusters(PF)": f"{clusters_pf:,}",
+        "Yield (MBases)": f"{yield_mbases:,}",
+    }
+    return number_reads_summary, flowcell_data
+
+
+def merge_lane_barcode_data(
+    reports, complex_lanes, number_reads_summary, noindex_lanes=None
+):
+    """Merge the sample_data of laneBarcode.html reports.
+
+    Every sub-demultiplexing of a complex lane reports its own undetermined
+    row. Only the first one is kept, with the clusters and yield of the lane
+    not assigned to any sample. Totals and undetermined rows are kept in
+    dicts keyed by lane, so the merge is linear in the number of rows.
+
+    :param list reports: The sample_data of each laneBarcode.html
+    :param dict complex_lanes: The lanes demultiplexed in several parts
+    :param dict number_reads_summary: Total cluster/yield of each lane, see
+        :func:`summarize_lanes`. The sample and undetermined totals are added.
+    :param list noindex_lanes: Lanes of NoIndex samples demultiplexed with a
+        fake index, whose undetermined reads belong to the sample of the lane
+    :returns: The merged list of rows, sorted by lane and sample
+    """
+    merged = []
+    undetermined = {}
+    for sample_data in reports:
+        for entry in sample_data:
+            lane = entry["Lane"]
+            if lane in complex_lanes and entry["Project"] in "default":
+                # For complex lanes only keep one undetermined row
+                if lane in undetermined:
+                    continue
+                for key in entry.keys():
+                    if key not in CONSTANT_KEYS:
+                        entry[key] = "0"
+                undetermined[lane] = entry
+            merged.append(entry)
+
+    # Sum up the clusters and yields assigned to samples
+    for entry in merged:
+        lane_summary = number_reads_summary[entry["Lane"]]
+        lane_summary.setdefault("total_sample_cluster", 0)
+        lane_summary.setdefault("total_sample_yield", 0)
+        if entry["Project"] != "default":
+            lane_summary["total_sample_cluster"] += _to_int(entry["PF Clusters"])
+            lane_summary["total_sample_yield"] += _to_int(entry["Yield (Mbases)"])
+    for lane_summary in number_reads_summary.values():
+        lane_summary["undet_cluster"] = (
+            lane_summary["total_lane_cluster"] - lane_summary["total_sample_cluster"]
+        )
+        lane_summary["undet_yield"] = (
+            lane_summary["total_lane_yield"] - lane_summary["total_sample_yield"]
+        )
+
+    # The undetermined reads of complex lanes are those not assigned to any sample
+    for lane, entry in undetermined.items():
+        entry["PF Clusters"] = "{:,}".format(
+            number_reads_summary[lane]["undet_cluster"]
+        )
+        entry["Yield (Mbases)"] = "{:,}".format(
+            number_reads_summary[lane]["undet_yield"]
+        )
+
+    # Undetermined reads of NoIndex lanes demultiplexed with a fake index are
+    # the reads of the sample of the lane
+    if noindex_lanes:
+        noindex_lanes = set(noindex_lanes)
+        lane_project_sample = {}
+        for entry in merged:
+            if entry["Lane"] in noindex_lanes and entry["Sample"] != "Undetermined":
+                lane_project_sample[entry["Lane"]] = (entry["Project"], entry["Sample"])
+        fixed = []
+        for entry in merged:
+            if entry["Lane"] not in noindex_lanes:
+                fixed.append(entry)
+            elif entry["Sample"] == "Undetermined":
+                entry["Project"], entry["Sample"] = lane_project_sample[entry["Lane"]]
+                fixed.append(entry)
+        merged = fixed
+
+    # Remove the trailing "_SX" postfix from samples names for BCL Convert when it handles SmartSeq3 libraries
+    for entry in merged:
+        if "_S" in entry["Sample"]:
+            entry["Sample"] = "_".join(entry["Sample"].split("_")[:2])
+
+    return sorted(merged, key=lambda k: (k["Lane"].lower(), k["Sample"]))
@@ -0,0 +1,233 @@
+"""In-memory model of an Illumina samplesheet."""
+
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _sample_name(row):
+    return row.get("Sample_Name") or row.get("SampleName")
+
+
+def _dfield_names(datafields):
+    """Return the dfield_* column names of a samplesheet, as SampleSheetParser does."""
+    return {
+        "dfield_sid": "SampleID" if "SampleID" in datafields else "Sample_ID",
+        "dfield_snm": "SampleName" if "SampleName" in datafields else "Sample_Name",
+        "dfield_proj": (
+            "SampleProject" if "SampleProject" in datafields else "Sample_Project"
+        ),
+    }
+
+
+class SampleSheetRow:
+    """A row of the [Data] section of a samplesheet.
+
+    Rows behave like the dicts returned by SampleSheetParser, but store their
+    values in a list and share the field positions with the other rows of the
+    samplesheet. Setting a field that is not a column of the samplesheet only
+    extends the fields of that row.
+    """
+
+    __slots__ = ("_fields", "_values")
+
+    def __init__(self, fields, values):
+        self._fields = fields
+        self._values = values
+
+    def __getitem__(self, field):
+        return self._values[self._fields[field]]
+
+    def __setitem__(self, field, value):
+        position = self._fields.get(field)
+        if position is None:
+            self._fields = {**self._fields, field: len(self._values)}
+            self._values.append(value)
+        else:
+            self._values[position] = value
+
+    def __contains__(self, field):
+        return field in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, (SampleSheetRow, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SampleSheetRow({dict(self.items())!r})"
+
+    def get(self, field, default=None):
+        position = self._fields.get(field)
+        return default if position is None else self._values[position]
+
+    def keys(self):
+        return self._fields.keys()
+
+    def values(self):
+        return [self._values[position] for position in self._fields.values()]
+
+    def items(self):
+        return [
+            (field, self._values[position]) for field, position in self._fields.items()
+        ]
+
+    def copy(self):
+        return SampleSheetRow(self._fields, list(self._values))
+
+
+class SampleSheet:
+    """A samplesheet with its rows indexed by lane.
+
+    The attributes used by TACA are the same as those of SampleSheetParser
+    (header, settings, datafields, data and the dfield_* column names), so the
+    model can be used wherever a parsed samplesheet is expected. Subsets are
+    views sharing the rows of the samplesheet they are taken from. The lane
+    index is rebuilt when data is assigned, rows should not be added to or
+    removed from the data list in place.
+    """
+
+    def __init__(
+        self,
+        header,
+        datafields,
+        data,
+        settings=None,
+        dfield_sid="Sample_ID",
+        dfield_snm="Sample_Name",
+        dfield_proj="Sample_Project",
+    ):
+        self.header = header
+        self.settings = settings if settings is not None else {}
+        self.datafields = datafields
+        self.dfield_sid = dfield_sid
+        self.dfield_snm = dfield_snm
+        self.dfield_proj = dfield_proj
+        self.data = data
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._lanes = None
+
+    @classmethod
+    def from_rows(cls, header, datafields, rows, **kwargs):
+        """Build a samplesheet from rows given as dicts."""
+        fields = {field: position for position, field in enumerate(datafields)}
+        data = [
+            SampleSheetRow(fields, [row.get(field, "") for field in datafields])
+            for row in rows
+        ]
+        return cls(dict(header), list(datafields), data, **kwargs)
+
+    @classmethod
+    def from_parser(cls, ssparser):
+        """Build a samplesheet from a parsed samplesheet.
+
+        The rows are copied, so the samplesheet can be modified without
+        modifying the parser.
+        """
+        return cls.from_rows(
+            ssparser.header,
+            ssparser.datafields,
+            ssparser.data,
+            settings=getattr(ssparser, "settings", None),
+            dfield_sid=getattr(ssparser, "dfield_sid", "Sample_ID"),
+            dfield_snm=getattr(ssparser, "dfield_snm", "Sample_Name"),
+            dfield_proj=getattr(ssparser, "dfield_proj", "Sample_Project"),
+        )
+
+    @classmethod
+    def read(cls, path):
+        """Read a samplesheet with [Header], [Settings] and [Data] sections.
+
+        This is the format of the samplesheets written by TACA. Blank lines
+        and lines of the [Reads] section are ignored. The dfield_* column
+        names are detected from the [Data] columns like SampleSheetParser does.
+        """
+        header = {}
+        settings = {}
+        data_lines = []
+        section = "data"
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                stripped = line.strip()
+                if stripped.startswith("["):
+                    section = stripped.split("]")[0][1:].lower()
+                    continue
+                if not stripped.strip(","):
+                    continue
+                if section == "header":
+                    key, _, value = stripped.partition(",")
+                    header[key] = value.split(",")[0]
+                elif section == "settings":
+                    key, _, value = stripped.partition(",")
+                    settings[key] = value.split(",")[0]
+                elif section == "data":
+                    data_lines.append(stripped)
+        if not data_lines:
+            return cls(header, [], [], settings=settings)
+        reader = csv.reader(data_lines)
+        datafields = next(reader)
+        fields = {field: position for position, field in enumerate(datafields)}
+        data = []
+        for values in reader:
+            values = values[: len(datafields)]
+            values.extend([""] * (len(datafields) - len(values)))
+            data.append(SampleSheetRow(fields, values))
+        return cls(
+            header, datafields, data, settings=settings, **_dfield_names(datafields)
+        )
+
+    def _index(self):
+        if self._lanes is None:
+            self._lanes = {}
+            for row in self._data:
+                self._lanes.setdefault(row["Lane"], []).append(row)
+        return self._lanes
+
+    @property
+    def lanes(self):
+        """The lanes of the samplesheet, in order of first appearance."""
+        return list(self._index())
+
+    def rows_in_lane(self, lane):
+        """Return the rows of a lane, in samplesheet order."""
+        return self._index().get(lane, [])
+
+    def subset(self, samples_to_include):
+        """Return the samplesheet restricted to some samples of some lanes.
+
+        :param dict samples_to_include: A dict of lane: list of sample names
+        :returns: A SampleSheet sharing the header and the rows of this one
+        """
+        included = {lane: set(samples) for lane, samples in samples_to_include.items()}
+        data = [
+            row
+            for row in self._data
+            if _sample_name(row) in included.get(row["Lane"], ())
+        ]
+        return SampleSheet(
+            self.header,
+            self.datafields,
+            data,
+            settings=self.settings,
+            dfield_sid=self.dfield_sid,
+            dfield_snm=self.dfield_snm,
+            dfield_proj=self.dfield_proj,
+        )
+
+    def to_dicts(self):
+        """Return the rows as a list of dicts, e.g. for a statusdb document."""
+        return [dict(row.items()) for row in self._data]
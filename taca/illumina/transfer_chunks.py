@@ -0,0 +1,71 @@
+"""Partitioning of run folders into chunks transferred by concurrent rsyncs."""
+
+import os
+import re
+import subprocess
+import tempfile
+
+LANE_RE = re.compile(r"_L0*(\d+)_")
+
+
+def list_transfer_files(run_dir, filter_options):
+    """List the files rsync would transfer from a run folder with some filters.
+
+    Uses a dry run of rsync, so that the filters keep the exact meaning they
+    have when the whole run folder is synced at once.
+
+    :param str run_dir: Path to the run folder
+    :param list filter_options: rsync include/exclude options
+    :returns: Paths relative to the parent of the run folder
+    :raises subprocess.CalledProcessError: If rsync fails
+    """
+    run_dir = os.path.normpath(run_dir)
+    # An empty destination, so that every file passing the filters is listed
+    with tempfile.TemporaryDirectory() as dest:
+        listing = subprocess.run(
+            ["rsync", "-Lrn", "--out-format=%n", *filter_options, run_dir, dest],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+    return [path for path in listing.splitlines() if path and not path.endswith("/")]
+
+
+def partition_run_files(files):
+    """Split the files of a run folder into independent transfer chunks.
+
+    Each project under Demultiplexing is a chunk, the files directly under
+    Demultiplexing (e.g. undetermined reads) are split by lane and everything
+    else, including the Reports and Stats of Demultiplexing, goes into a
+    metadata chunk.
+
+    :param list files: Paths relative to the parent of the run folder
+    :returns: A dict of chunk name: list of paths
+    """
+    chunks = {}
+    for path in files:
+        parts = path.split("/")
+        if (
+            len(parts) > 3
+            and parts[1] == "Demultiplexing"
+            and parts[2] not in ("Reports", "Stats")
+        ):
+            name = f"project_{parts[2]}"
+        elif len(parts) == 3 and parts[1] == "Demultiplexing":
+            lane = LANE_RE.search(parts[2])
+            name = f"lane_{lane.group(1)}" if lane else "metadata"
+        else:
+            name = "metadata"
+        chunks.setdefault(name, []).append(path)
+    return chunks
+
+
+def chunk_size(root, files):
+    """Return the total size in bytes of a chunk, following symlinks."""
+    size = 0
+    for path in files:
+        try:
+            size += os.stat(os.path.join(root, path)).st_size
+        except OSError:
+            pass
+    return size
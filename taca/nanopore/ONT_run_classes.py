@@ -13,6 +13,7 @@ import pandas as pd
 from taca.utils.config import CONFIG
 from taca.utils.statusdb import NanoporeRunsConnection
 from taca.utils.transfer import RsyncError
+from taca.utils.transfer_ledger import get_ledger
 
 logger = logging.getLogger(__name__)
 
@@ -540,9 +541,7 @@ class ONT_run:
 
     def update_transfer_log(self):
         try:
-            with open(self.transfer_log, "a") as f:
-                tsv_writer = csv.writer(f, delimiter="\t")
-                tsv_writer.writerow([self.run_name, str(datetime.now())])
+            get_ledger(self.transfer_log).add(self.run_name, str(datetime.now()))
         except OSError:
             msg = f"{self.run_name}: Could not update the transfer logfile {self.transfer_details['transfer_log']}"
             logger.error(msg)
@@ -564,11 +563,7 @@ class ONT_run:
 
     @property
     def in_transfer_log(self):
-        with open(self.transfer_log) as transfer_log:
-            for row in transfer_log.readlines():
-                if row.startswith(self.run_name):
-                    return True
-        return False
+        return self.run_name in get_ledger(self.transfer_log)
 
     @property
     def transfer_ongoing(self):
@@ -1,8 +1,11 @@
 """Filesystem utilities."""
 
 import contextlib
+import fcntl
+import json
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 RUN_RE_ILLUMINA = r"^\d{6,8}_[a-zA-Z\d\-]+_\d{2,}_[AB0][A-Z\d\-]+$"
 RUN_RE_ONT = r"^(\d{8})_(\d{4})_([0-9a-zA-Z]+)_([0-9a-zA-Z]+)_([0-9a-zA-Z]+)$"
@@ -21,6 +24,26 @@ def chdir(new_dir):
         os.chdir(cur_dir)
 
 
+@contextlib.contextmanager
+def lock_file(lock_path):
+    """Context manager to hold an exclusive, non-blocking lock on a file.
+
+    Yields True if the lock was acquired and False if it is already held by
+    another process. The lock is released when exiting the context, or by the
+    OS if the holding process dies.
+    """
+    with open(lock_path, "a") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
 def create_folder(target_folder):
     """Ensure that a folder exists and create it if it doesn't, including any
     parent folders, as necessary.
@@ -51,3 +74,65 @@ def do_copy(src_path, dst_path):
     # if symlinks, will copy content, not the links
     # dst_path will be created, it must NOT exist
     shutil.copytree(src_path, dst_path)
+
+
+def sync_files(sources, dst_dir, workers=4, manifest=".taca_sync_manifest"):
+    """Incrementally copy files and folders into a destination folder.
+
+    A manifest in the destination folder records the size and mtime of each
+    source file when it was last copied. Only files that changed since then,
+    or that are missing in the destination, are copied again, using a pool of
+    threads. Folders are synced recursively.
+
+    :param dict sources: Path in dst_dir: path of the source file or folder
+    :param dst_dir: the destination folder, created if needed
+    :param int workers: the number of files copied concurrently
+    :param manifest: the name of the manifest file in dst_dir
+    :returns: the list of copied paths, relative to dst_dir
+    :raises OSError: if a source does not exist or a file cannot be copied
+    """
+    to_check = {}
+    for name, src_path in sources.items():
+        if os.path.isdir(src_path):
+            for root, _, files in os.walk(src_path):
+                rel_root = os.path.relpath(root, src_path)
+                for file in files:
+                    to_check[os.path.normpath(os.path.join(name, rel_root, file))] = (
+                        os.path.join(root, file)
+                    )
+        else:
+            to_check[name] = src_path
+
+    manifest_path = os.path.join(dst_dir, manifest)
+    try:
+        with open(manifest_path) as fh:
+            synced = json.load(fh)
+    except (OSError, ValueError):
+        synced = {}
+
+    to_copy = {}
+    for name, src_path in to_check.items():
+        stat = os.stat(src_path)
+        fingerprint = [stat.st_size, stat.st_mtime_ns]
+        if synced.get(name) != fingerprint or not os.path.isfile(
+            os.path.join(dst_dir, name)
+        ):
+            to_copy[name] = (src_path, fingerprint)
+
+    def copy(name):
+        dst_path = os.path.join(dst_dir, name)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        shutil.copy2(to_copy[name][0], dst_path)
+        return name
+
+    os.makedirs(dst_dir, exist_ok=True)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for name in executor.map(copy, to_copy):
+                synced[name] = to_copy[name][1]
+    finally:
+        # Record the files copied so far, even if some copy failed
+        with open(f"{manifest_path}.tmp", "w") as fh:
+            json.dump(synced, fh)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+    return list(to_copy)
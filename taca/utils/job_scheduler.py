@@ -0,0 +1,270 @@
+"""Host-wide queue of external jobs run within a core and memory budget."""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from taca.utils.config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Number of finished jobs kept in the state file
+_FINISHED_JOBS_KEPT = 200
+
+# Whether a job_scheduler section without state_file has been logged
+_missing_state_file_logged = False
+
+
+class JobScheduler:
+    """Run external commands on this host within a core and memory budget.
+
+    Jobs are queued in a JSON state file shared by all TACA processes on the
+    host. Each call to :meth:`dispatch` reaps the finished jobs and starts the
+    queued ones in priority order, as long as they fit in the budget. A job
+    asking for more than the whole budget is started alone once nothing else
+    runs. Jobs are started through a wrapper recording their exit status, wall
+    time and peak RSS, which are kept in the state file when they are reaped.
+    """
+
+    def __init__(self, state_file, cores=None, memory_gb=None):
+        self.state_file = state_file
+        self.cores = cores
+        self.memory_gb = memory_gb
+
+    @contextlib.contextmanager
+    def _state(self):
+        """Hold the state lock and yield the state, saving it on exit."""
+        with open(f"{self.state_file}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.state_file) as fh:
+                    state = json.load(fh)
+            except FileNotFoundError:
+                state = {"jobs": {}}
+            yield state
+            with open(f"{self.state_file}.tmp", "w") as fh:
+                json.dump(state, fh, indent=2)
+            os.replace(f"{self.state_file}.tmp", self.state_file)
+
+    def submit(self, job_id, cmd, cwd, log_prefix, cores=1, memory_gb=0, priority=0):
+        """Queue a command and start it right away if the budget allows it.
+
+        The stdout and stderr of the command are written to
+        ``<log_prefix>_<binary>.out`` and ``.err`` in ``cwd``, as with
+        :func:`taca.utils.misc.call_external_command_detached`.
+
+        :param str job_id: Unique id of the job
+        :param list cmd: Command line to run
+        :param str cwd: Directory to run the command in
+        :param str log_prefix: Prefix of the log files
+        :param int cores: Number of cores used by the job
+        :param int memory_gb: Memory used by the job, in GB
+        :param int priority: Jobs with a higher priority are started first
+        """
+        with self._state() as state:
+            job = state["jobs"].get(job_id)
+            if job and job["status"] in ("queued", "running"):
+                logger.warning(
+                    f"Job {job_id} is already {job['status']}, not resubmitting"
+                )
+                return
+            state["jobs"][job_id] = {
+                "cmd": cmd,
+                "cwd": cwd,
+                "log_prefix": log_prefix,
+                "cores": cores,
+                "memory_gb": memory_gb,
+                "priority": priority,
+                "status": "queued",
+                "submitted": time.time(),
+            }
+            logger.info(f"Queued job {job_id}")
+        self.dispatch()
+
+    def dispatch(self):
+        """Reap the finished jobs and start the queued ones fitting in the budget."""
+        with self._state() as state:
+            jobs = state["jobs"]
+            for job_id, job in jobs.items():
+                if job["status"] == "running":
+                    self._reap(job_id, job)
+            self._start_queued(jobs)
+            finished = sorted(
+                (job_id for job_id, job in jobs.items() if "finished" in job),
+                key=lambda job_id: jobs[job_id]["finished"],
+            )
+            for job_id in finished[:-_FINISHED_JOBS_KEPT]:
+                del jobs[job_id]
+
+    def get_job(self, job_id):
+        """Return the state of a job, or None if it is unknown."""
+        with self._state() as state:
+            return state["jobs"].get(job_id)
+
+    def _reap(self, job_id, job):
+        try:
+            with open(job["stats_file"]) as fh:
+                job.update(json.load(fh))
+        except (FileNotFoundError, json.JSONDecodeError):
+            if _pid_alive(job["pid"], job.get("process_identity")):
+                return
+            logger.warning(f"Job {job_id} exited without recording its statistics")
+            job.update({"returncode": None, "finished": time.time()})
+        job["status"] = "done" if job["returncode"] == 0 else "failed"
+        message = f"Job {job_id} {job['status']} with exit status {job['returncode']}"
+        if "wall_time" in job:
+            message += (
+                f" after {job['wall_time']:.0f} s,"
+                f" peak RSS {job['max_rss_kb'] / 1024:.0f} MB"
+            )
+        if job["status"] == "done":
+            logger.info(message)
+        else:
+            logger.warning(message)
+
+    def _start_queued(self, jobs):
+        running = [job for job in jobs.values() if job["status"] == "running"]
+        used_cores = sum(job["cores"] for job in running)
+        used_memory = sum(job["memory_gb"] for job in running)
+        queued = sorted(
+            (job_id for job_id, job in jobs.items() if job["status"] == "queued"),
+            key=lambda job_id: (-jobs[job_id]["priority"], jobs[job_id]["submitted"]),
+        )
+        for job_id in queued:
+            job = jobs[job_id]
+            fits = (self.cores is None or used_cores + job["cores"] <= self.cores) and (
+                self.memory_gb is None
+                or used_memory + job["memory_gb"] <= self.memory_gb
+            )
+            # Start in strict priority order, so that large jobs are not starved
+            if running and not fits:
+                break
+            self._start(job_id, job)
+            running.append(job)
+            used_cores += job["cores"]
+            used_memory += job["memory_gb"]
+
+    def _start(self, job_id, job):
+        cmd = job["cmd"]
+        log = os.path.join(
+            job["cwd"], f"{job['log_prefix']}_{os.path.basename(cmd[0])}"
+        )
+        job["stats_file"] = f"{log}.stats"
+        # A stats file left by an earlier attempt would reap the job as finished
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(job["stats_file"])
+        with open(f"{log}.out", "a") as stdout, open(f"{log}.err", "a") as stderr:
+            started = "Started command {} on {}".format(" ".join(cmd), datetime.now())
+            stdout.write(started + "\n")
+            stdout.write("".join(["="] * len(cmd)) + "\n")
+            stdout.flush()
+            p_handle = subprocess.Popen(
+                [sys.executable, "-m", __name__, job["stats_file"], *cmd],
+                cwd=job["cwd"],
+                stdout=stdout,
+                stderr=stderr,
+                start_new_session=True,
+            )
+        job.update(
+            {
+                "status": "running",
+                "pid": p_handle.pid,
+                "process_identity": _process_identity(p_handle.pid),
+                "started": time.time(),
+            }
+        )
+        logger.info(
+            f"Started job {job_id} with {job['cores']} cores and {job['memory_gb']} GB"
+        )
+
+
+def _process_identity(pid):
+    """Return the boot id and start time of a process, or None if unavailable.
+
+    A pid is only reused by another process after the first one exited or the
+    host rebooted, in which case its identity differs from the recorded one.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as fh:
+            boot_id = fh.read().strip()
+        with open(f"/proc/{pid}/stat") as fh:
+            # The command name in field 2 may contain spaces, the start time is
+            # the 20th field after it
+            start_time = fh.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+    return f"{boot_id}:{start_time}"
+
+
+def _pid_alive(pid, identity=None):
+    """Check whether the process started with a pid and identity is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    if identity is not None and _process_identity(pid) != identity:
+        return False
+    return True
+
+
+def run_and_record(stats_file, cmd):
+    """Run a command and write its exit status, wall time and peak RSS as JSON.
+
+    :param str stats_file: File to write the statistics to
+    :param list cmd: Command line to run
+    :returns: The exit status of the command
+    """
+    start = time.monotonic()
+    try:
+        returncode = subprocess.call(cmd)
+    except OSError as e:
+        print(f"Could not run {cmd[0]}: {e}", file=sys.stderr)
+        returncode = 127
+    stats = {
+        "returncode": returncode,
+        "wall_time": time.monotonic() - start,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "finished": time.time(),
+    }
+    with open(f"{stats_file}.tmp", "w") as fh:
+        json.dump(stats, fh)
+    os.replace(f"{stats_file}.tmp", stats_file)
+    return returncode
+
+
+def get_job_scheduler():
+    """Return the scheduler configured under job_scheduler, or None if not configured.
+
+    The scheduler is only enabled by job_scheduler/state_file, a job_scheduler
+    section without it is logged once per process.
+    """
+    global _missing_state_file_logged
+    config = CONFIG.get("job_scheduler")
+    if not config:
+        return None
+    if not config.get("state_file"):
+        if not _missing_state_file_logged:
+            logger.warning(
+                "job_scheduler is configured without state_file, "
+                "jobs are started without the job scheduler"
+            )
+            _missing_state_file_logged = True
+        return None
+    return JobScheduler(
+        config["state_file"],
+        cores=config.get("cores"),
+        memory_gb=config.get("memory_gb"),
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(run_and_record(sys.argv[1], sys.argv[2:]))
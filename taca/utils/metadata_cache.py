@@ -0,0 +1,115 @@
+"""On-disk cache of parsed run metadata."""
+
+import logging
+import os
+import pickle
+import tempfile
+
+from taca.utils.config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Whether the cache being disabled has been logged
+_disabled_logged = False
+
+
+def file_fingerprint(paths):
+    """Fingerprint a list of files or directories by their mtime and size.
+
+    Paths that do not exist are part of the fingerprint as well, so that the
+    creation of a file also changes it.
+
+    :param list paths: Paths to fingerprint
+    :returns: A tuple of (path, mtime in ns, size) tuples
+    """
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            fingerprint.append((path, None, None))
+        else:
+            fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+class RunMetadataCache:
+    """Pickled values stored per run, keyed by a fingerprint of their sources.
+
+    Values are stored in ``<cache_dir>/<run_id>/<name>.pickle``. A value is
+    only returned if the files it was derived from are unchanged since it was
+    stored, otherwise it is parsed again. If no cache dir is given the cache is
+    disabled and values are always parsed.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def _path(self, run_id, name):
+        return os.path.join(self.cache_dir, run_id, f"{name}.pickle")
+
+    def read(self, run_id, name):
+        """Return the stored (key, value) tuple for a run, or None."""
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(run_id, name), "rb") as fh:
+                return pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable cache entry {name} for {run_id}: {e}")
+            return None
+
+    def write(self, run_id, name, key, value):
+        """Atomically store a value and its key for a run."""
+        if not self.cache_dir:
+            return
+        run_cache_dir = os.path.join(self.cache_dir, run_id)
+        try:
+            os.makedirs(run_cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=run_cache_dir, suffix=".tmp", delete=False
+            ) as fh:
+                pickle.dump((key, value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(fh.name, self._path(run_id, name))
+        except Exception as e:
+            logger.warning(f"Could not cache {name} for run {run_id}: {e}")
+            try:
+                os.remove(fh.name)
+            except (NameError, OSError):
+                pass
+
+    def get(self, run_id, name, sources, parse):
+        """Return the cached value if its sources are unchanged, else parse it.
+
+        :param str run_id: Id of the run the value belongs to
+        :param str name: Name of the cached value
+        :param list sources: Paths the value is derived from
+        :param parse: Callable parsing the value from its sources
+        """
+        fingerprint = file_fingerprint(sources)
+        cached = self.read(run_id, name)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        value = parse()
+        self.write(run_id, name, fingerprint, value)
+        return value
+
+
+def get_run_metadata_cache():
+    """Return the run metadata cache configured under analysis/metadata_cache_dir.
+
+    Without metadata_cache_dir the cache is disabled, and so is everything
+    relying on it, e.g. skipping unchanged statusdb uploads. This is logged
+    once per process.
+    """
+    global _disabled_logged
+    cache_dir = CONFIG.get("analysis", {}).get("metadata_cache_dir")
+    if not cache_dir and not _disabled_logged:
+        logger.info(
+            "The run metadata cache is disabled, set analysis/metadata_cache_dir "
+            "to enable it"
+        )
+        _disabled_logged = True
+    return RunMetadataCache(cache_dir)
@@ -142,6 +142,29 @@ def hashfile(afile, hasher="sha1", blocksize=65536):
     return hashobj.hexdigest()
 
 
+def hash_command_output(cl, destination, hasher="md5", blocksize=1048576):
+    """Run a command, writing its output to a file object while hashing it.
+
+    This avoids reading the output a second time only to checksum it.
+
+    :param list cl: Command line to be executed (command + options and parameters)
+    :param destination: Binary file object the output is written to
+    :param string hasher: the hashing algorithm to be used, default is md5
+    :param int blocksize: the blocksize to use, default is 1 MiB
+    :returns: the hexadecimal hash digest of the output
+    :raises subprocess.CalledProcessError: if the command fails
+    :raises OSError: if the output cannot be written to the destination
+    """
+    hashobj = hashlib.new(hasher)
+    with subprocess.Popen(cl, stdout=subprocess.PIPE) as p_handle:
+        for buf in iter(lambda: p_handle.stdout.read(blocksize), b""):
+            hashobj.update(buf)
+            destination.write(buf)
+    if p_handle.returncode:
+        raise subprocess.CalledProcessError(p_handle.returncode, cl)
+    return hashobj.hexdigest()
+
+
 def query_yes_no(question, default="yes", force=False):
     """Ask a yes/no question via raw_input() and return their answer.
     "question" is a string that is presented to the user. "default"
@@ -300,6 +300,31 @@ class ElementRunsConnection(GenericFlowcellRunConnection):
     def __init__(self, config, dbname="element_runs"):
         super().__init__(config)
         self.dbname = dbname
+        # Run statuses known from prefetches and uploads, by run name
+        self.status_cache = {}
+
+    def prefetch_run_statuses(self, run_names):
+        """Fetch the statuses of several runs with a single view query.
+
+        The statuses are cached and returned by :meth:`check_db_run_status`,
+        runs missing from the database get the status "Unknown".
+
+        :param list run_names: The names of the runs
+        """
+        run_names = list(run_names)
+        if not run_names:
+            return
+        query_result = self.connection.post_view(
+            db=self.dbname,
+            ddoc="info",
+            view="status",
+            keys=run_names,
+        ).get_result()
+        statuses = {}
+        for row in query_result["rows"]:
+            statuses.setdefault(row["key"], row["value"])
+        for run_name in run_names:
+            self.status_cache[run_name] = statuses.get(run_name, "Unknown")
 
     def get_db_entry(self, run_id, get_doc=False):
         query_result = self.connection.post_view(
@@ -318,6 +343,8 @@ class ElementRunsConnection(GenericFlowcellRunConnection):
         return self.get_db_entry(run_id) is not None
 
     def check_db_run_status(self, run_name) -> str:
+        if run_name in self.status_cache:
+            return self.status_cache[run_name]
         query_result = self.connection.post_view(
             db=self.dbname,
             ddoc="info",
@@ -328,11 +355,13 @@ class ElementRunsConnection(GenericFlowcellRunConnection):
         status = "Unknown"
         if query_result["rows"]:
             status = query_result["rows"][0]["value"]
+        self.status_cache[run_name] = status
 
         return status
 
     def upload_to_statusdb(self, run_obj: dict):
         self.update_doc(self.dbname, run_obj)
+        self.status_cache[run_obj["name"]] = run_obj["run_status"]
 
 
 def merge_dicts(d1, d2):
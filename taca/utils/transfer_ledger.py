@@ -0,0 +1,112 @@
+"""Indexed ledger of runs transferred to the analysis server."""
+
+import fcntl
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes before the read offset kept to detect rewritten ledgers
+_TAIL_SIZE = 256
+
+_ledgers: dict[str, "TransferLedger"] = {}
+
+
+class TransferLedger:
+    """Append-only TSV of transferred runs with an in-memory index by run id.
+
+    The file format is the one of the existing transfer logs (transfer.tsv and
+    the instrument transfer_log files): one line per run, starting with the run
+    id followed by tab separated details. Existing logs are therefore used as
+    they are. The file is read once, after which lookups only read lines
+    appended since the previous lookup. If the file has been truncated or
+    rewritten it is read again from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self._runs = {}
+        self._offset = 0
+        self._tail = b""
+
+    def _refresh(self):
+        try:
+            fh = open(self.path, "rb")
+        except FileNotFoundError:
+            self._reset()
+            return
+        with fh:
+            size = os.fstat(fh.fileno()).st_size
+            if self._offset:
+                fh.seek(self._offset - len(self._tail))
+                if size < self._offset or fh.read(len(self._tail)) != self._tail:
+                    logger.debug(
+                        f"Transfer ledger {self.path} was rewritten, reloading"
+                    )
+                    self._reset()
+            if size == self._offset:
+                return
+            fh.seek(self._offset)
+            data = fh.read(size - self._offset)
+        # Only index complete lines, a partially written one is read next time
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            fields = line.decode(errors="replace").strip().split("\t")
+            if fields[0]:
+                self._runs.setdefault(fields[0], fields[1:])
+        self._offset += complete
+        self._tail = (self._tail + data[:complete])[-_TAIL_SIZE:]
+
+    def __contains__(self, run_id):
+        self._refresh()
+        return run_id in self._runs
+
+    def get(self, run_id):
+        """Return the details recorded for a run, or None if not in the ledger."""
+        self._refresh()
+        return self._runs.get(run_id)
+
+    def add(self, run_id, *details):
+        """Atomically append a run to the ledger.
+
+        The line is written with a single write on a file opened in append mode
+        and under an exclusive lock, so concurrent writers never interleave.
+
+        :raises OSError: If the ledger cannot be written
+        """
+        line = "\t".join([run_id, *map(str, details)]) + "\n"
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o664)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+        self._runs.setdefault(run_id, [str(detail) for detail in details])
+
+    def import_log(self, log_file):
+        """Append the runs of another transfer log that are not yet in the ledger.
+
+        :param str log_file: Path to a TSV transfer log
+        :returns: The number of imported runs
+        """
+        imported = 0
+        for run_id, details in TransferLedger(log_file).items():
+            if run_id not in self:
+                self.add(run_id, *details)
+                imported += 1
+        return imported
+
+    def items(self):
+        self._refresh()
+        return list(self._runs.items())
+
+
+def get_ledger(path):
+    """Return the process-wide ledger of a transfer log file."""
+    path = os.path.abspath(path)
+    if path not in _ledgers:
+        _ledgers[path] = TransferLedger(path)
+    return _ledgers[path]
@@ -1,13 +1,19 @@
 import importlib
+import multiprocessing
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tempfile import TemporaryDirectory
+from types import SimpleNamespace
 from unittest.mock import patch
 
+import pytest
 import yaml
 
 from taca.analysis import analysis
 from taca.log import init_logger_file
+from taca.utils import filesystem
+from taca.utils.metadata_cache import RunMetadataCache
 
 
 def make_illumina_test_config(tmp):
@@ -550,13 +556,14 @@ FCID,Lane,Sample_ID,Sample_Name,Sample_Ref,index,index2,Description,Control,Reci
     return run_path
 
 
-def test_run_preprocessing(create_dirs):
+def test_run_preprocessing(create_dirs, request):
     tmp = create_dirs
 
     # Mock CONFIG
     test_config_yaml = make_illumina_test_config(tmp)
     mock_config = patch("taca.utils.config.CONFIG", new=test_config_yaml)
     mock_config.start()
+    request.addfinalizer(mock_config.stop)
 
     # Create run dir
     run_path = create_illumina_run_dir(tmp)
@@ -568,7 +575,9 @@ def test_run_preprocessing(create_dirs):
 
     _run_obj = analysis.get_runObj(run_path, software)
 
-    _mock_upload_to_db = patch("taca.analysis.analysis._upload_to_statusdb").start()
+    mock_upload_to_db = patch("taca.analysis.analysis._upload_to_statusdb")
+    mock_upload_to_db.start()
+    request.addfinalizer(mock_upload_to_db.stop)
 
     with patch("subprocess.Popen") as mock_Popen:
         mock_Popen.start()
@@ -582,3 +591,283 @@ def test_run_preprocessing(create_dirs):
         analysis.run_preprocessing(None, software)
         # Demux in progress, specified run
         analysis.run_preprocessing(run_path, software)
+
+
+def _worker_config():
+    """Return the configuration seen by a worker process."""
+    return dict(analysis.CONFIG)
+
+
+def test_init_worker_loads_config_in_spawned_workers(create_dirs):
+    tmp = create_dirs
+    config = {
+        "analysis": {"data_dirs": [tmp.name]},
+        "log": {"file": f"{tmp.name}/log/taca.log", "log_level": "DEBUG"},
+    }
+    # Spawned workers, as with forkserver, start with an empty CONFIG
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=analysis._init_worker,
+        initargs=(config,),
+    ) as executor:
+        assert executor.submit(_worker_config).result() == config
+
+
+def test_init_worker_keeps_inherited_config():
+    config = {"analysis": {"data_dirs": []}}
+    with patch.dict(analysis.CONFIG, config, clear=True):
+        # Forked workers get the CONFIG of the parent process as is
+        analysis._init_worker(analysis.CONFIG)
+        assert analysis.CONFIG == config
+
+
+def test_run_preprocessing_workers(create_dirs, caplog):
+    tmp = create_dirs
+    data_dir = os.path.join(tmp.name, "data_dir")
+    runs = [
+        os.path.join(data_dir, "240101_A00001_0001_AHXXXXXXXX"),
+        os.path.join(data_dir, "240102_A00001_0002_BHXXXXXXXX"),
+    ]
+    for run in runs:
+        os.makedirs(run)
+
+    with (
+        patch.dict(
+            analysis.CONFIG, {"analysis": {"data_dirs": [data_dir]}}, clear=True
+        ),
+        patch(
+            "taca.analysis.analysis.ProcessPoolExecutor", wraps=ThreadPoolExecutor
+        ) as mock_pool,
+        patch(
+            "taca.analysis.analysis._process_run_dir",
+            side_effect=[None, RuntimeError("mock error")],
+        ) as mock_process_run_dir,
+    ):
+        # A failing worker does not stop the processing of the other runs
+        analysis.run_preprocessing(None, "bclconvert", workers=2)
+
+    assert mock_pool.call_args.kwargs["max_workers"] == 2
+    assert mock_pool.call_args.kwargs["initializer"] is analysis._init_worker
+    assert sorted(call.args for call in mock_process_run_dir.call_args_list) == [
+        (run, "bclconvert") for run in runs
+    ]
+    # Both runs were processed by the pool, only the mocked error was logged
+    failures = [r.getMessage() for r in caplog.records if r.levelname != "INFO"]
+    assert len(failures) == 1
+    assert failures[0].endswith("failed: mock error")
+
+
+def test_run_preprocessing_broken_pool(create_dirs, caplog):
+    tmp = create_dirs
+    data_dir = os.path.join(tmp.name, "data_dir")
+    os.makedirs(os.path.join(data_dir, "240101_A00001_0001_AHXXXXXXXX"))
+
+    with (
+        patch.dict(
+            analysis.CONFIG, {"analysis": {"data_dirs": [data_dir]}}, clear=True
+        ),
+        patch("taca.analysis.analysis.ProcessPoolExecutor", wraps=ThreadPoolExecutor),
+        patch("taca.analysis.analysis._init_worker", side_effect=OSError("mock error")),
+        patch("taca.analysis.analysis._process_run_dir") as mock_process_run_dir,
+    ):
+        analysis.run_preprocessing(None, "bclconvert", workers=2)
+
+    mock_process_run_dir.assert_not_called()
+    errors = [r.getMessage() for r in caplog.records if r.levelname == "ERROR"]
+    assert len(errors) == 1
+    assert errors[0].startswith("The pool of workers broke")
+
+
+def test_locked_run_is_skipped(create_dirs):
+    tmp = create_dirs
+    run_path = os.path.join(tmp.name, "240101_A00001_0001_AHXXXXXXXX")
+    os.makedirs(run_path)
+    lock_dir = os.path.join(tmp.name, "locks")
+
+    with (
+        patch.dict(analysis.CONFIG, {"analysis": {"run_lock_dir": lock_dir}}),
+        patch("taca.analysis.analysis.get_runObj") as mock_get_runObj,
+    ):
+        # Held by another TACA instance
+        with filesystem.lock_file(analysis._run_lock_path(run_path)) as locked:
+            assert locked
+            analysis._process_run_dir(run_path, "bclconvert")
+            mock_get_runObj.assert_not_called()
+            with pytest.raises(RuntimeError, match="another TACA instance"):
+                analysis.run_preprocessing(run_path, "bclconvert")
+            mock_get_runObj.assert_not_called()
+
+        # Released
+        with patch("taca.analysis.analysis._process") as mock_process:
+            analysis._process_run_dir(run_path, "bclconvert")
+        mock_get_runObj.assert_called_once_with(run_path, "bclconvert")
+        mock_process.assert_called_once_with(mock_get_runObj.return_value)
+    # The run folder is left untouched
+    assert os.listdir(run_path) == []
+    assert os.listdir(lock_dir) == ["240101_A00001_0001_AHXXXXXXXX.lock"]
+
+
+def test_process_run_dir_skips_unusable_entries(create_dirs):
+    tmp = create_dirs
+    archive = os.path.join(tmp.name, "200101_A_1_AXX.tar")
+    open(archive, "w").close()
+    run_path = os.path.join(tmp.name, "240101_A00001_0001_AHXXXXXXXX")
+    os.makedirs(run_path)
+
+    with (
+        patch("taca.analysis.analysis.get_runObj") as mock_get_runObj,
+        patch("taca.analysis.analysis._process") as mock_process,
+    ):
+        analysis._process_run_dir(archive, "bclconvert")
+        mock_get_runObj.assert_not_called()
+
+        # A run that cannot be locked is logged and skipped
+        with patch(
+            "taca.utils.filesystem.lock_file", side_effect=PermissionError("denied")
+        ):
+            analysis._process_run_dir(run_path, "bclconvert")
+        mock_get_runObj.assert_not_called()
+
+        with patch.dict(
+            analysis.CONFIG,
+            {"analysis": {"data_dirs": [tmp.name], "run_lock_dir": tmp.name}},
+        ):
+            analysis.run_preprocessing(None, "bclconvert")
+        mock_get_runObj.assert_called_once_with(run_path, "bclconvert")
+        mock_process.assert_called_once_with(mock_get_runObj.return_value)
+
+
+class _UploadRun:
+    """A run whose statusdb document is counted each time it is built."""
+
+    def __init__(self, run_dir):
+        os.makedirs(run_dir)
+        self.id = os.path.basename(run_dir)
+        self.CONFIG = {}
+        self.source = os.path.join(run_dir, "RunInfo.xml")
+        self.builds = 0
+        self.doc = {
+            "name": self.id,
+            "samplesheet_csv": [{"Lane": "1", "index": "ACGTACGT"}],
+        }
+
+    def get_statusdb_sources(self):
+        return [self.source]
+
+    def get_interop_summary(self):
+        return {}
+
+    @property
+    def runParserObj(self):
+        self.builds += 1
+        return SimpleNamespace(obj=dict(self.doc))
+
+
+def _upload(run, cache, force=False):
+    with (
+        patch.dict(analysis.CONFIG, {"statusdb": {"xten_db": "x_flowcells"}}),
+        patch("taca.analysis.analysis.get_run_metadata_cache", return_value=cache),
+        patch("taca.utils.statusdb.StatusdbSession") as mock_session,
+    ):
+        mock_session.return_value.connection.post_view.return_value.get_result.return_value = {
+            "rows": []
+        }
+        analysis._upload_to_statusdb(run, force=force)
+    return mock_session
+
+
+def test_upload_to_statusdb_skips_unchanged_runs(tmp_path):
+    run = _UploadRun(str(tmp_path / "240101_A00001_0001_AHXXXXXXXX"))
+    cache = RunMetadataCache(str(tmp_path / "cache"))
+
+    mock_session = _upload(run, cache)
+    mock_session.return_value.update_doc.assert_called_once()
+    assert run.builds == 1
+
+    # Unchanged sources, the run is not parsed
+    mock_session = _upload(run, cache)
+    mock_session.assert_not_called()
+    assert run.builds == 1
+
+    # Changed sources but the same document, statusdb is not connected to
+    with open(run.source, "w") as fh:
+        fh.write("<RunInfo/>")
+    mock_session = _upload(run, cache)
+    mock_session.assert_not_called()
+    assert run.builds == 2
+    assert _upload(run, cache).call_count == 0
+    assert run.builds == 2
+
+    with open(run.source, "a") as fh:
+        fh.write("\n")
+    run.doc["pdc_archived"] = "2024-01-01"
+    mock_session = _upload(run, cache)
+    doc = mock_session.return_value.update_doc.call_args.args[1]
+    assert doc["pdc_archived"] == "2024-01-01"
+
+
+def test_upload_to_statusdb_force(tmp_path):
+    run = _UploadRun(str(tmp_path / "240101_A00001_0001_AHXXXXXXXX"))
+    cache = RunMetadataCache(str(tmp_path / "cache"))
+    _upload(run, cache)
+
+    mock_session = _upload(run, cache, force=True)
+    mock_session.return_value.update_doc.assert_called_once()
+    dbname, doc = mock_session.return_value.update_doc.call_args.args
+    assert (dbname, doc["name"]) == ("x_flowcells", run.id)
+    assert run.builds == 2
+
+
+def test_upload_to_statusdb_records_successful_uploads_only(tmp_path):
+    run = _UploadRun(str(tmp_path / "240101_A00001_0001_AHXXXXXXXX"))
+    cache = RunMetadataCache(str(tmp_path / "cache"))
+
+    with (
+        patch.dict(analysis.CONFIG, {"statusdb": {"xten_db": "x_flowcells"}}),
+        patch("taca.analysis.analysis.get_run_metadata_cache", return_value=cache),
+        patch("taca.utils.statusdb.StatusdbSession") as mock_session,
+    ):
+        mock_session.return_value.update_doc.side_effect = RuntimeError("down")
+        with pytest.raises(RuntimeError, match="down"):
+            analysis._upload_to_statusdb(run)
+    assert cache.read(run.id, analysis.STATUSDB_UPLOAD_CACHE) is None
+
+    # Retried on the next tick
+    mock_session = _upload(run, cache)
+    mock_session.return_value.update_doc.assert_called_once()
+    assert cache.read(run.id, analysis.STATUSDB_UPLOAD_CACHE) is not None
+
+
+@pytest.mark.parametrize("stream_archive", [False, True])
+def test_transfer_runfolder_cleans_up_failed_archive(tmp_path, stream_archive):
+    run_dir = tmp_path / "240101_A00001_0001_AHXXXXXXXX"
+    run_dir.mkdir()
+    (run_dir / "SampleSheet.csv").write_text("Lane,Sample_ID\n1,P1_101\n")
+    archive = f"{run_dir}_P1.tar"
+    config = {
+        "analysis": {
+            "deliver_runfolder": {
+                "destination": "/remote/dest",
+                "analysis_server": {"host": "host", "user": "user"},
+                "stream_archive": stream_archive,
+            }
+        }
+    }
+
+    def write_partial_archive(cl, destination):
+        destination.write(b"partial")
+        raise BrokenPipeError() if stream_archive else OSError(28, "No space")
+
+    with (
+        patch.dict(analysis.CONFIG, config),
+        patch("taca.analysis.analysis.subprocess.Popen"),
+        patch("taca.utils.misc.hash_command_output", side_effect=write_partial_archive),
+        patch("taca.analysis.analysis.RsyncAgent") as mock_rsync,
+        patch.object(analysis.logger, "error") as mock_error,
+    ):
+        with pytest.raises(OSError):
+            analysis.transfer_runfolder(str(run_dir), "P1", "")
+    mock_error.assert_called_once_with("Error creating tar archive")
+    mock_rsync.assert_not_called()
+    assert not os.path.exists(archive)
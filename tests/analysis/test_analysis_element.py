@@ -1,4 +1,5 @@
 import logging
+import os
 import sys
 from tempfile import TemporaryDirectory
 from unittest.mock import patch
@@ -190,3 +191,27 @@ def test_process_on_finished_run(aviti_fixture):
 
     assert "Bases2Fastq conversion and demultiplexing started for run " in caplog.text
     assert mocks["mock_db"].return_value.upload_to_statusdb.called
+
+
+def test_process_all_runs_share_db(aviti_fixture):
+    """Should fetch the statuses of all runs at once and share the connection."""
+    to_test, tmp, caplog, mocks = aviti_fixture
+
+    run_dir = create_element_run_dir(
+        tmp=tmp,
+        metadata_files=True,
+        run_finished=False,
+    )
+    mocks["mock_config"]["element_analysis"]["data_dirs"] = [os.path.dirname(run_dir)]
+
+    with patch("taca.analysis.analysis_element.ElementRunsConnection") as shared_db:
+        shared_db.return_value.check_db_run_status.return_value = "sequencing"
+        to_test.run_preprocessing(None)
+
+    shared_db.assert_called_once()
+    prefetched = shared_db.return_value.prefetch_run_statuses.call_args.args[0]
+    assert list(prefetched) == [os.path.basename(run_dir)]
+    shared_db.return_value.check_db_run_status.assert_called_once()
+    # Status unchanged, nothing to upload
+    shared_db.return_value.upload_to_statusdb.assert_not_called()
+    mocks["mock_db"].assert_not_called()
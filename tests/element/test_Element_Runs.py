@@ -1,3 +1,5 @@
+import csv
+import json
 import os
 import tempfile
 import zipfile
@@ -6,6 +8,7 @@ from unittest import mock
 import pytest
 
 from taca.element import Element_Runs as to_test
+from taca.utils.job_scheduler import JobScheduler
 
 
 def get_config(tmp: tempfile.TemporaryDirectory) -> dict:
@@ -571,6 +574,51 @@ class TestRun:
             mock_command.assert_called_once_with("mock_run_manifest", "mock_demux_dir")
             mock_Popen.assert_called_once()
 
+    @pytest.mark.parametrize(
+        "n_sub_demux, budget, expected",
+        [(5, None, 8), (2, 32, 8), (3, 16, 5), (5, 16, 4), (2, 2, 2)],
+    )
+    def test_get_demux_threads(
+        self, mock_db, create_dirs, n_sub_demux, budget, expected
+    ):
+        tmp: tempfile.TemporaryDirectory = create_dirs
+        run = to_test.Run(create_element_run_dir(tmp), get_config(tmp))
+        assert run.get_demux_threads(n_sub_demux, budget) == expected
+
+    def test_submit_demux(self, mock_db, create_dirs):
+        tmp: tempfile.TemporaryDirectory = create_dirs
+        run = to_test.Run(
+            create_element_run_dir(tmp, metadata_files=True), get_config(tmp)
+        )
+        run.parse_run_parameters()
+        scheduler = JobScheduler(os.path.join(tmp.name, "jobs.json"), cores=10)
+        threads = run.get_demux_threads(3, scheduler.cores)
+        with mock.patch("subprocess.Popen") as mock_Popen:
+            mock_Popen.return_value.pid = os.getpid()
+            for sub_demux in range(3):
+                run.submit_demux(
+                    scheduler,
+                    f"manifest_{sub_demux}.csv",
+                    os.path.join(run.run_dir, f"Demultiplexing_{sub_demux}"),
+                    threads,
+                )
+
+        # Two sub-demultiplexings with 4 threads fit in the budget of 10 cores
+        jobs = [
+            scheduler.get_job(f"{run.NGI_run_id}_demux_{sub_demux}")
+            for sub_demux in range(3)
+        ]
+        assert [job["status"] for job in jobs] == ["running", "running", "queued"]
+        assert mock_Popen.call_count == 2
+        assert jobs[0]["cores"] == 4
+        assert jobs[0]["cmd"][:3] == [
+            "mock_bases2fastq_path",
+            run.run_dir,
+            os.path.join(run.run_dir, "Demultiplexing_0"),
+        ]
+        assert jobs[0]["cmd"][3:5] == ["-p", "4"]
+        assert jobs[0]["log_prefix"] == "bases2fastq_0"
+
     @pytest.mark.parametrize(
         "p",
         [
@@ -675,3 +723,276 @@ class TestRun:
 
         run.parse_run_parameters()
         assert run.in_transfer_log() is p["expected"]
+
+    def test_aggregate_fastq(self, mock_db, create_dirs):
+        tmp: tempfile.TemporaryDirectory = create_dirs
+        run = to_test.Run(create_element_run_dir(tmp), get_config(tmp))
+
+        # Lane 1 is demultiplexed in two parts, lane 2 in one
+        demux_runmanifest = [
+            {"sub_demux_count": "0", "Lane": "1", "SampleName": "P1_101"},
+            {"sub_demux_count": "1", "Lane": "1", "SampleName": "P1_102"},
+            {"sub_demux_count": "1", "Lane": "1", "SampleName": "PhiX"},
+            {"sub_demux_count": "0", "Lane": "2", "SampleName": "P1_101"},
+        ]
+        for sample in demux_runmanifest:
+            sample["Project"] = "P1"
+            samples_dir = os.path.join(
+                run.run_dir, f"Demultiplexing_{sample['sub_demux_count']}", "Samples"
+            )
+            lane = sample["Lane"]
+            for read in ["R1", "R2"]:
+                for fastq in [
+                    os.path.join(
+                        samples_dir,
+                        "P1",
+                        sample["SampleName"],
+                        f"{sample['SampleName']}_S1_L00{lane}_{read}_001.fastq.gz",
+                    ),
+                    os.path.join(
+                        samples_dir,
+                        "Undetermined",
+                        f"Undetermined_S0_L00{lane}_{read}_001.fastq.gz",
+                    ),
+                ]:
+                    os.makedirs(os.path.dirname(fastq), exist_ok=True)
+                    open(fastq, "w").close()
+
+        run.aggregate_sample_fastq(demux_runmanifest)
+        run.aggregate_undet_fastq(demux_runmanifest)
+
+        def links(dir):
+            return {
+                name: os.path.relpath(os.readlink(os.path.join(dir, name)), run.run_dir)
+                for name in os.listdir(dir)
+            }
+
+        assert sorted(os.listdir(run.demux_dir)) == ["P1", "Undetermined"]
+        assert links(os.path.join(run.demux_dir, "P1", "Sample_P1_101")) == {
+            "P1_101_S1_L001_R1_001.fastq.gz": "Demultiplexing_0/Samples/P1/P1_101/P1_101_S1_L001_R1_001.fastq.gz",
+            "P1_101_S1_L001_R2_001.fastq.gz": "Demultiplexing_0/Samples/P1/P1_101/P1_101_S1_L001_R2_001.fastq.gz",
+            "P1_101_S1_L002_R1_001.fastq.gz": "Demultiplexing_0/Samples/P1/P1_101/P1_101_S1_L002_R1_001.fastq.gz",
+            "P1_101_S1_L002_R2_001.fastq.gz": "Demultiplexing_0/Samples/P1/P1_101/P1_101_S1_L002_R2_001.fastq.gz",
+        }
+        assert links(os.path.join(run.demux_dir, "P1", "Sample_P1_102")) == {
+            "P1_102_S2_L001_R1_001.fastq.gz": "Demultiplexing_1/Samples/P1/P1_102/P1_102_S1_L001_R1_001.fastq.gz",
+            "P1_102_S2_L001_R2_001.fastq.gz": "Demultiplexing_1/Samples/P1/P1_102/P1_102_S1_L001_R2_001.fastq.gz",
+        }
+        # Undetermined reads are only linked for lanes with a single demultiplexing
+        assert links(os.path.join(run.demux_dir, "Undetermined")) == {
+            "Undetermined_S0_L002_R1_001.fastq.gz": "Demultiplexing_0/Samples/Undetermined/Undetermined_S0_L002_R1_001.fastq.gz",
+            "Undetermined_S0_L002_R2_001.fastq.gz": "Demultiplexing_0/Samples/Undetermined/Undetermined_S0_L002_R2_001.fastq.gz",
+        }
+
+    def test_aggregate_stats_assigned(self, mock_db, create_dirs):
+        tmp: tempfile.TemporaryDirectory = create_dirs
+        run = to_test.Run(create_element_run_dir(tmp), get_config(tmp))
+        os.makedirs(run.demux_dir)
+
+        # Sub-demultiplexing 0 uses 8 bp indexes, 1 uses 6 bp indexes
+        assigned = {
+            "0": [
+                ("P1_101", "AAAAAAAA", "CCCCCCCC", "1", "100"),
+                ("P1_102", "GGGGGGGG", "TTTTTTTT", "1", "200"),
+                ("PhiX", "ACGTACGT", "TGCATGCA", "1", "30"),
+                ("PhiX", "CATGCATG", "GTACGTAC", "1", "20"),
+                ("PhiX", "ACGTACGT", "TGCATGCA", "2", "9"),
+                # Lane not in the manifest
+                ("P1_101", "AAAAAAAA", "CCCCCCCC", "3", "5"),
+            ],
+            "1": [
+                ("P2_101", "TTTTTT", "AAAAAA", "2", "300"),
+                ("PhiX", "ACGTAC", "TGCATG", "1", "40"),
+                ("PhiX", "ACGTAC", "TGCATG", "2", "50"),
+                ("PhiX", "GATCGA", "TCGATC", "2", "10"),
+            ],
+        }
+        projects = {"P1_101": "P1", "P1_102": "P1", "P2_101": "P2", "PhiX": "Control"}
+        demux_runmanifest = []
+        for sub_demux, rows in assigned.items():
+            demux_path = os.path.join(run.run_dir, f"Demultiplexing_{sub_demux}")
+            os.makedirs(demux_path)
+            with open(os.path.join(demux_path, "IndexAssignment.csv"), "w") as fh:
+                fh.write("SampleNumber,SampleName,I1,I2,Lane,NumPoloniesAssigned\n")
+                for i, (sample, i1, i2, lane, polonies) in enumerate(rows, start=1):
+                    fh.write(f"{i},{sample},{i1},{i2},{lane},{polonies}\n")
+            sample_stats = {}
+            for sample, i1, i2, lane, polonies in rows:
+                sample_stats.setdefault(sample, []).append(
+                    {
+                        "Lane": int(lane),
+                        "ExpectedSequence": i1 + i2,
+                        "PercentMismatch": float(polonies) / 1000,
+                        "PercentQ30": 90.0,
+                        "PercentQ40": 80.0,
+                        "QualityScoreMean": 40.0,
+                    }
+                )
+            for project in set(projects[sample] for sample in sample_stats):
+                project_path = os.path.join(demux_path, "Samples", project)
+                os.makedirs(project_path)
+                with open(
+                    os.path.join(project_path, f"{project}_RunStats.json"), "w"
+                ) as fh:
+                    json.dump(
+                        {
+                            "SampleStats": [
+                                {"SampleName": sample, "Occurrences": occurrences}
+                                for sample, occurrences in sample_stats.items()
+                                if projects[sample] == project
+                            ]
+                        },
+                        fh,
+                    )
+            for sample, i1, i2, lane, _ in rows:
+                if lane != "3":
+                    demux_runmanifest.append(
+                        {
+                            "sub_demux_count": sub_demux,
+                            "SampleName": sample,
+                            "Index1": i1,
+                            "Index2": i2,
+                            "Lane": lane,
+                            "Project": projects[sample],
+                        }
+                    )
+
+        aggregated = run.aggregate_stats_assigned(demux_runmanifest)
+
+        assert [
+            (
+                sample["Lane"],
+                sample["SampleName"],
+                sample["I1"],
+                sample["sub_demux_count"],
+                sample["SampleNumber"],
+            )
+            for sample in aggregated
+        ] == [
+            ("1", "P1_101", "AAAAAAAA", "0", 1),
+            ("1", "P1_102", "GGGGGGGG", "0", 2),
+            ("1", "PhiX", "ACGTACGT", "0", 3),
+            ("1", "PhiX", "CATGCATG", "0", 3),
+            ("2", "P2_101", "TTTTTT", "1", 4),
+            ("2", "PhiX", "ACGTACGT", "0", 5),
+            ("2", "PhiX", "GATCGA", "1", 5),
+        ]
+        assert aggregated[0]["Project"] == "P1"
+        assert aggregated[0]["PercentMismatch"] == 0.1
+        assert aggregated[4]["Project"] == "P2"
+        assert aggregated[4]["PercentMismatch"] == 0.3
+        with open(os.path.join(run.demux_dir, "IndexAssignment.csv")) as fh:
+            assert len(fh.readlines()) == len(aggregated) + 1
+
+    def test_aggregate_stats_unassigned(self, mock_db, create_dirs):
+        tmp: tempfile.TemporaryDirectory = create_dirs
+        run = to_test.Run(create_element_run_dir(tmp), get_config(tmp))
+        os.makedirs(run.demux_dir)
+
+        # Sub-demultiplexing 0 uses 8+8 bp indexes, 1 uses 6 bp single indexes
+        demux_runmanifest = [
+            {"sub_demux_count": "0", "Lane": "1", "Index1": "A" * 8, "Index2": "C" * 8},
+            {"sub_demux_count": "1", "Lane": "1", "Index1": "T" * 6, "Index2": ""},
+            {"sub_demux_count": "0", "Lane": "2", "Index1": "G" * 8, "Index2": "C" * 8},
+        ]
+        assigned = [
+            {"sub_demux_count": "0", "Lane": "1", "I1": "A" * 8, "I2": "C" * 8},
+            {"sub_demux_count": "1", "Lane": "1", "I1": "T" * 6, "I2": ""},
+            {"sub_demux_count": "0", "Lane": "2", "I1": "G" * 8, "I2": "C" * 8},
+        ]
+        for sample in assigned:
+            sample["NumPoloniesAssigned"] = "1000"
+        unassigned = [
+            ("1", "TTTTTTAA", "CCCCCCCC", "500"),
+            ("1", "TTTTTTGG", "AAAAAAAA", "400"),
+            ("1", "TTTTTGGG", "AAAAAAAA", "300"),
+            ("2", "TTTTTTAA", "CCCCCCCC", "200"),
+            ("1", "ACACACAC", "GTGTGTGT", "600"),
+        ]
+        os.makedirs(os.path.join(run.run_dir, "Demultiplexing_0"))
+        with open(
+            os.path.join(run.run_dir, "Demultiplexing_0", "UnassignedSequences.csv"),
+            "w",
+        ) as fh:
+            fh.write("I1,I2,Lane,Count,% Polonies\n")
+            for lane, i1, i2, count in unassigned:
+                fh.write(f"{i1},{i2},{lane},{count},0.5\n")
+        with open(run.run_stats_file, "w") as fh:
+            json.dump(
+                {
+                    "LaneStats": [
+                        {"Lane": 1, "PFCount": 10000},
+                        {"Lane": 2, "PFCount": 4000},
+                    ]
+                },
+                fh,
+            )
+
+        run.aggregate_stats_unassigned(demux_runmanifest, assigned)
+
+        with open(os.path.join(run.demux_dir, "UnassignedSequences.csv")) as fh:
+            rows = list(csv.DictReader(fh))
+        # Unassigned indexes starting with the index assigned in sub-demultiplexing 1 are removed
+        assert [(row["Lane"], row["I1"], row["Count"]) for row in rows] == [
+            ("1", "ACACACAC", "600"),
+            ("1", "TTTTTGGG", "300"),
+            ("2", "TTTTTTAA", "200"),
+        ]
+        assert float(rows[0]["% Polonies"]) == 6.0
+        assert float(rows[0]["% Unassigned"]) == 7.5
+        assert float(rows[2]["% Polonies"]) == 5.0
+
+
+@pytest.mark.parametrize(
+    "seq, keep, prefix, cycles_used, expected",
+    [
+        ("ACGTNNN", "Ns", "I1:", 7, "I1:N4Y3"),
+        ("ACGTNNN", "bases", "I2:", 10, "I2:Y4N6"),
+        ("NNACGT", "Ns", "I1:", 8, "I1:Y2N6"),
+        ("NNNNNNNNACGTACGT", "bases", "I2:", 16, "I2:N8Y8"),
+        ("", "bases", "I1:", 8, "I1:N8"),
+        ("N" * 151, "Ns", "R1:", 151, "R1:Y151"),
+        ("N" * 51, "Ns", "R2:", 151, "R2:Y51N100"),
+    ],
+)
+def test_get_mask(seq, keep, prefix, cycles_used, expected):
+    assert to_test.get_mask(seq, keep, prefix, cycles_used) == expected
+
+
+def test_get_mask_too_many_bases():
+    with pytest.raises(AssertionError):
+        to_test.get_mask("ACGTACGTAC", "bases", "I1:", 8)
+
+
+def test_get_manifest_masks():
+    df = to_test.pd.DataFrame(
+        {
+            "Index1": ["ACGTACGT", "ACGTACGT", "TTGGCCAA", "ACGTAC"],
+            "Index2": ["NNNNNNNNACGTACGT", "NNNNNNNNGGTTAACC", "", "AACC"],
+            "Recipe": ["151-151", "151-151", "0-0", "51-51"],
+        },
+        index=[3, 5, 7, 9],
+    )
+    cycles = {"R1": 151, "R2": 151, "I1": 8, "I2": 16}
+    masks = to_test.get_manifest_masks(df, cycles)
+    assert list(masks.columns) == [
+        "I1Mask",
+        "I2Mask",
+        "I1UmiMask",
+        "I2UmiMask",
+        "R1Mask",
+        "R2Mask",
+    ]
+    assert list(masks.index) == [3, 5, 7, 9]
+    assert masks.loc[5].to_dict() == {
+        "I1Mask": "I1:Y8",
+        "I2Mask": "I2:N8Y8",
+        "I1UmiMask": "I1:N8",
+        "I2UmiMask": "I2:Y8N8",
+        "R1Mask": "R1:Y151",
+        "R2Mask": "R2:Y151",
+    }
+    assert masks.loc[7, "I2Mask"] == "I2:N16"
+    assert masks.loc[7, "R1Mask"] == "R1:Y151"
+    assert masks.loc[9, "I1Mask"] == "I1:Y6N2"
+    assert masks.loc[9, "R2Mask"] == "R2:Y51N100"
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from taca.element.fastq_index import create_symlinks, index_fastq
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+
+
+def test_index_fastq(tmp_path):
+    samples_dir = tmp_path / "Samples"
+    for name in [
+        "P1/P1_101/P1_101_S1_L001_R1_001.fastq.gz",
+        "P1/P1_101/P1_101_S1_L001_R2_001.fastq.gz",
+        "P1/P1_101/P1_101_S1_L002_R1_001.fastq.gz",
+        "P1/P1_101/P1_101_stats.json",
+        "P1/P1_RunStats.json",
+        "Undetermined/Undetermined_S0_L001_I1_001.fastq.gz",
+    ]:
+        _touch(samples_dir / name)
+
+    index = index_fastq(str(samples_dir))
+
+    assert index == {
+        ("P1", "P1_101", "1"): {
+            "R1": str(samples_dir / "P1/P1_101/P1_101_S1_L001_R1_001.fastq.gz"),
+            "R2": str(samples_dir / "P1/P1_101/P1_101_S1_L001_R2_001.fastq.gz"),
+        },
+        ("P1", "P1_101", "2"): {
+            "R1": str(samples_dir / "P1/P1_101/P1_101_S1_L002_R1_001.fastq.gz"),
+        },
+        ("Undetermined", None, "1"): {
+            "I1": str(
+                samples_dir / "Undetermined/Undetermined_S0_L001_I1_001.fastq.gz"
+            ),
+        },
+    }
+    assert index_fastq(str(tmp_path / "missing")) == {}
+
+
+def test_create_symlinks(tmp_path):
+    links = []
+    for i in range(20):
+        src = tmp_path / f"src_{i}"
+        src.touch()
+        links.append((str(src), str(tmp_path / f"link_{i}")))
+
+    create_symlinks(links, workers=4)
+
+    for src, link in links:
+        assert os.readlink(link) == src
+    with pytest.raises(FileExistsError):
+        create_symlinks(links[:1])
@@ -0,0 +1,117 @@
+import random
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+from Levenshtein import distance
+
+from taca.element.Element_Runs import get_custom_mistmatch_thresholds
+from taca.element.index_distances import (
+    encode_indexes,
+    min_distance_at_most,
+    min_hamming_distance,
+)
+
+
+def _brute_force_thresholds(df):
+    """The pairwise comparison previously done by get_custom_mistmatch_thresholds."""
+    idx1_dists, idx2_dists, total_dists = [], [], []
+    for lane in df["Lane"].unique():
+        df_lane = df[df["Lane"] == lane].reset_index(drop=True)
+        for i, j in combinations(range(len(df_lane)), 2):
+            idx1_dist = distance(df_lane["Index1"][i], df_lane["Index1"][j])
+            idx2_dist = distance(df_lane["Index2"][i], df_lane["Index2"][j])
+            idx1_dists.append(idx1_dist)
+            idx2_dists.append(idx2_dist)
+            total_dists.append(idx1_dist + idx2_dist)
+    if not total_dists:
+        return (1, 1)
+    if min(total_dists) == 0:
+        return AssertionError
+    return (int(min(idx1_dists) > 2), int(min(idx2_dists) > 2))
+
+
+def _random_index(rng, length):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+def _mutate(rng, index):
+    """Apply a random edit, including shifts that keep the length."""
+    edit = rng.choice(["substitute", "insert", "delete", "shift"])
+    i = rng.randrange(len(index))
+    if edit == "substitute":
+        return index[:i] + rng.choice("ACGT") + index[i + 1 :]
+    if edit == "insert":
+        return index[:i] + rng.choice("ACGT") + index[i:]
+    if edit == "delete":
+        return index[:i] + index[i + 1 :]
+    return index[1:] + rng.choice("ACGT")
+
+
+def _random_indexes(rng, n):
+    indexes = []
+    for _ in range(n):
+        if indexes and rng.random() < 0.1:
+            index = rng.choice(indexes)
+            for _ in range(rng.randint(1, 3)):
+                index = _mutate(rng, index)
+        else:
+            index = _random_index(rng, rng.choice([6, 8, 10]))
+        indexes.append(index)
+    return indexes
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_min_distance_at_most_matches_brute_force(seed):
+    rng = random.Random(seed)
+    indexes = _random_indexes(rng, rng.randint(0, 30))
+    pairwise = [distance(a, b) for a, b in combinations(indexes, 2)]
+    for max_distance in [1, 2, 3]:
+        assert min_distance_at_most(indexes, max_distance) == any(
+            dist <= max_distance for dist in pairwise
+        )
+
+
+def test_shifted_indexes_are_close():
+    # Hamming distance 8, edit distance 2
+    assert min_distance_at_most(["ACGTACGT", "CGTACGTA"], 2)
+    assert not min_distance_at_most(["ACGTACGT", "CGTACGTA"], 1)
+    # Empty indexes of single-indexed samples
+    assert min_distance_at_most(["", ""], 2)
+    assert min_distance_at_most(["", "AC"], 2)
+    assert not min_distance_at_most(["", "ACG"], 2)
+
+
+def test_min_hamming_distance():
+    rng = random.Random(0)
+    indexes = [_random_index(rng, 8) for _ in range(600)]
+    encoded = encode_indexes(indexes)
+    assert encoded.dtype == np.uint8
+    assert encoded.shape == (600, 8)
+    expected = min(
+        sum(x != y for x, y in zip(a, b)) for a, b in combinations(indexes, 2)
+    )
+    assert min_hamming_distance(encoded, block_size=64) == expected
+    assert min_hamming_distance(encode_indexes(["ACGT"])) is None
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_thresholds_match_brute_force(seed):
+    rng = random.Random(seed)
+    rows = []
+    for lane in rng.sample([1, 2], rng.randint(1, 2)):
+        index1 = _random_indexes(rng, rng.randint(1, 12))
+        index2 = _random_indexes(rng, len(index1))
+        if rng.random() < 0.3:
+            index2 = [""] * len(index1)
+        rows.extend(
+            {"Lane": lane, "Index1": i1, "Index2": i2} for i1, i2 in zip(index1, index2)
+        )
+    df = pd.DataFrame(rows)
+    expected = _brute_force_thresholds(df)
+    if expected is AssertionError:
+        with pytest.raises(AssertionError):
+            get_custom_mistmatch_thresholds(df)
+    else:
+        assert get_custom_mistmatch_thresholds(df) == expected
@@ -0,0 +1,318 @@
+import copy
+import json
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("flowcell_parser")
+
+from taca.illumina import Runs  # noqa: E402
+from taca.illumina.samplesheet import SampleSheet  # noqa: E402
+
+# Lane 1 is demultiplexed in two parts, lane 2 only in the first one
+SIMPLE_LANES = {"2": {"0": [8, 8]}}
+COMPLEX_LANES = {"1": {"0": [8, 8], "1": [6, 0]}}
+
+
+def _stats_json(demux_id, lanes):
+    return {
+        "RunNumber": 1,
+        "Flowcell": "HXXXXXXXX",
+        "RunId": "240101_A00001_0001_AHXXXXXXXX",
+        "ConversionResults": [
+            {
+                "LaneNumber": lane,
+                "DemuxResults": [{"SampleId": f"Sample_{demux_id}_{lane}"}],
+                "Undetermined": {
+                    "NumberReads": 10,
+                    "Yield": 1000,
+                    "ReadMetrics": [
+                        {
+                            "ReadNumber": read,
+                            "QualityScoreSum": 5,
+                            "TrimmedBases": 1,
+                            "Yield": 2,
+                            "YieldQ30": 1,
+                        }
+                        for read in [1, 2]
+                    ],
+                },
+            }
+            for lane in lanes
+        ],
+        "ReadInfosForLanes": [{"LaneNumber": lane} for lane in lanes],
+        "UnknownBarcodes": [
+            {
+                "Lane": lane,
+                "Barcodes": {"AAAAAAAA+CCCCCCCC": 50, "TTTTTTAA+GGGGGGGG": 30},
+            }
+            for lane in lanes
+        ],
+    }
+
+
+@pytest.fixture
+def run(tmp_path):
+    """A run demultiplexed in two parts, without parsing any run folder."""
+    run = Runs.Run.__new__(Runs.Run)
+    run.run_dir = str(tmp_path)
+    run.id = os.path.basename(run.run_dir)
+    run.demux_dir = "Demultiplexing"
+    run.flowcell_id = "HXXXXXXXX"
+    run.runParserObj = SimpleNamespace(
+        runinfo=SimpleNamespace(
+            data={
+                "Reads": [
+                    {"IsIndexedRead": "N"},
+                    {"IsIndexedRead": "Y"},
+                    {"IsIndexedRead": "Y"},
+                    {"IsIndexedRead": "N"},
+                ]
+            }
+        )
+    )
+    run.NumberReads_Summary = {"1": {"undet_cluster": 7, "undet_yield": 3}}
+    os.makedirs(os.path.join(run.run_dir, run.demux_dir))
+    stats = {}
+    for demux_id, lanes in [("0", [1, 2]), ("1", [1])]:
+        stats_dir = os.path.join(run.run_dir, f"Demultiplexing_{demux_id}", "Stats")
+        os.makedirs(stats_dir)
+        stats[demux_id] = os.path.join(stats_dir, "Stats.json")
+        with open(stats[demux_id], "w") as fh:
+            json.dump(_stats_json(demux_id, lanes), fh)
+    run.stats_json = stats
+    run.sub_samplesheets = {
+        "0": SampleSheet.from_rows(
+            {},
+            ["Lane", "Sample_ID", "index", "index2"],
+            [
+                {"Lane": "1", "Sample_ID": "S1", "index": "AAAAAAAA", "index2": ""},
+                {"Lane": "2", "Sample_ID": "S2", "index": "CCCCCCCC", "index2": ""},
+            ],
+        ),
+        "1": SampleSheet.from_rows(
+            {},
+            ["Lane", "Sample_ID", "index", "index2"],
+            [{"Lane": "1", "Sample_ID": "S3", "index": "TTTTTT", "index2": ""}],
+        ),
+    }
+    return run
+
+
+def _fold(run, demux_ids):
+    return run._fold_sub_demux_stats(
+        os.path.join(run.run_dir, run.demux_dir),
+        {demux_id: run.stats_json[demux_id] for demux_id in demux_ids},
+        run.sub_samplesheets,
+        SIMPLE_LANES,
+        COMPLEX_LANES,
+    )
+
+
+def test_fold_sub_demux_stats_incrementally(run, tmp_path):
+    merged_stats_file = os.path.join(
+        run.run_dir, run.demux_dir, Runs.AGGREGATION_STATS_FILE
+    )
+    # Sub-demultiplexing 1 waits for 0, so that the order they finish in does not matter
+    assert _fold(run, ["1"])["folded"] == []
+    assert not os.path.exists(merged_stats_file)
+
+    incremental = copy.deepcopy(_fold(run, ["0", "1"]))
+    assert incremental["folded"] == ["0", "1"]
+    with open(merged_stats_file) as fh:
+        assert json.load(fh) == incremental
+    # Nothing is folded twice
+    assert _fold(run, ["0", "1"]) == incremental
+
+    os.remove(merged_stats_file)
+    assert _fold(run, ["0", "1"]) == incremental
+
+    stats = incremental["stats"]
+    assert [entry["LaneNumber"] for entry in stats["ConversionResults"]] == [1, 2]
+    assert [
+        result["SampleId"] for result in stats["ConversionResults"][0]["DemuxResults"]
+    ] == ["Sample_0_1", "Sample_1_1"]
+    assert incremental["undetermined_to_fix"] == [1]
+    undetermined = stats["ConversionResults"][0]["Undetermined"]
+    assert [metrics["Yield"] for metrics in undetermined["ReadMetrics"]] == [0, 0]
+    # The unknown indexes of the complex lane from the top priority demux, without
+    # the ones starting with the indexes of the other sub-demultiplexing
+    assert stats["UnknownBarcodes"] == [
+        {"Lane": 1, "Barcodes": {"AAAAAAAA+CCCCCCCC": 50}},
+        {"Lane": 2, "Barcodes": {"AAAAAAAA+CCCCCCCC": 50, "TTTTTTAA+GGGGGGGG": 30}},
+    ]
+
+
+def test_fix_demultiplexingstats_xml_dir(run):
+    demux_folder = os.path.join(run.run_dir, run.demux_dir)
+    _fold(run, ["0"])
+    run._save_aggregation_state(["0"])
+
+    run._fix_demultiplexingstats_xml_dir(
+        demux_folder,
+        [run.stats_json["0"], run.stats_json["1"]],
+        run.sub_samplesheets,
+        [8, 8],
+        SIMPLE_LANES,
+        COMPLEX_LANES,
+        [],
+    )
+
+    with open(os.path.join(demux_folder, "Stats", "Stats.json")) as fh:
+        stats = json.load(fh)
+    undetermined = stats["ConversionResults"][0]["Undetermined"]
+    assert undetermined["NumberReads"] == 7
+    assert undetermined["Yield"] == 3000000
+    assert stats["ConversionResults"][1]["Undetermined"]["NumberReads"] == 10
+    with open(os.path.join(demux_folder, "Stats", "DemuxSummaryF1L1.txt")) as fh:
+        assert fh.read().splitlines()[2:] == ["AAAAAAAA+CCCCCCCC\t50"]
+    assert os.path.exists(
+        os.path.join(demux_folder, "Stats", "DemultiplexingStats.xml")
+    )
+    assert not os.path.exists(os.path.join(demux_folder, Runs.AGGREGATION_STATS_FILE))
+    assert not os.path.exists(os.path.join(demux_folder, Runs.AGGREGATION_STATE_FILE))
+
+
+def test_aggregate_finished_sub_demuxes(run):
+    with (
+        mock.patch.object(
+            run, "_parse_sub_samplesheets", return_value=run.sub_samplesheets
+        ),
+        mock.patch.object(
+            run, "_classify_lanes", return_value=([], SIMPLE_LANES, COMPLEX_LANES)
+        ),
+        mock.patch.object(run, "_get_legacy_path", return_value=""),
+        mock.patch.object(run, "_get_index_cycles", return_value=[8, 8]),
+        mock.patch.object(run, "_aggregate_sub_demux_fastq") as mock_fastq,
+    ):
+        run._aggregate_finished_sub_demuxes([], ["1"])
+        run._aggregate_finished_sub_demuxes([], ["1"])
+        assert [call.args[1] for call in mock_fastq.call_args_list] == ["1"]
+        assert run._load_aggregation_state() == ["1"]
+        # The state is kept in the Demultiplexing folder
+        assert os.path.exists(
+            os.path.join(run.run_dir, run.demux_dir, Runs.AGGREGATION_STATE_FILE)
+        )
+
+        run._aggregate_finished_sub_demuxes([], ["0", "1"])
+        assert [call.args[1] for call in mock_fastq.call_args_list] == ["1", "0"]
+        assert run._load_aggregation_state() == ["1", "0"]
+        assert _fold(run, [])["folded"] == ["0", "1"]
+
+        # Resetting the demultiplexing removes the state with the Demultiplexing folder
+        for name in os.listdir(os.path.join(run.run_dir, run.demux_dir)):
+            os.remove(os.path.join(run.run_dir, run.demux_dir, name))
+        assert run._load_aggregation_state() == []
+        run._aggregate_finished_sub_demuxes([], ["0"])
+        assert [call.args[1] for call in mock_fastq.call_args_list] == ["1", "0", "0"]
+
+
+def test_symlink_is_idempotent(tmp_path):
+    src = str(tmp_path / "src")
+    other = str(tmp_path / "other")
+    dst = str(tmp_path / "dst")
+    Runs._symlink(src, dst)
+    # Left by an interrupted aggregation
+    Runs._symlink(src, dst)
+    assert os.readlink(dst) == src
+    with pytest.raises(FileExistsError):
+        Runs._symlink(other, dst)
+
+
+def test_lazy_run_parser_parses_parts_on_access(tmp_path):
+    with open(tmp_path / "RunInfo.xml", "w") as fh:
+        fh.write("<RunInfo/>")
+    cache = Runs.RunMetadataCache(str(tmp_path / "cache"))
+    with mock.patch.object(Runs, "RunInfoParser", return_value="runinfo") as parse:
+        parser = Runs.LazyRunParser(str(tmp_path), "run", "FC", metadata_cache=cache)
+        assert parse.call_count == 0
+        assert parser.runinfo == "runinfo"
+        assert parser.runinfo == "runinfo"
+        assert parse.call_count == 1
+
+        # Reused from the metadata cache by the next tick
+        parser = Runs.LazyRunParser(str(tmp_path), "run", "FC", metadata_cache=cache)
+        assert parser.runinfo == "runinfo"
+        assert parse.call_count == 1
+
+    assert parser.samplesheet is None
+    parser.samplesheet = "samplesheet"
+    assert parser.samplesheet == "samplesheet"
+    assert parser.stats_json is None
+    assert parser.lanebarcodes is None
+
+
+def test_lazy_run_parser_stats_json(tmp_path):
+    stats_dir = tmp_path / "Demultiplexing" / "Stats"
+    stats_dir.mkdir(parents=True)
+    with open(stats_dir / "Stats.json", "w") as fh:
+        json.dump({"Flowcell": "FC"}, fh)
+    cache = Runs.RunMetadataCache(str(tmp_path / "cache"))
+    parser = Runs.LazyRunParser(str(tmp_path), "run", "FC", metadata_cache=cache)
+    assert parser.stats_json == {"Flowcell": "FC"}
+
+    with open(stats_dir / "Stats.json", "w") as fh:
+        json.dump({"Flowcell": "FC", "RunNumber": 2}, fh)
+    parser = Runs.LazyRunParser(str(tmp_path), "run", "FC", metadata_cache=cache)
+    assert parser.stats_json == {"Flowcell": "FC", "RunNumber": 2}
+
+
+def test_lazy_run_parser_obj(tmp_path):
+    parser = Runs.LazyRunParser(str(tmp_path), "run", "FC")
+    parser.samplesheet = SampleSheet.from_rows(
+        {}, ["Lane", "Sample_ID"], [{"Lane": "1", "Sample_ID": "S1"}]
+    )
+    assert str(tmp_path / "Demultiplexing" / "Stats" / "Stats.json") in (
+        parser.obj_sources
+    )
+    run_parser = SimpleNamespace(obj={"name": "run", "samplesheet_csv": None})
+    with mock.patch.object(Runs, "RunParser", return_value=run_parser) as parse:
+        assert parser.obj["samplesheet_csv"] == [{"Lane": "1", "Sample_ID": "S1"}]
+        assert parser.obj["name"] == "run"
+        parse.assert_called_once_with(str(tmp_path))
+
+
+def test_get_statusdb_sources(run, tmp_path):
+    run.id = "240101_A00001_0001_AHXXXXXXXX"
+    run.CONFIG = {"samplesheets_dir": str(tmp_path / "samplesheets")}
+    run.runParserObj = Runs.LazyRunParser(run.run_dir, run.id, run.flowcell_id)
+    sources = run.get_statusdb_sources()
+    assert sources[: len(run.runParserObj.obj_sources)] == (
+        run.runParserObj.obj_sources
+    )
+    for path in [
+        os.path.join(run.run_dir, "runParameters.xml"),
+        os.path.join(run.run_dir, "RunParameters.xml"),
+        os.path.join(run.run_dir, "InterOp", "TileMetricsOut.bin"),
+        str(tmp_path / "samplesheets" / "2024" / "HXXXXXXXX.csv"),
+    ]:
+        assert path in sources
+
+
+@pytest.mark.parametrize(
+    "files, started, done",
+    [
+        ([], False, False),
+        (["RTAComplete.txt", "CopyComplete.txt"], False, False),
+        (["RTAComplete.txt", "CopyComplete.txt", "Demultiplexing/"], True, False),
+        (["Demultiplexing/Stats/Stats.json"], True, True),
+    ],
+)
+def test_run_state_snapshot(tmp_path, files, started, done):
+    for name in files:
+        path = tmp_path / name
+        if name.endswith("/"):
+            path.mkdir()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+    state = Runs.RunStateSnapshot(str(tmp_path), "Demultiplexing")
+    assert state.sequencing_done == ("CopyComplete.txt" in files)
+    assert not state.transferring
+    assert state.demultiplexing_started == started
+    assert state.demultiplexing_done == done
+
+    (tmp_path / "transferring").touch()
+    assert Runs.RunStateSnapshot(str(tmp_path), "Demultiplexing").transferring
@@ -0,0 +1,82 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("flowcell_parser")
+
+from taca.illumina.Standard_Runs import Standard_Run  # noqa: E402
+
+
+def _run(software, software_config):
+    run = Standard_Run.__new__(Standard_Run)
+    run.id = "240101_A00001_0001_AHXXXXXXXX"
+    run.run_dir = f"/tmp/{run.id}"
+    run.software = software
+    run.CONFIG = {software: software_config}
+    return run
+
+
+@pytest.mark.parametrize(
+    "software_config, n_groups, budget, expected",
+    [
+        ({}, 1, 0, 0),
+        ({}, 1, 32, 32),
+        ({}, 4, 32, 8),
+        # Sub-demultiplexings not fitting in the budget are queued
+        ({}, 16, 32, 4),
+        ({"job_min_cores": 8}, 16, 32, 8),
+        ({}, 4, 2, 2),
+        ({"job_cores": 12}, 4, 32, 12),
+    ],
+)
+def test_get_job_cores(software_config, n_groups, budget, expected):
+    run = _run("bclconvert", software_config)
+    assert run.get_job_cores(n_groups, budget) == expected
+
+
+def test_submit_bcl_command_shares_cores():
+    run = _run("bclconvert", {"job_memory_gb": 16})
+    scheduler = mock.Mock(cores=32)
+    cmd = ["bcl-convert", "--bcl-num-compression-threads", "2"]
+
+    run._submit_bcl_command(scheduler, cmd, 1, priority=2, n_groups=2)
+
+    assert cmd == [
+        "bcl-convert",
+        "--bcl-num-compression-threads",
+        "2",
+        "--bcl-num-conversion-threads",
+        "8",
+        "--bcl-num-decompression-threads",
+        "4",
+    ]
+    scheduler.submit.assert_called_once_with(
+        f"{run.id}_demux_1",
+        cmd,
+        run.run_dir,
+        "demux_1",
+        cores=16,
+        memory_gb=16,
+        priority=2,
+    )
+
+
+def test_submit_bcl_command_without_budget():
+    run = _run("bcl2fastq", {})
+    scheduler = mock.Mock(cores=0)
+    cmd = ["bcl2fastq"]
+
+    run._submit_bcl_command(scheduler, cmd, 0, priority=1)
+
+    assert cmd == ["bcl2fastq"]
+    assert scheduler.submit.call_args.kwargs["cores"] == 1
+
+
+def test_plan_demultiplexing_without_samplesheet():
+    run = _run("bclconvert", {})
+    with mock.patch.object(
+        run,
+        "_get_samplesheet",
+        side_effect=RuntimeError("Not able to find samplesheet"),
+    ):
+        assert run.plan_demultiplexing() == []
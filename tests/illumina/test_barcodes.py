@@ -0,0 +1,57 @@
+import random
+
+from taca.illumina.barcodes import KnownIndexPrefixes
+
+
+def _overlaps(sample_idx1, sample_idx2, barcode):
+    """Reference implementation comparing one sample with one barcode."""
+    unknown_idx1, _, unknown_idx2 = barcode.partition("+")
+    if not sample_idx1:
+        sample_idx1, sample_idx2 = sample_idx2, ""
+    if not sample_idx1:
+        return False
+    cut1 = min(len(sample_idx1), len(unknown_idx1))
+    cut2 = min(len(sample_idx2), len(unknown_idx2))
+    return (
+        sample_idx1[:cut1] == unknown_idx1[:cut1]
+        and sample_idx2[:cut2] == unknown_idx2[:cut2]
+    )
+
+
+def test_matches_prefix_overlaps():
+    known = KnownIndexPrefixes(
+        [("ACGTACGT", "TTGGCCAA"), ("GGGGGG", ""), ("", "CCCCCCCC"), ("", "")]
+    )
+    # Dual index sample, unknown barcode longer and shorter than the sample
+    assert known.matches("ACGTACGTAA+TTGGCCAAGG")
+    assert known.matches("ACGTAC+TTGG")
+    assert not known.matches("ACGTACGT+TTGGCCAT")
+    # Single index sample matches any index2
+    assert known.matches("GGGGGGTT+ACACACAC")
+    # Index2 only sample is compared with index1 of the barcode
+    assert known.matches("CCCCCCCCAA+GTGTGTGT")
+    assert not known.matches("TATATATA+CCCCCCCC")
+
+
+def test_remove_matching_equals_pairwise_comparison():
+    rng = random.Random(42)
+
+    def seq(length):
+        return "".join(rng.choice("ACGT") for _ in range(length))
+
+    samples = [
+        (seq(rng.choice([6, 8, 10])), seq(rng.choice([0, 8, 10]))) for _ in range(200)
+    ]
+    barcodes = {}
+    for idx1, idx2 in samples[:50]:
+        barcodes[f"{idx1[:8]}{seq(2)}+{idx2[:8]}{seq(2)}"] = 1
+    for _ in range(500):
+        barcodes[f"{seq(10)}+{seq(10)}"] = 1
+
+    expected = {
+        barcode: count
+        for barcode, count in barcodes.items()
+        if not any(_overlaps(idx1, idx2, barcode) for idx1, idx2 in samples)
+    }
+    assert len(expected) < len(barcodes)
+    assert KnownIndexPrefixes(samples).remove_matching(dict(barcodes)) == expected
@@ -0,0 +1,123 @@
+import os
+import tempfile
+
+import pytest
+
+from taca.illumina import demux_logs
+from taca.illumina.demux_logs import DemuxLogScanner
+from taca.utils.metadata_cache import file_fingerprint
+
+
+@pytest.fixture
+def demux_log():
+    tmp = tempfile.TemporaryDirectory()
+    os.makedirs(os.path.join(tmp.name, "Demultiplexing_0"))
+    yield os.path.join(tmp.name, "demux_0_bcl-convert.err")
+    tmp.cleanup()
+
+
+@pytest.fixture
+def state_file(demux_log):
+    return os.path.join(
+        os.path.dirname(demux_log), "Demultiplexing_0", ".demux_log_scan_state"
+    )
+
+
+def _scan(demux_log, state_file, software="bclconvert"):
+    return DemuxLogScanner(demux_log, software, state_file=state_file).scan()
+
+
+def test_scan_counts_only_appended_lines(demux_log, state_file):
+    with open(demux_log, "w") as log:
+        log.write("INFO: Starting\nWARNING: Low quality tile\nINFO: Converting\n")
+    assert _scan(demux_log, state_file) == (0, 1, ["WARNING: Low quality tile\n"])
+
+    with open(demux_log, "a") as log:
+        log.write("ERROR: Missing BCL\nINFO: Done")
+    assert _scan(demux_log, state_file) == (
+        1,
+        1,
+        ["WARNING: Low quality tile\n", "ERROR: Missing BCL\n"],
+    )
+    # The offset is persisted after the last complete line only
+    with open(demux_log, "a") as log:
+        log.write(" with WARNING\n")
+    assert _scan(demux_log, state_file)[1] == 2
+    # The scan state is kept out of the run folder
+    assert sorted(os.listdir(os.path.dirname(demux_log))) == [
+        "Demultiplexing_0",
+        "demux_0_bcl-convert.err",
+    ]
+
+
+def test_scan_of_unchanged_log_writes_nothing(demux_log, state_file):
+    with open(demux_log, "w") as log:
+        log.write("WARNING: Low quality tile\n")
+    assert _scan(demux_log, state_file)[1] == 1
+    fingerprint = file_fingerprint([os.path.dirname(demux_log), state_file])
+    assert _scan(demux_log, state_file)[1] == 1
+    assert file_fingerprint([os.path.dirname(demux_log), state_file]) == fingerprint
+
+
+def test_scan_restarts_on_truncated_log(demux_log, state_file):
+    with open(demux_log, "w") as log:
+        log.write("ERROR: first\n" * 10)
+    assert _scan(demux_log, state_file)[0] == 10
+
+    with open(demux_log, "w") as log:
+        log.write("WARNING: second\n")
+    assert _scan(demux_log, state_file) == (0, 1, ["WARNING: second\n"])
+
+
+def test_scan_restarts_on_replaced_log(demux_log, state_file):
+    with open(demux_log, "w") as log:
+        log.write("ERROR: first\n" * 2)
+    assert _scan(demux_log, state_file)[0] == 2
+
+    # Grown past the previous offset
+    with open(demux_log, "w") as log:
+        log.write("WARNING: second\n" * 5)
+    assert _scan(demux_log, state_file)[:2] == (0, 5)
+
+
+def test_scan_restarts_on_recreated_log(demux_log, state_file):
+    head = "INFO: Starting\n" * (demux_logs.HEAD_SIZE // 10)
+    with open(demux_log, "w") as log:
+        log.write(head + "ERROR: first\n")
+    assert _scan(demux_log, state_file)[:2] == (1, 0)
+
+    # A new file with the same first bytes, the old one is kept open so that
+    # its inode is not reused
+    with open(demux_log) as old_log:
+        os.remove(demux_log)
+        with open(demux_log, "w") as log:
+            log.write(head + "WARNING: second\n" * 2)
+        assert _scan(demux_log, state_file)[:2] == (0, 2)
+        assert old_log.read()
+
+
+def test_scan_keeps_a_limited_number_of_messages(demux_log, state_file):
+    with open(demux_log, "w") as log:
+        log.write("WARNING: Low quality tile\n" * (demux_logs.MAX_MESSAGES + 10))
+    warnings, messages = _scan(demux_log, state_file)[1:]
+    assert warnings == demux_logs.MAX_MESSAGES + 10
+    assert len(messages) == demux_logs.MAX_MESSAGES
+
+
+def test_scan_without_state_file(demux_log):
+    with open(demux_log, "w") as log:
+        log.write("ERROR: first\n")
+    scanner = DemuxLogScanner(demux_log, "bclconvert")
+    assert scanner.scan() == (1, 0, ["ERROR: first\n"])
+    assert scanner.scan() == (1, 0, ["ERROR: first\n"])
+
+
+def test_last_line(demux_log, state_file):
+    with open(demux_log, "w") as log:
+        log.write("WARN: x\n" * 5000)
+        log.write("Processing completed with 0 errors and 5000 warnings.\n")
+    scanner = DemuxLogScanner(demux_log, "bcl2fastq", state_file=state_file)
+    assert (
+        scanner.last_line() == "Processing completed with 0 errors and 5000 warnings.\n"
+    )
+    assert scanner.scan()[1] == 5000
@@ -0,0 +1,131 @@
+import random
+
+import pytest
+
+from taca.illumina.demux_plan import format_demux_plan, plan_demultiplexing
+
+
+def _legacy_plan(sample_table, software):
+    """The planning previously done inline in Standard_Run.demultiplex_run."""
+    plans = []
+    sample_type_list = []
+    for lane_contents in sample_table.values():
+        for sample in lane_contents:
+            if sample[1]["sample_type"] not in sample_type_list:
+                sample_type_list.append(sample[1]["sample_type"])
+    for sample_type in sorted(sample_type_list):
+        lane_table = dict()
+        for lane, lane_contents in sample_table.items():
+            for _, detail in lane_contents:
+                mask = (
+                    detail["index_length"],
+                    detail["umi_length"],
+                    detail["read_length"],
+                )
+                if detail["sample_type"] == sample_type:
+                    if lane_table.get(lane):
+                        if mask not in lane_table[lane]:
+                            lane_table[lane].append(mask)
+                    else:
+                        lane_table[lane] = [mask]
+        if software == "bcl2fastq":
+            masks = [lane_table[lane] for lane in lane_table]
+            demux_number = len(max(masks, key=len))
+        else:
+            unique_masks = []
+            for masks in lane_table.values():
+                for mask in masks:
+                    if mask not in unique_masks:
+                        unique_masks.append(mask)
+            demux_number = len(unique_masks)
+        for i in range(demux_number):
+            mask_table = dict()
+            samples_to_include = dict()
+            for lane, lane_contents in sample_table.items():
+                if software == "bcl2fastq":
+                    try:
+                        mask = lane_table[lane][i]
+                    except (KeyError, IndexError):
+                        continue
+                else:
+                    mask = unique_masks[i]
+                    if mask not in lane_table.get(lane, []):
+                        continue
+                mask_table[lane] = mask
+                for name, detail in lane_contents:
+                    sample_mask = (
+                        detail["index_length"],
+                        detail["umi_length"],
+                        detail["read_length"],
+                    )
+                    if detail["sample_type"] == sample_type and sample_mask == mask:
+                        samples_to_include.setdefault(lane, []).append(name)
+            plans.append((sample_type, mask_table, samples_to_include))
+    return plans
+
+
+def _random_sample_table(seed):
+    rng = random.Random(seed)
+    sample_table = {}
+    for lane in rng.sample(["1", "2", "3", "4", "5", "6", "7", "8"], rng.randint(1, 8)):
+        sample_table[lane] = []
+        for sample in range(rng.randint(1, 30)):
+            sample_table[lane].append(
+                (
+                    f"P1_{lane}{sample:03}",
+                    {
+                        "sample_type": rng.choice(["ordinary", "10X_DUAL", "IDT_UMI"]),
+                        "index_length": rng.choice([[8, 8], [10, 10], [8, 0]]),
+                        "umi_length": rng.choice([[0, 0], [9, 0]]),
+                        "read_length": rng.choice([[151, 151], [51, 51]]),
+                    },
+                )
+            )
+    return sample_table
+
+
+@pytest.mark.parametrize("software", ["bcl2fastq", "bclconvert"])
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_matches_legacy_planning(software, seed):
+    sample_table = _random_sample_table(seed)
+    plans = plan_demultiplexing(sample_table, software)
+    assert [plan["demux_id"] for plan in plans] == list(range(len(plans)))
+    assert [
+        (plan["sample_type"], plan["mask_table"], plan["samples_to_include"])
+        for plan in plans
+    ] == _legacy_plan(sample_table, software)
+    for plan in plans:
+        if software == "bclconvert":
+            assert all(mask == plan["mask"] for mask in plan["mask_table"].values())
+        else:
+            assert plan["mask"] is None
+
+
+def test_format_demux_plan():
+    sample_table = {
+        "1": [
+            (
+                "P1_101",
+                {
+                    "sample_type": "ordinary",
+                    "index_length": [8, 8],
+                    "umi_length": [0, 0],
+                    "read_length": [151, 151],
+                },
+            ),
+            (
+                "P1_102",
+                {
+                    "sample_type": "ordinary",
+                    "index_length": [8, 8],
+                    "umi_length": [0, 0],
+                    "read_length": [151, 151],
+                },
+            ),
+        ]
+    }
+    assert format_demux_plan(plan_demultiplexing(sample_table, "bclconvert")) == (
+        "Demultiplexing_0: sample type ordinary\n"
+        "  Lane 1: index length [8, 8], UMI length [0, 0], "
+        "read length [151, 151], 2 samples"
+    )
@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+import pytest
+
+from taca.illumina.index_catalog import get_index_catalog
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+TENX_INDEXES = os.path.join(DATA_DIR, "Chromium_10X_indexes.txt")
+SMARTSEQ_INDEXES = os.path.join(DATA_DIR, "Smart-seq3_v1.5.csv")
+
+
+@pytest.mark.parametrize(
+    "index,index2,expected",
+    [
+        ("SI-GA-A1", "", ("10X_SINGLE", [8, 0], [0, 0])),
+        ("SI-TT-A1", "", ("10X_DUAL", [10, 10], [0, 0])),
+        ("ACGTACGTNNNNNNNNN", "ACGTACGT", ("IDT_UMI", [8, 8], [9, 0])),
+        ("SMARTSEQ3-1A", "", ("SMARTSEQ", [10, 10], [0, 0])),
+        ("NoIndex", "", ("NOINDEX", [10, 10], [0, 0])),
+        ("ACGTAC", "", ("short_single_index", [6, 0], [0, 0])),
+        ("ACGTACGTAC", "ACGTACGTAC", ("ordinary", [10, 10], [0, 0])),
+    ],
+)
+def test_classify(index, index2, expected):
+    catalog = get_index_catalog(TENX_INDEXES, SMARTSEQ_INDEXES)
+    assert catalog.classify(index, index2, [10, 10]) == expected
+    # Memoized results are not shared with callers
+    catalog.classify(index, index2, [10, 10])[1].append(0)
+    assert catalog.classify(index, index2, [10, 10]) == expected
+
+
+def test_noindex_without_index_cycles():
+    catalog = get_index_catalog(TENX_INDEXES, SMARTSEQ_INDEXES)
+    assert catalog.classify("NoIndex", "", [0, 0]) == ("ordinary", [0, 0], [0, 0])
+
+
+def test_unknown_index_name():
+    catalog = get_index_catalog(TENX_INDEXES, SMARTSEQ_INDEXES)
+    with pytest.raises(KeyError):
+        catalog.classify("SI-GA-H13", "", [10, 10])
+
+
+def test_catalog_is_reloaded_when_index_file_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        tenX_indexes = os.path.join(tmp, "tenX.txt")
+        with open(tenX_indexes, "w") as fh:
+            fh.write("SI-GA-A1,GGTTTACT,CTAAACGG,TCGGCGTC,AACCGTAA\n")
+        catalog = get_index_catalog(tenX_indexes, SMARTSEQ_INDEXES)
+        assert get_index_catalog(tenX_indexes, SMARTSEQ_INDEXES) is catalog
+
+        with open(tenX_indexes, "a") as fh:
+            fh.write("SI-NA-H12,AAAA,CCCC,GGGG,TTTT\n")
+        reloaded = get_index_catalog(tenX_indexes, SMARTSEQ_INDEXES)
+        assert reloaded is not catalog
+        assert reloaded.classify("SI-NA-H12", "", [8, 0])[1] == [4, 0]
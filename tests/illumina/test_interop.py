@@ -0,0 +1,156 @@
+import os
+import struct
+import tempfile
+
+import pytest
+
+from taca.illumina.interop import (
+    InterOpError,
+    read_error_metrics,
+    read_extraction_metrics,
+    read_q_metrics,
+    read_tile_metrics,
+    summarize_interop,
+)
+
+
+def _write(path, header, records):
+    with open(path, "wb") as fh:
+        fh.write(header)
+        for record in records:
+            fh.write(record)
+
+
+def _write_run_interop(interop_dir):
+    # Tile metrics v2: two tiles in lane 1, one in lane 2
+    tile_records = []
+    for lane, tile, density, clusters, pf_clusters in [
+        (1, 1101, 1000.0, 100.0, 80.0),
+        (1, 1102, 3000.0, 300.0, 240.0),
+        (2, 1101, 2000.0, 200.0, 100.0),
+    ]:
+        for code, value in [(100, density), (102, clusters), (103, pf_clusters)]:
+            tile_records.append(struct.pack("<HHHf", lane, tile, code, value))
+        tile_records.append(struct.pack("<HHHf", lane, tile, 200, 0.1))
+    _write(
+        os.path.join(interop_dir, "TileMetricsOut.bin"), bytes([2, 10]), tile_records
+    )
+
+    # Q metrics v4: unbinned histograms of 50 quality scores
+    q_records = []
+    for lane, cycle, q20, q35 in [(1, 1, 10, 30), (1, 2, 20, 20), (2, 1, 0, 0)]:
+        hist = [0] * 50
+        hist[19] = q20
+        hist[34] = q35
+        q_records.append(struct.pack("<HHH50I", lane, 1101, cycle, *hist))
+    _write(os.path.join(interop_dir, "QMetricsOut.bin"), bytes([4, 206]), q_records)
+
+    # Error metrics v3
+    error_records = [
+        struct.pack("<HHHf5I", lane, 1101, cycle, rate, 0, 0, 0, 0, 0)
+        for lane, cycle, rate in [(1, 1, 0.5), (1, 2, 1.5), (2, 1, 0.2)]
+    ]
+    _write(
+        os.path.join(interop_dir, "ErrorMetricsOut.bin"), bytes([3, 30]), error_records
+    )
+
+    # Extraction metrics v2, with a partially written last record
+    extraction_records = [
+        struct.pack("<HHH4f4HQ", lane, 1101, cycle, *[2.5] * 4, *[100] * 4, 0)
+        for lane, cycle in [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2)]
+    ]
+    extraction_records.append(extraction_records[-1][:20])
+    _write(
+        os.path.join(interop_dir, "ExtractionMetricsOut.bin"),
+        bytes([2, 38]),
+        extraction_records,
+    )
+
+
+def test_summarize_interop():
+    with tempfile.TemporaryDirectory() as interop_dir:
+        _write_run_interop(interop_dir)
+        summary = summarize_interop(interop_dir)
+    assert summary.keys() == {"1", "2"}
+    assert summary["1"] == pytest.approx(
+        {
+            "cycles_extracted": 3,
+            "percent_q30": 62.5,
+            "cluster_density": 2.0,
+            "percent_pf": 80.0,
+            "error_rate": 1.0,
+        }
+    )
+    assert summary["2"] == pytest.approx(
+        {
+            "cycles_extracted": 2,
+            "percent_q30": None,
+            "cluster_density": 2.0,
+            "percent_pf": 50.0,
+            "error_rate": 0.2,
+        }
+    )
+
+
+def test_summarize_interop_without_files():
+    with tempfile.TemporaryDirectory() as interop_dir:
+        assert summarize_interop(interop_dir) == {}
+
+
+def test_read_tile_metrics_v3():
+    with tempfile.TemporaryDirectory() as interop_dir:
+        path = os.path.join(interop_dir, "TileMetricsOut.bin")
+        _write(
+            path,
+            bytes([3, 15]) + struct.pack("<f", 2.0),
+            [
+                struct.pack("<HIBff", 1, 1101, ord("t"), 4000.0, 3000.0),
+                struct.pack("<HIBIf", 1, 1101, ord("r"), 1, 95.0),
+            ],
+        )
+        tiles = read_tile_metrics(path)
+    assert list(tiles["lane"]) == [1]
+    assert list(tiles["cluster_count"]) == [4000.0]
+    assert list(tiles["pf_cluster_count"]) == [3000.0]
+    assert list(tiles["cluster_density"]) == [2000.0]
+
+
+def test_read_binned_q_metrics_v6():
+    with tempfile.TemporaryDirectory() as interop_dir:
+        path = os.path.join(interop_dir, "QMetricsOut.bin")
+        header = bytes([6, 18, 1, 3, 1, 20, 30, 19, 29, 40, 12, 25, 37])
+        _write(path, header, [struct.pack("<HHH3I", 1, 1101, 1, 5, 10, 85)])
+        records, qscores = read_q_metrics(path)
+    assert list(qscores) == [12, 25, 37]
+    assert records["hist"].tolist() == [[5, 10, 85]]
+
+
+def test_unsupported_version():
+    with tempfile.TemporaryDirectory() as interop_dir:
+        path = os.path.join(interop_dir, "QMetricsOut.bin")
+        _write(path, bytes([3, 206]), [])
+        with pytest.raises(InterOpError):
+            read_q_metrics(path)
+
+
+@pytest.mark.parametrize(
+    "reader, header",
+    [
+        (read_tile_metrics, b""),
+        (read_tile_metrics, b"\x02"),
+        # Version 3 with the tile area not written yet
+        (read_tile_metrics, bytes([3, 15, 0])),
+        (read_q_metrics, bytes([6, 206])),
+        # Binned quality scores with the bins not written yet
+        (read_q_metrics, bytes([6, 18, 1, 3, 10])),
+        (read_error_metrics, b""),
+        (read_extraction_metrics, b"\x03"),
+        (read_extraction_metrics, bytes([3, 38])),
+    ],
+)
+def test_truncated_header(reader, header):
+    with tempfile.TemporaryDirectory() as interop_dir:
+        path = os.path.join(interop_dir, "MetricsOut.bin")
+        _write(path, header, [])
+        with pytest.raises(InterOpError, match="Truncated header"):
+            reader(path)
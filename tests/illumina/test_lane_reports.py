@@ -0,0 +1,121 @@
+from taca.illumina.lane_reports import (
+    merge_lane_barcode_data,
+    merge_lane_data,
+    summarize_lanes,
+)
+
+
+def _lane(lane, clusters, yield_mbases, percent_pf="50.00"):
+    return {
+        "Lane": lane,
+        "PF Clusters": f"{clusters:,}",
+        "% PFClusters": percent_pf,
+        "Yield (Mbases)": f"{yield_mbases:,}",
+        "% Perfectbarcode": "98.00",
+        "% One mismatchbarcode": "2.00",
+    }
+
+
+def _barcode(lane, project, sample, clusters, yield_mbases, barcode="unknown"):
+    return {
+        "Lane": lane,
+        "Project": project,
+        "Sample": sample,
+        "Barcode sequence": barcode,
+        "PF Clusters": f"{clusters:,}",
+        "Yield (Mbases)": f"{yield_mbases:,}",
+        "% >= Q30bases": "90.00",
+    }
+
+
+def test_merge_lane_data_keeps_first_report_of_lane():
+    first = [_lane("1", 1000, 100), _lane("2", 2000, 200)]
+    second = [_lane("2", 1, 1), _lane("3", 3000, 300)]
+    merged = merge_lane_data([first, second])
+    assert [entry["Lane"] for entry in merged] == ["1", "2", "3"]
+    assert merged[1] is first[1]
+
+
+def test_summarize_lanes():
+    lane_data = [_lane("1", 1000, 100), _lane("2", 2000, 200, percent_pf="80.00")]
+    summary, flowcell_data = summarize_lanes(lane_data, {"2": {"1": [8, 8]}})
+    assert summary == {
+        "1": {"total_lane_cluster": 1000, "total_lane_yield": 100},
+        "2": {"total_lane_cluster": 2000, "total_lane_yield": 200},
+    }
+    assert flowcell_data == {
+        "Clusters (Raw)": "4,500",
+        "Clusters(PF)": "3,000",
+        "Yield (MBases)": "300",
+    }
+    assert lane_data[0]["% Perfectbarcode"] == "98.00"
+    assert lane_data[1]["% Perfectbarcode"] is None
+
+
+def test_merge_lane_barcode_data_complex_lane():
+    summary, _ = summarize_lanes(
+        [_lane("1", 1000, 100), _lane("2", 500, 50)], {"1": {"1": [8, 8]}}
+    )
+    demux_0 = [
+        _barcode("1", "P1", "P1_101", 300, 30, "AAAAAAAA+CCCCCCCC"),
+        _barcode("1", "default", "Undetermined", 700, 70),
+        _barcode("2", "P2", "P2_101", 450, 45, "GGGGGGGG"),
+        _barcode("2", "default", "Undetermined", 50, 5),
+    ]
+    demux_1 = [
+        _barcode("1", "P3", "P3_101_S1", 400, 40, "TTTTTT"),
+        _barcode("1", "default", "Undetermined", 600, 60),
+    ]
+    merged = merge_lane_barcode_data([demux_0, demux_1], {"1": {"1": [8, 8]}}, summary)
+    assert [(entry["Lane"], entry["Sample"]) for entry in merged] == [
+        ("1", "P1_101"),
+        ("1", "P3_101"),
+        ("1", "Undetermined"),
+        ("2", "P2_101"),
+        ("2", "Undetermined"),
+    ]
+    undetermined = merged[2]
+    assert undetermined["PF Clusters"] == "300"
+    assert undetermined["Yield (Mbases)"] == "30"
+    assert undetermined["% >= Q30bases"] == "0"
+    assert undetermined["Barcode sequence"] == "unknown"
+    # Simple lanes keep their own undetermined numbers
+    assert merged[4]["PF Clusters"] == "50"
+    assert summary["1"] == {
+        "total_lane_cluster": 1000,
+        "total_lane_yield": 100,
+        "total_sample_cluster": 700,
+        "total_sample_yield": 70,
+        "undet_cluster": 300,
+        "undet_yield": 30,
+    }
+
+
+def test_merge_lane_barcode_data_repeated_undetermined_rows():
+    # Only the first undetermined row of a complex lane is kept, also when
+    # several follow each other
+    summary, _ = summarize_lanes([_lane("1", 1000, 100)], {"1": {}})
+    reports = [
+        [_barcode("1", "default", "Undetermined", 100, 10)],
+        [_barcode("1", "default", "Undetermined", 100, 10)],
+        [_barcode("1", "default", "Undetermined", 100, 10)],
+        [_barcode("1", "P1", "P1_101", 900, 90, "ACGTACGT")],
+    ]
+    merged = merge_lane_barcode_data(reports, {"1": {}}, summary)
+    assert [entry["Sample"] for entry in merged] == ["P1_101", "Undetermined"]
+    assert merged[1]["PF Clusters"] == "100"
+
+
+def test_merge_lane_barcode_data_noindex_lane():
+    summary, _ = summarize_lanes([_lane("1", 1000, 100)], {})
+    reports = [
+        [
+            _barcode("1", "P1", "P1_101", 0, 0, "TTTTTTTT"),
+            _barcode("1", "default", "Undetermined", 1000, 100),
+        ]
+    ]
+    merged = merge_lane_barcode_data(reports, {}, summary, noindex_lanes=["1"])
+    assert len(merged) == 1
+    assert merged[0]["Project"] == "P1"
+    assert merged[0]["Sample"] == "P1_101"
+    assert merged[0]["PF Clusters"] == "1,000"
@@ -0,0 +1,137 @@
+import os
+import pickle
+import tempfile
+from types import SimpleNamespace
+
+from taca.illumina.samplesheet import SampleSheet
+
+SAMPLESHEET = """[Header]
+Date,2024-01-01
+FCID,HXXXXXXXX
+[Settings]
+OverrideCycles,Y151;I8;I8;Y151
+[Data]
+Lane,Sample_ID,Sample_Name,Sample_Project,index,index2
+1,Sample_P1_101,P1_101,P1,AAAAAAAA,CCCCCCCC
+1,Sample_P1_102,P1_102,P1,GGGGGGGG,TTTTTTTT
+2,Sample_P2_101,P2_101,P2,NOINDEX,
+1,Sample_P1_103,P1_103,P1,ACGTACGT,
+
+"""
+
+
+def _read_samplesheet(content=SAMPLESHEET):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "SampleSheet_0.csv")
+        with open(path, "w") as fh:
+            fh.write(content)
+        return SampleSheet.read(path)
+
+
+def test_read():
+    ss = _read_samplesheet()
+    assert ss.header == {"Date": "2024-01-01", "FCID": "HXXXXXXXX"}
+    assert ss.settings == {"OverrideCycles": "Y151;I8;I8;Y151"}
+    assert ss.datafields == [
+        "Lane",
+        "Sample_ID",
+        "Sample_Name",
+        "Sample_Project",
+        "index",
+        "index2",
+    ]
+    assert len(ss.data) == 4
+    assert ss.data[2] == {
+        "Lane": "2",
+        "Sample_ID": "Sample_P2_101",
+        "Sample_Name": "P2_101",
+        "Sample_Project": "P2",
+        "index": "NOINDEX",
+        "index2": "",
+    }
+    assert ss.lanes == ["1", "2"]
+    assert [row["Sample_Name"] for row in ss.rows_in_lane("1")] == [
+        "P1_101",
+        "P1_102",
+        "P1_103",
+    ]
+    assert ss.rows_in_lane("3") == []
+    assert (ss.dfield_sid, ss.dfield_snm, ss.dfield_proj) == (
+        "Sample_ID",
+        "Sample_Name",
+        "Sample_Project",
+    )
+
+
+def test_read_detects_dfield_names():
+    ss = _read_samplesheet(
+        SAMPLESHEET.replace(
+            "Lane,Sample_ID,Sample_Name,Sample_Project",
+            "Lane,SampleID,SampleName,SampleProject",
+        )
+    )
+    assert (ss.dfield_sid, ss.dfield_snm, ss.dfield_proj) == (
+        "SampleID",
+        "SampleName",
+        "SampleProject",
+    )
+    assert [row[ss.dfield_snm] for row in ss.rows_in_lane("2")] == ["P2_101"]
+
+
+def test_subset_shares_rows():
+    ss = _read_samplesheet()
+    subset = ss.subset({"1": ["P1_103", "P1_101"], "2": ["P1_102"]})
+    assert [row["Sample_Name"] for row in subset.data] == ["P1_101", "P1_103"]
+    assert subset.lanes == ["1"]
+    assert subset.header is ss.header
+    subset.data[0]["index"] = "TTTTTTTT"
+    assert ss.rows_in_lane("1")[0]["index"] == "TTTTTTTT"
+
+
+def test_rows():
+    ss = _read_samplesheet()
+    row = ss.data[0]
+    assert row.get("Recipe") is None
+    assert "Recipe" not in row
+    copy = row.copy()
+    copy["Recipe"] = "151-151"
+    copy["index"] = "CCCCCCCC"
+    assert copy["Recipe"] == "151-151"
+    assert "Recipe" not in row and "Recipe" not in ss.data[1]
+    assert row["index"] == "AAAAAAAA"
+    assert dict(copy)["Recipe"] == "151-151"
+    assert ss.to_dicts()[0] == dict(row)
+
+
+def test_data_assignment_rebuilds_index():
+    ss = _read_samplesheet()
+    assert ss.lanes == ["1", "2"]
+    ss.data = sorted(ss.data, key=lambda row: row["Lane"], reverse=True)
+    assert ss.lanes == ["2", "1"]
+
+
+def test_from_parser_copies_rows():
+    rows = [
+        {"Lane": "1", "Sample_ID": "Sample_P1_101", "Sample_Name": "P1_101"},
+        {"Lane": "2", "Sample_ID": "Sample_P1_102", "Sample_Name": "P1_102"},
+    ]
+    parser = SimpleNamespace(
+        header={"FCID": "HXXXXXXXX\n"},
+        datafields=["Lane", "Sample_ID", "Sample_Name"],
+        data=rows,
+        dfield_sid="Sample_ID",
+        dfield_snm="Sample_Name",
+    )
+    ss = SampleSheet.from_parser(parser)
+    ss.data[0]["Sample_Name"] = "renamed"
+    assert rows[0]["Sample_Name"] == "P1_101"
+    assert ss.to_dicts()[1] == rows[1]
+    assert ss.dfield_proj == "Sample_Project"
+
+
+def test_pickle():
+    ss = _read_samplesheet()
+    subset = ss.subset({"1": ["P1_101", "P1_102"]})
+    restored = pickle.loads(pickle.dumps(subset))
+    assert restored.to_dicts() == subset.to_dicts()
+    assert restored.lanes == ["1"]
@@ -0,0 +1,163 @@
+import os
+import shutil
+import subprocess
+from unittest import mock
+
+import pytest
+
+from taca.illumina.transfer_chunks import list_transfer_files, partition_run_files
+
+RUN = "241027_LH00217_0123_B22FJGYLT3"
+FILTER_OPTIONS = [
+    "--exclude=Demultiplexing_*/*_*",
+    "--include=*/",
+    "--include=*.xml",
+    "--include=*.json",
+    "--include=*.fastq.gz",
+    "--exclude=*",
+]
+
+
+def _create_files(root, files):
+    for path in files:
+        os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+        open(os.path.join(root, path), "w").close()
+
+
+@pytest.mark.skipif(shutil.which("rsync") is None, reason="rsync is not installed")
+def test_list_transfer_files(tmp_path):
+    transferred = [
+        f"{RUN}/RunInfo.xml",
+        f"{RUN}/Demultiplexing/P1/Sample_P1_101/P1_101_S1_L001_R1_001.fastq.gz",
+        f"{RUN}/Demultiplexing/Undetermined_S0_L001_R1_001.fastq.gz",
+        f"{RUN}/Demultiplexing/Stats/Stats.json",
+        f"{RUN}/Demultiplexing_0/Stats/Stats.json",
+    ]
+    not_transferred = [
+        f"{RUN}/RTAComplete.txt",
+        f"{RUN}/Demultiplexing_0/Undetermined_S0_L001_R1_001.fastq.gz",
+        f"{RUN}/Demultiplexing_0/P1/Sample_P1_101/P1_101_S1_L001_R1_001.fastq.gz",
+    ]
+    source = tmp_path / "source"
+    _create_files(source, transferred + not_transferred)
+
+    files = list_transfer_files(str(source / RUN), FILTER_OPTIONS)
+    assert sorted(files) == sorted(transferred)
+
+    # The same files as a single rsync of the whole run folder with these filters
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    subprocess.run(
+        [
+            "rsync",
+            "-Lr",
+            *FILTER_OPTIONS,
+            "--prune-empty-dirs",
+            str(source / RUN),
+            dest,
+        ],
+        check=True,
+    )
+    synced = [
+        os.path.relpath(os.path.join(dirpath, name), dest)
+        for dirpath, _, names in os.walk(dest)
+        for name in names
+    ]
+    assert sorted(files) == sorted(synced)
+
+
+def test_partition_run_files():
+    run = RUN
+    files = [
+        f"{run}/RunInfo.xml",
+        f"{run}/InterOp/QMetricsOut.bin",
+        f"{run}/Demultiplexing/P1/Sample_P1_101/P1_101_S1_L001_R1_001.fastq.gz",
+        f"{run}/Demultiplexing/P1/Sample_P1_101/P1_101_S1_L002_R1_001.fastq.gz",
+        f"{run}/Demultiplexing/P2/Sample_P2_101/P2_101_S2_L001_R1_001.fastq.gz",
+        f"{run}/Demultiplexing/Undetermined_S0_L001_R1_001.fastq.gz",
+        f"{run}/Demultiplexing/Undetermined_S0_L002_R1_001.fastq.gz",
+        f"{run}/Demultiplexing/Stats/Stats.json",
+        f"{run}/Demultiplexing/Reports/html/index.html",
+        f"{run}/Demultiplexing/README.txt",
+    ]
+    chunks = partition_run_files(files)
+    assert chunks == {
+        "metadata": [
+            f"{run}/RunInfo.xml",
+            f"{run}/InterOp/QMetricsOut.bin",
+            f"{run}/Demultiplexing/Stats/Stats.json",
+            f"{run}/Demultiplexing/Reports/html/index.html",
+            f"{run}/Demultiplexing/README.txt",
+        ],
+        "project_P1": files[2:4],
+        "project_P2": files[4:5],
+        "lane_1": files[5:6],
+        "lane_2": files[6:7],
+    }
+    assert sorted(path for chunk in chunks.values() for path in chunk) == sorted(files)
+
+
+@pytest.fixture
+def chunked_run(tmp_path):
+    """A run transferred in chunks, without parsing any run folder."""
+    Runs = pytest.importorskip("taca.illumina.Runs")
+    run = Runs.Run.__new__(Runs.Run)
+    run.run_dir = str(tmp_path / RUN)
+    run.id = RUN
+    run._state = None
+    run.CONFIG = {
+        "analysis_server": {
+            "user": "user",
+            "host": "host",
+            "sync": {"data_archive": "/data", "include": ["*.xml"], "streams": 2},
+        }
+    }
+    os.makedirs(run.run_dir)
+    files = [
+        f"{RUN}/RunInfo.xml",
+        f"{RUN}/Demultiplexing/P1/Sample_P1_101/P1_101_S1_L001_R1_001.fastq.gz",
+        f"{RUN}/Demultiplexing/P2/Sample_P2_101/P2_101_S2_L001_R1_001.fastq.gz",
+    ]
+    with mock.patch(
+        "taca.illumina.transfer_chunks.list_transfer_files", return_value=files
+    ):
+        yield run
+
+
+def _transferred_chunks(call_external_command):
+    return sorted(
+        call.kwargs["prefix"] for call in call_external_command.call_args_list
+    )
+
+
+def test_transfer_run_chunks_failure(chunked_run, tmp_path):
+    t_file = str(tmp_path / "transfer.tsv")
+
+    def call_external_command(cmd, with_log_files, prefix, log_dir):
+        # Every chunk is attempted while the run is marked as transferring
+        assert os.path.exists(os.path.join(chunked_run.run_dir, "transferring"))
+        if prefix == "transfer_project_P1":
+            raise subprocess.CalledProcessError(23, cmd)
+
+    with mock.patch(
+        "taca.utils.misc.call_external_command", side_effect=call_external_command
+    ) as mock_call:
+        with pytest.raises(subprocess.CalledProcessError):
+            chunked_run.transfer_run(t_file)
+    assert _transferred_chunks(mock_call) == [
+        "transfer_metadata",
+        "transfer_project_P1",
+        "transfer_project_P2",
+    ]
+    assert not os.path.exists(t_file)
+    assert not os.path.exists(os.path.join(chunked_run.run_dir, "transferring"))
+
+
+def test_transfer_run_chunks_success(chunked_run, tmp_path):
+    t_file = str(tmp_path / "transfer.tsv")
+    with mock.patch("taca.utils.misc.call_external_command") as mock_call:
+        chunked_run.transfer_run(t_file)
+    assert len(mock_call.call_args_list) == 3
+    with open(t_file) as fh:
+        assert [line.split("\t")[0] for line in fh] == [RUN]
+    assert not os.path.exists(os.path.join(chunked_run.run_dir, "transferring"))
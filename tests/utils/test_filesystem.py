@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import pytest
+
+from taca.utils.filesystem import sync_files
+
+
+def test_sync_files_only_copies_changed_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        run_dir = os.path.join(tmp, "run")
+        interop = os.path.join(run_dir, "InterOp", "C1.1")
+        os.makedirs(interop)
+        for path, content in [
+            (os.path.join(run_dir, "RunInfo.xml"), "<RunInfo/>"),
+            (os.path.join(run_dir, "InterOp", "TileMetricsOut.bin"), "tiles"),
+            (os.path.join(interop, "BasecallingMetricsOut.bin"), "cycle 1"),
+        ]:
+            with open(path, "w") as fh:
+                fh.write(content)
+        sources = {
+            "RunInfo.xml": os.path.join(run_dir, "RunInfo.xml"),
+            "InterOp": os.path.join(run_dir, "InterOp"),
+        }
+        dest = os.path.join(tmp, "shared", "run")
+
+        assert sorted(sync_files(sources, dest)) == [
+            "InterOp/C1.1/BasecallingMetricsOut.bin",
+            "InterOp/TileMetricsOut.bin",
+            "RunInfo.xml",
+        ]
+        with open(
+            os.path.join(dest, "InterOp", "C1.1", "BasecallingMetricsOut.bin")
+        ) as fh:
+            assert fh.read() == "cycle 1"
+        assert sync_files(sources, dest) == []
+
+        with open(os.path.join(run_dir, "InterOp", "TileMetricsOut.bin"), "a") as fh:
+            fh.write(" and more tiles")
+        os.remove(os.path.join(dest, "RunInfo.xml"))
+        assert sorted(sync_files(sources, dest)) == [
+            "InterOp/TileMetricsOut.bin",
+            "RunInfo.xml",
+        ]
+        with open(os.path.join(dest, "InterOp", "TileMetricsOut.bin")) as fh:
+            assert fh.read() == "tiles and more tiles"
+
+
+def test_sync_files_missing_source():
+    with tempfile.TemporaryDirectory() as tmp:
+        with pytest.raises(OSError):
+            sync_files({"laneBarcode.html": os.path.join(tmp, "missing")}, tmp)
@@ -0,0 +1,117 @@
+import logging
+import os
+import tempfile
+import time
+from unittest import mock
+
+import pytest
+
+import taca
+from taca.utils import job_scheduler
+from taca.utils.job_scheduler import JobScheduler, get_job_scheduler
+
+
+@pytest.fixture(autouse=True)
+def importable_taca(monkeypatch):
+    """Make the job wrapper find this checkout of taca."""
+    monkeypatch.setenv("PYTHONPATH", os.path.dirname(os.path.dirname(taca.__file__)))
+
+
+def _wait_for(scheduler, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        scheduler.dispatch()
+        if scheduler.get_job(job_id)["status"] in ("done", "failed"):
+            return scheduler.get_job(job_id)
+        time.sleep(0.1)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_jobs_run_in_priority_order_within_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        scheduler = JobScheduler(os.path.join(tmp, "jobs.json"), cores=4)
+        scheduler.submit("blocker", ["sleep", "0.5"], tmp, "demux_0", cores=4)
+        scheduler.submit("small", ["true"], tmp, "demux_1", cores=2, priority=1)
+        scheduler.submit("large", ["true"], tmp, "demux_2", cores=4, priority=2)
+        assert scheduler.get_job("blocker")["status"] == "running"
+        assert scheduler.get_job("small")["status"] == "queued"
+        assert scheduler.get_job("large")["status"] == "queued"
+
+        _wait_for(scheduler, "blocker")
+        large = _wait_for(scheduler, "large")
+        small = _wait_for(scheduler, "small")
+        assert large["started"] <= small["started"]
+        assert small["started"] >= large["finished"]
+
+        blocker = scheduler.get_job("blocker")
+        assert blocker["returncode"] == 0
+        assert blocker["wall_time"] >= 0.5
+        assert blocker["max_rss_kb"] > 0
+        assert os.path.exists(os.path.join(tmp, "demux_0_sleep.out"))
+        assert os.path.exists(os.path.join(tmp, "demux_0_sleep.err"))
+
+
+def test_oversized_job_runs_alone_and_failures_are_recorded():
+    with tempfile.TemporaryDirectory() as tmp:
+        scheduler = JobScheduler(os.path.join(tmp, "jobs.json"), cores=2)
+        scheduler.submit("oversized", ["false"], tmp, "demux_0", cores=8)
+        assert scheduler.get_job("oversized")["status"] == "running"
+        job = _wait_for(scheduler, "oversized")
+        assert job["status"] == "failed"
+        assert job["returncode"] == 1
+
+        scheduler.submit("missing", ["no_such_binary_"], tmp, "demux_1")
+        job = _wait_for(scheduler, "missing")
+        assert job["status"] == "failed"
+        assert job["returncode"] == 127
+
+
+def test_resubmitted_job_is_not_reaped_from_earlier_stats():
+    with tempfile.TemporaryDirectory() as tmp:
+        scheduler = JobScheduler(os.path.join(tmp, "jobs.json"), cores=4)
+        scheduler.submit("j", ["sleep", "0"], tmp, "demux_0", cores=4)
+        assert _wait_for(scheduler, "j")["status"] == "done"
+
+        # Resubmitted after a reset, with the stats file of the first attempt left
+        scheduler.submit("j", ["sleep", "1"], tmp, "demux_0", cores=4)
+        scheduler.submit("other", ["true"], tmp, "demux_1", cores=4)
+        scheduler.dispatch()
+        assert scheduler.get_job("j")["status"] == "running"
+        assert scheduler.get_job("other")["status"] == "queued"
+
+        assert _wait_for(scheduler, "j")["wall_time"] >= 1
+        assert _wait_for(scheduler, "other")["status"] == "done"
+
+
+def test_job_with_reused_pid_is_reaped():
+    with tempfile.TemporaryDirectory() as tmp:
+        scheduler = JobScheduler(os.path.join(tmp, "jobs.json"), cores=4)
+        scheduler.submit("j", ["sleep", "10"], tmp, "demux_0", cores=4)
+        scheduler.submit("other", ["true"], tmp, "demux_1", cores=4)
+        with scheduler._state() as state:
+            job = state["jobs"]["j"]
+            os.kill(job["pid"], 9)
+            # The pid now belongs to another process, as after a reboot
+            job["pid"] = os.getpid()
+        scheduler.dispatch()
+        job = scheduler.get_job("j")
+        assert job["status"] == "failed"
+        assert job["returncode"] is None
+        assert _wait_for(scheduler, "other")["status"] == "done"
+
+
+def test_get_job_scheduler_requires_state_file(caplog):
+    with (
+        mock.patch.dict(job_scheduler.CONFIG, {"job_scheduler": {"cores": 8}}),
+        mock.patch.object(job_scheduler, "_missing_state_file_logged", False),
+        caplog.at_level(logging.WARNING),
+    ):
+        assert get_job_scheduler() is None
+        assert get_job_scheduler() is None
+        assert len(caplog.records) == 1
+        assert "without state_file" in caplog.records[0].getMessage()
+
+        job_scheduler.CONFIG["job_scheduler"]["state_file"] = "jobs.json"
+        scheduler = get_job_scheduler()
+        assert scheduler.state_file == "jobs.json"
+        assert scheduler.cores == 8
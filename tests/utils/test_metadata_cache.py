@@ -0,0 +1,69 @@
+import logging
+import os
+import tempfile
+from unittest import mock
+
+from taca.utils import metadata_cache
+from taca.utils.metadata_cache import RunMetadataCache, file_fingerprint
+
+
+def test_file_fingerprint_includes_missing_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "RunInfo.xml")
+        missing = file_fingerprint([path])
+        assert missing == ((path, None, None),)
+
+        with open(path, "w") as f:
+            f.write("<RunInfo/>")
+        assert file_fingerprint([path]) != missing
+
+
+def test_get_reuses_value_until_source_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "SampleSheet.csv")
+        with open(source, "w") as f:
+            f.write("[Data]\n")
+        cache = RunMetadataCache(os.path.join(tmp, "cache"))
+        calls = []
+
+        def parse():
+            calls.append(1)
+            return {"data": open(source).read()}
+
+        assert cache.get("run", "samplesheet", [source], parse) == {"data": "[Data]\n"}
+        assert cache.get("run", "samplesheet", [source], parse) == {"data": "[Data]\n"}
+        assert len(calls) == 1
+
+        with open(source, "a") as f:
+            f.write("Lane,Sample_ID\n")
+        assert cache.get("run", "samplesheet", [source], parse) == {
+            "data": "[Data]\nLane,Sample_ID\n"
+        }
+        assert len(calls) == 2
+
+
+def test_disabled_cache_always_parses():
+    cache = RunMetadataCache()
+    calls = []
+    assert cache.get("run", "value", [], lambda: calls.append(1) or 42) == 42
+    assert cache.get("run", "value", [], lambda: calls.append(1) or 42) == 42
+    assert len(calls) == 2
+    assert cache.read("run", "value") is None
+
+
+def test_get_run_metadata_cache_logs_when_disabled(caplog):
+    with (
+        mock.patch.dict(metadata_cache.CONFIG, {"analysis": {}}),
+        mock.patch.object(metadata_cache, "_disabled_logged", False),
+        caplog.at_level(logging.INFO, logger="taca.utils.metadata_cache"),
+    ):
+        assert metadata_cache.get_run_metadata_cache().cache_dir is None
+        assert metadata_cache.get_run_metadata_cache().cache_dir is None
+        with mock.patch.dict(
+            metadata_cache.CONFIG, {"analysis": {"metadata_cache_dir": "/cache"}}
+        ):
+            assert metadata_cache.get_run_metadata_cache().cache_dir == "/cache"
+    assert [record.getMessage() for record in caplog.records] == [
+        "The run metadata cache is disabled, set analysis/metadata_cache_dir "
+        "to enable it"
+    ]
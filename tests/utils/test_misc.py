@@ -0,0 +1,28 @@
+import hashlib
+import io
+import subprocess
+
+import pytest
+
+from taca.utils.misc import hash_command_output
+
+
+def test_hash_command_output():
+    output = io.BytesIO()
+    md5sum = hash_command_output(["printf", "some archive"], output, blocksize=4)
+    assert output.getvalue() == b"some archive"
+    assert md5sum == hashlib.md5(b"some archive").hexdigest()
+
+
+def test_hash_command_output_fails_with_command():
+    with pytest.raises(subprocess.CalledProcessError):
+        hash_command_output(["false"], io.BytesIO())
+
+
+def test_hash_command_output_fails_with_destination():
+    class BrokenDestination:
+        def write(self, buf):
+            raise BrokenPipeError("remote side closed")
+
+    with pytest.raises(OSError):
+        hash_command_output(["printf", "some archive"], BrokenDestination())
@@ -0,0 +1,51 @@
+from unittest import mock
+
+import pytest
+
+from taca.utils import statusdb
+
+
+@pytest.fixture
+def element_db():
+    with (
+        mock.patch.object(statusdb, "cloudant_v1"),
+        mock.patch.object(statusdb, "CouchDbSessionAuthenticator"),
+    ):
+        yield statusdb.ElementRunsConnection({"url": "mock"})
+
+
+def test_prefetch_run_statuses(element_db):
+    post_view = element_db.connection.post_view
+    post_view.return_value.get_result.return_value = {
+        "rows": [
+            {"key": "run_A", "value": "demultiplexing"},
+            {"key": "run_B", "value": "transferred"},
+        ]
+    }
+
+    element_db.prefetch_run_statuses(run for run in ["run_A", "run_B", "run_C"])
+
+    post_view.assert_called_once_with(
+        db="element_runs", ddoc="info", view="status", keys=["run_A", "run_B", "run_C"]
+    )
+    assert element_db.check_db_run_status("run_A") == "demultiplexing"
+    assert element_db.check_db_run_status("run_B") == "transferred"
+    assert element_db.check_db_run_status("run_C") == "Unknown"
+    assert post_view.call_count == 1
+
+
+def test_check_db_run_status_caches_lookups_and_uploads(element_db):
+    post_view = element_db.connection.post_view
+    post_view.return_value.get_result.return_value = {
+        "rows": [{"key": "run_A", "value": "sequencing"}]
+    }
+
+    assert element_db.check_db_run_status("run_A") == "sequencing"
+    assert element_db.check_db_run_status("run_A") == "sequencing"
+    assert post_view.call_count == 1
+
+    with mock.patch.object(element_db, "update_doc") as update_doc:
+        element_db.upload_to_statusdb({"name": "run_A", "run_status": "demultiplexing"})
+    update_doc.assert_called_once()
+    assert element_db.check_db_run_status("run_A") == "demultiplexing"
+    assert post_view.call_count == 1
@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+from taca.utils.transfer_ledger import TransferLedger, get_ledger
+
+
+def test_ledger_reads_existing_transfer_log():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "transfer.tsv")
+        with open(log, "w") as f:
+            f.write("20190119_AV11123_B11111\t2019-01-19 09:15:17.512114\r\n")
+            f.write("241027_LH00217_0123_B22FJGYLT3\t2024-10-27 10:55:02.784912\r\n")
+
+        ledger = TransferLedger(log)
+        assert "20190119_AV11123_B11111" in ledger
+        assert ledger.get("241027_LH00217_0123_B22FJGYLT3") == [
+            "2024-10-27 10:55:02.784912"
+        ]
+        assert "20190119_AV11123_B1111" not in ledger
+
+
+def test_ledger_sees_appended_and_rewritten_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, "transfer.tsv")
+        ledger = TransferLedger(log)
+        assert "run_1" not in ledger
+
+        ledger.add("run_1", "2024-01-01 00:00:00")
+        with open(log, "a") as f:
+            f.write("run_2\t2024-01-02 00:00:00\n")
+            f.write("run_3\t2024-01")  # Partially written line
+        assert "run_1" in ledger
+        assert "run_2" in ledger
+        assert "run_3" not in ledger
+
+        with open(log, "w") as f:
+            f.write("run_4\t2024-01-04 00:00:00\nrun_3\t2024-01-03 00:00:00\n")
+        assert "run_1" not in ledger
+        assert "run_3" in ledger
+        assert "run_4" in ledger
+
+
+def test_import_log_and_shared_instances():
+    with tempfile.TemporaryDirectory() as tmp:
+        old_log = os.path.join(tmp, "transfer_old.tsv")
+        with open(old_log, "w") as f:
+            f.write("run_1\t2024-01-01 00:00:00\nrun_2\t2024-01-02 00:00:00\n")
+        ledger = get_ledger(os.path.join(tmp, "transfer.tsv"))
+        ledger.add("run_2", "2024-01-02 00:00:00")
+
+        assert ledger.import_log(old_log) == 1
+        assert get_ledger(os.path.join(tmp, "transfer.tsv")) is ledger
+        assert [run_id for run_id, _ in TransferLedger(ledger.path).items()] == [
+            "run_2",
+            "run_1",
+        ]